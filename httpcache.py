@@ -0,0 +1,107 @@
+"""
+HTTP conditional caching for views that only depend on the database snapshot.
+
+lux.sqlite is opened read-only and only changes when a new snapshot is
+deployed, so a page is fully determined by the snapshot and the request. The
+`conditional` decorator gives such a view a strong ETag derived from the
+snapshot's identity and the request parameters, and a Last-Modified of the
+snapshot's modification time. A request whose If-None-Match (or, without
+one, If-Modified-Since) still matches is answered with 304 Not Modified
+before the view runs, so neither SQLite nor Jinja is touched.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import request, make_response
+
+import luxdb
+
+
+def snapshot(path=luxdb.DATABASE_PATH):
+    """Returns the identity and modification time of the database snapshot."""
+    stat = os.stat(path)
+    identity = f"{stat.st_size}:{stat.st_mtime_ns}"
+    modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+    return identity, modified
+
+
+def request_etag(identity, ignore=(), vary=None):
+    """Derives the ETag of the current request from the snapshot identity.
+
+    Args:
+        identity (str): Identifies the database snapshot.
+        ignore (iterable of str): Query parameters that do not affect the response.
+        vary (callable, optional): Returns further request state the response depends on.
+
+    Returns:
+        str: The ETag, without quotes.
+    """
+    args = sorted((key, value) for key, values in request.args.lists()
+                  if key not in ignore for value in values)
+    parts = [identity, request.path, repr(args)]
+    if vary is not None:
+        parts.append(repr(vary()))
+    return hashlib.sha256('\0'.join(parts).encode()).hexdigest()[:32]
+
+
+def conditional(max_age=0, private=False, ignore=(), vary=None, vary_headers=(),
+                not_modified=None):
+    """Decorates a view to send validators and answer matching requests with 304.
+
+    Args:
+        max_age (int, optional): Seconds a cache may serve the response without revalidating.
+        private (bool, optional): Whether only the browser, not a shared proxy, may store it.
+        ignore (iterable of str, optional): Query parameters that do not affect the response.
+        vary (callable, optional): Returns further request state, e.g. from cookies, that the
+            response depends on. If-Modified-Since is not honoured for such views, since the
+            modification time alone cannot tell the variants apart.
+        vary_headers (iterable of str, optional): Request headers vary reads, e.g. Cookie,
+            sent as Vary so that caches keep the variants apart.
+        not_modified (callable, optional): Called with each 304 response, e.g. to refresh
+            cookies the full response would have set.
+
+    Returns:
+        The decorator.
+    """
+    ignore = frozenset(ignore)
+
+    def cache_headers(response, etag, modified):
+        response.set_etag(etag)
+        response.last_modified = modified
+        if private:
+            response.cache_control.private = True
+        else:
+            response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        if not max_age:
+            response.cache_control.no_cache = True
+        for header in vary_headers:
+            response.vary.add(header)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            identity, modified = snapshot()
+            etag = request_etag(identity, ignore, vary)
+
+            if request.if_none_match:
+                fresh = request.if_none_match.contains(etag)
+            else:
+                since = request.if_modified_since
+                fresh = vary is None and since is not None and modified <= since
+
+            if fresh:
+                response = make_response('', 304)
+                cache_headers(response, etag, modified)
+                if not_modified is not None:
+                    not_modified(response)
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                cache_headers(response, etag, modified)
+            return response
+        return wrapper
+    return decorator
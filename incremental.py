@@ -0,0 +1,145 @@
+"""
+Incremental refinement of as-you-type searches.
+
+When a user extends a term, e.g. from 'ab' to 'abc', every object matching
+the new search also matched the previous one, because LIKE '%abc%' only
+matches strings that LIKE '%ab%' matches. For each client the last
+un-truncated set of matching ids is kept, and a search that refines the
+previous one on every field is narrowed to that set with `objects.id IN`
+instead of scanning objects again. Anything else, or a previous set that
+exceeded the candidate limit, runs as a full query.
+
+Candidates cost a query of their own, so a new search does not collect
+them: a first page that holds every match gives them for free, and
+otherwise they are collected by the first search that refines it. Pages
+already in ps1lux.search_cache are served from it without collecting
+candidates. The candidate sets belong to one version of lux.sqlite and are
+forgotten when the file is replaced.
+"""
+import threading
+from collections import OrderedDict
+
+import luxdb
+import ps1lux
+
+
+def is_refinement(previous, terms):
+    """Checks whether a search can only match a subset of the previous search's results.
+
+    Args:
+        previous (tuple): The normalized terms of the previous search.
+        terms (tuple): The normalized terms of the new search.
+
+    Returns:
+        bool: True if every previous term is a substring of the corresponding new term.
+    """
+    return all(old in new for old, new in zip(previous, terms))
+
+
+class IncrementalSearch:
+    """Per-client candidate sets used to narrow refining searches."""
+
+    def __init__(self, max_clients=1024, candidate_limit=ps1lux.CANDIDATE_LIMIT,
+                 path=luxdb.DATABASE_PATH):
+        self.max_clients = max_clients
+        self.candidate_limit = candidate_limit
+        self._watch = luxdb.FileWatch(path)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.refined = 0
+        self.full = 0
+        self.cached = 0
+
+    def _check_identity(self):
+        """Forgets every session if the database file changed; call with the lock held."""
+        if self._watch.changed():
+            self._sessions.clear()
+
+    def _session(self, client):
+        with self._lock:
+            self._check_identity()
+            session = self._sessions.get(client)
+            if session is not None:
+                self._sessions.move_to_end(client)
+            return session
+
+    def _remember(self, client, terms, ids):
+        """Records the client's search and its candidates, None if they are not known."""
+        with self._lock:
+            self._check_identity()
+            self._sessions[client] = (terms, ids)
+            self._sessions.move_to_end(client)
+            while len(self._sessions) > self.max_clients:
+                self._sessions.popitem(last=False)
+
+    def page(self, client, label, classification, agent, date,
+             after=None, page_size=ps1lux.SEARCH_LIMIT):
+        """Creates a ps1lux.SearchPage, narrowed to the client's previous candidates when possible.
+
+        A search refining the client's previous one collects its candidates before the
+        page is returned, unless the page is cached; other searches collect none. The
+        page itself is fetched as it is iterated.
+
+        Args:
+            client (str): Identifies the client session.
+            label, classification, agent, date: The search terms.
+            after (tuple, optional): The cursor of the page to fetch, see ps1lux.search_page.
+            page_size (int, optional): Maximum number of objects to return.
+
+        Returns:
+            ps1lux.SearchPage: The page.
+        """
+        terms = ps1lux.normalize_terms(label, classification, agent, date)
+        page = ps1lux.SearchPage(*terms, after=after, page_size=page_size)
+        if page.is_cached():
+            with self._lock:
+                self.cached += 1
+            return page
+
+        session = self._session(client)
+        if after is not None and session is not None and session[0] == terms:
+            # a later page of the search the candidates were collected for
+            ids = session[1]
+        elif session is not None and is_refinement(session[0], terms):
+            # narrowed to the previous candidates if they are known, in full otherwise
+            with self._lock:
+                if session[1] is not None:
+                    self.refined += 1
+                else:
+                    self.full += 1
+            ids = ps1lux.candidate_ids(*terms, within=session[1], limit=self.candidate_limit)
+            self._remember(client, terms, ids)
+        else:
+            with self._lock:
+                self.full += 1
+            ids = None
+            self._remember(client, terms, None)
+
+        page.within = ids
+        return page
+
+    def search_page(self, client, label, classification, agent, date,
+                    after=None, page_size=ps1lux.SEARCH_LIMIT):
+        """Runs ps1lux.search_page, narrowed to the client's previous candidates when possible.
+
+        Args:
+            client (str): Identifies the client session.
+            label, classification, agent, date: The search terms.
+            after (tuple, optional): The cursor of the page to fetch, see ps1lux.search_page.
+            page_size (int, optional): Maximum number of objects to return.
+
+        Returns:
+            tuple: The same (objects, next cursor) as ps1lux.search_page.
+        """
+        page = self.page(client, label, classification, agent, date, after, page_size)
+        objects = list(page)
+        if after is None and page.next_after is None:
+            # the page holds every match, so its ids are the candidates of a refinement
+            self._remember(client, page.terms, {hit.get_id() for hit in objects})
+        return objects, page.next_after
+
+    def stats(self):
+        """Returns counters describing how searches were run."""
+        with self._lock:
+            return {'sessions': len(self._sessions), 'refined': self.refined,
+                    'full': self.full, 'cached': self.cached}
@@ -0,0 +1,131 @@
+"""Maintenance commands for the YUAG search application.
+Usage: python lux.py <command> [options]
+
+Commands:
+    crawl-thumbnails   record which objects have thumbnails in the offline index
+    build-label-index  build the full-text label index used by searches
+    build-search-table build the denormalized table searches are answered from
+    generate-database  write a synthetic database with the schema of lux.sqlite
+    build              write an indexed, analyzed and vacuumed snapshot of a raw database"""
+import argparse
+import sys
+
+import luxbuild
+import luxdb
+import luxfts
+import luxgen
+import luxsearch
+import thumbindex
+
+
+def crawl_thumbnails(args):
+    """Runs the thumbnail crawler with the parsed command line arguments."""
+    max_age = args.max_age * 86400 if args.max_age is not None else None
+    probed, found, failed = thumbindex.crawl(args.database, args.output,
+                                             concurrency=args.concurrency,
+                                             batch_size=args.batch_size,
+                                             max_age=max_age, full=args.full)
+    print(f"Probed {probed} ids, {found} have thumbnails")
+    if failed:
+        print(f"{failed} probes failed, those ids stay unknown until the next crawl")
+
+
+def build_label_index(args):
+    """Builds the label index sidecar with the parsed command line arguments."""
+    luxfts.build(args.database, args.output)
+    print(f"Wrote label index to {args.output}")
+
+
+def build_search_table(args):
+    """Builds the search table sidecar with the parsed command line arguments."""
+    luxsearch.build(args.database, args.output)
+    print(f"Wrote search table to {args.output}")
+
+
+def generate_database(args):
+    """Writes a synthetic database with the parsed command line arguments."""
+    luxgen.generate(args.output, args.objects, args.seed)
+    print(f"Wrote {args.objects} synthetic objects to {args.output}")
+
+
+def build_snapshot(args):
+    """Writes an optimized snapshot with the parsed command line arguments."""
+    report = luxbuild.build(args.database, args.output, args.page_size)
+    if report['dropped']:
+        print(f"Dropped redundant indexes: {', '.join(report['dropped'])}")
+    print(f"Wrote {args.output}: {len(report['indexes'])} covering indexes, "
+          f"{report['page_size']} byte pages, {report['size'] / 1e6:.1f} MB")
+    print(f"Checked {report['checked']} query plans, none scans a join table in full")
+    print("Rebuild the label index and the search table from the new snapshot")
+
+
+def build_parser():
+    """Creates the argument parser for every command."""
+    parser = argparse.ArgumentParser(description='YUAG search maintenance commands',
+                                     allow_abbrev=False)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    crawl = commands.add_parser('crawl-thumbnails', allow_abbrev=False,
+                                help='record which objects have thumbnails')
+    crawl.add_argument('--database', default='lux.sqlite',
+                       help='the database whose object ids are crawled')
+    crawl.add_argument('--output', default=thumbindex.THUMBNAIL_INDEX,
+                       help='the thumbnail index file to create or update')
+    crawl.add_argument('--concurrency', type=int, default=16,
+                       help='maximum number of requests in flight')
+    crawl.add_argument('--batch-size', type=int, default=1000,
+                       help='number of ids probed per batch')
+    crawl.add_argument('--max-age', type=float, default=None,
+                       help='re-crawl ids last checked more than this many days ago')
+    crawl.add_argument('--full', action='store_true',
+                       help='re-crawl every id, not only stale or unknown ones')
+    crawl.set_defaults(handler=crawl_thumbnails)
+
+    labels = commands.add_parser('build-label-index', allow_abbrev=False,
+                                 help='build the full-text label index')
+    labels.add_argument('--database', default=luxfts.DATABASE_PATH,
+                        help='the database whose labels are indexed')
+    labels.add_argument('--output', default=luxfts.LABEL_INDEX,
+                        help='the label index file to create')
+    labels.set_defaults(handler=build_label_index)
+
+    table = commands.add_parser('build-search-table', allow_abbrev=False,
+                                help='build the denormalized search table')
+    table.add_argument('--database', default=luxsearch.DATABASE_PATH,
+                       help='the database whose searchable objects are copied')
+    table.add_argument('--output', default=luxsearch.SEARCH_TABLE,
+                       help='the search table file to create')
+    table.set_defaults(handler=build_search_table)
+
+    generate = commands.add_parser('generate-database', allow_abbrev=False,
+                                   help='write a synthetic database for benchmarks')
+    generate.add_argument('output', help='the database file to create')
+    generate.add_argument('--objects', type=int, default=10000,
+                          help='number of objects, e.g. 10000 to 5000000')
+    generate.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+    generate.set_defaults(handler=generate_database)
+
+    build = commands.add_parser('build', allow_abbrev=False,
+                                help='write an optimized read-only snapshot')
+    build.add_argument('database', help='the raw database, which is only read')
+    build.add_argument('--output', default=luxdb.DATABASE_PATH,
+                       help='the snapshot to create or replace, may be the raw database')
+    build.add_argument('--page-size', type=int, default=luxbuild.PAGE_SIZE,
+                       help='page size of the snapshot in bytes')
+    build.set_defaults(handler=build_snapshot)
+
+    return parser
+
+
+def main(argv=None):
+    """Parses the command line and runs the requested command."""
+    args = build_parser().parse_args(argv)
+    try:
+        args.handler(args)
+    except Exception as error:
+        print(f"Error: {error}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,80 +2,279 @@
 Flask app for the LUX project.
 """
 import json
-from flask import Flask, request, make_response, render_template, abort
-from luxdetails import format_entry_results2
-from ps1lux import search
+import time
+from sqlite3 import Error
+from flask import Flask, Response, request, make_response, render_template, abort, jsonify
+from flask import stream_with_context
+from luxdetails import format_entry_results2, format_entry_results_batch
+from httpcache import conditional
+from incremental import IncrementalSearch
+from prefetch import DetailPrefetcher
+from ps1lux import search, search_cache
+from ps1lux import iter_search, split_aggregate, SearchPage
+from singleflight import SingleFlight, Superseded
+from thumbindex import THUMBNAIL_INDEX
+from luxviews import SEARCH_PAGE_SIZE
+import luxdb
+import luxviews
+import querylog
+import thumbnails
+import timing
 
 #-----------------------------------------------------------------------
 
 app = Flask(__name__)
 
+# narrow as-you-type searches that refine the client's previous search
+app.config.setdefault('INCREMENTAL_SEARCH', True)
+
+# stream /search pages while rows are read instead of rendering them first; streamed
+# searches are not coalesced, the page's JS aborts the requests it no longer needs
+app.config.setdefault('STREAM_SEARCH', False)
+
+# template output events buffered into each chunk of a streamed page
+STREAM_BUFFER = 40
+
+# seconds browsers and proxies may reuse an object page before revalidating it
+OBJECT_MAX_AGE = 300
+
+# most ids one /api/objects request may ask for
+MAX_BATCH_IDS = 500
+
+# time the phases of each request for the Server-Timing header and /metrics
+app.config.setdefault('REQUEST_TIMING', True)
+
+incremental_search = IncrementalSearch()
+search_flights = SingleFlight()
+
+# load the details of the top results of each search before they are clicked
+app.config.setdefault('PREFETCH_DETAILS', True)
+detail_prefetcher = DetailPrefetcher(top_k=5)
+
+# answer has_image() from the crawler's index when one has been built
+thumbnails.load_index(THUMBNAIL_INDEX)
+
 #-----------------------------------------------------------------------
 
+@app.before_request
+def start_timing():
+    """
+    Starts recording the phases of the request, unless timing is disabled.
+    """
+    if app.config['REQUEST_TIMING']:
+        timing.start()
+
+@app.after_request
+def send_timing(response):
+    """
+    Sends the phases timed so far in a Server-Timing header, and adds the request to the
+    metrics once its response has been sent.
+
+    The header of a streamed response is sent before its body, so it only holds the
+    phases that ran before the view returned; the metrics include the whole body.
+
+    :param response: The response of the request.
+    :return: The response.
+    """
+    recorder = timing.current()
+    if recorder is not None:
+        response.headers['Server-Timing'] = timing.server_timing(recorder)
+        endpoint, status = request.endpoint or 'unmatched', response.status_code
+
+        def record():
+            timing.metrics.record(endpoint, status, recorder)
+            timing.finish()
+
+        response.call_on_close(record)
+    return response
+
+def render(template_name, **context):
+    """
+    Renders a template, timed as the render phase of the request.
+
+    :param template_name: The name of the template to render.
+    :param context: The variables available in the template.
+    :return: The rendered template.
+    """
+    with timing.phase('render'):
+        return render_template(template_name, **context)
+
 @app.route('/', methods=['GET'])
 @app.route('/index', methods=['GET'])
 def index():
-    # Attempt to load the search parameters from cookies
-    search_parameters = request.cookies.get('search_parameters')
-    prev_label, prev_classifier, prev_agent, prev_date = '', '', '', ''
-    objects = None
-    error_message = ''
-
-    if search_parameters:
-        search_parameters = json.loads(search_parameters)
-        prev_label = search_parameters.get('label', '')
-        prev_classifier = search_parameters.get('classifier', '')
-        prev_agent = search_parameters.get('agent', '')
-        prev_date = search_parameters.get('date', '')
-
-        # Perform the search to populate the results
-        objects = search(prev_label, prev_classifier, prev_agent, prev_date)
-        if not objects:
-            # If no objects were found and search was attempted, set an error message
-            error_message = "No results found for the last search."
-
-    # Pass the objects and error_message to the template
-    html = render_template('index.html', label=prev_label,
-                           classifier=prev_classifier,
-                           agent=prev_agent,
-                           date=prev_date,
-                           objects=objects,
-                           error_message=error_message)
+    # Repeat the search saved in the cookies, if any, to populate the results
+    terms = luxviews.saved_search(request.cookies)
+    objects = search(*terms, page_size=SEARCH_PAGE_SIZE) if terms else None
+
+    html = render('index.html', **luxviews.index_context(terms, objects))
     response = make_response(html)
     return response
 
 
 #-----------------------------------------------------------------------
 
+def stream_page(template_name, **context):
+    """
+    Renders a template as an iterator of chunks, for a streamed response.
+
+    :param template_name: The name of the template to render.
+    :param context: The variables available in the template.
+    :return: An iterator over the rendered chunks, bound to the current request context.
+    """
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER)
+    return stream_with_context(timing.timed('render', stream))
+
+def remember_search(response, client_id=None):
+    """
+    Stores the search parameters of the request in a cookie, and gives new clients an id.
+
+    :param response: The response to set the cookies on.
+    :param client_id: The id to give a new client, a random one if None.
+    """
+    luxviews.finish_search(request, response, client_id)
+
+# The results only change with the snapshot, the parameters and, for an empty search,
+# whether a previous search was made. page_id and seq only order a page's requests.
 @app.route('/search', methods=['GET'])
+@conditional(private=True, ignore=('seq', 'page_id'),
+             vary=lambda: 'search_parameters' in request.cookies, vary_headers=('Cookie',),
+             not_modified=remember_search)
 def search_results():
     # Retrieve search parameters from the request, defaulting to an empty string
+    terms = luxviews.search_terms(request.args)
+    after = luxviews.parse_cursor(request.args.get('after'))
+    client_id = luxviews.client_id(request.cookies)
+
+    if app.config['STREAM_SEARCH'] and (after is not None or any(terms)
+                                        or request.cookies.get('search_parameters')):
+        # rows are rendered and sent while they are read, the next page's cursor
+        # follows them in the body since the headers are sent first
+        if app.config['INCREMENTAL_SEARCH']:
+            objects = incremental_search.page(client_id, *terms, after, SEARCH_PAGE_SIZE)
+        else:
+            objects = SearchPage(*terms, after, SEARCH_PAGE_SIZE)
+        name = 'search_rows.html' if after is not None else 'search_results.html'
+        response = Response(stream_page(name, objects=objects, stream=True))
+        luxviews.finish_search(request, response, client_id)
+        return response
+
+    # The page's JS numbers its searches, a higher number supersedes the older requests
+    # of the same loaded page
+    page_id = request.args.get('page_id')
+    seq = request.args.get('seq', type=int)
+    if after is None:
+        # the results of the previous search are no longer on the page
+        detail_prefetcher.cancel(client_id)
+
+    def run_search():
+        return luxviews.run_search(
+            incremental_search if app.config['INCREMENTAL_SEARCH'] else None,
+            client_id, terms, after)
+
+    # Perform the search with the provided parameters, sharing identical in-flight searches
+    key = luxviews.flight_key(terms, after)
+    try:
+        objects, next_after = search_flights.do(key, run_search, page_id, seq)
+    except Superseded:
+        return '', 204
+
+    # Without search parameters or a previous search, show a default message instead
+    template, context = luxviews.search_template(request, terms, after, objects)
+    html = render(template, **context)
+
+    if app.config['PREFETCH_DETAILS'] and after is None and objects:
+        detail_prefetcher.schedule(client_id, [obj.get_id() for obj in objects])
+
+    # Create a response object with the rendered HTML, the next page's cursor and the
+    # search parameters stored in a cookie
+    response = make_response(html)
+    luxviews.finish_search(request, response, client_id, next_after)
+
+    return response
+
+@app.route('/api/search', methods=['GET'])
+@conditional()
+def api_search():
+    """
+    Streams the objects matching the l, c, a and d filters as newline-delimited JSON.
+
+    Each line is an object record with id, label, date, agents and classifiers, in
+    search order. A final line {"summary": {...}} holds the number of records sent,
+    the elapsed milliseconds and, if the search failed part way, the error.
+
+    :return: An application/x-ndjson response streamed while the cursor is read.
+    """
     label = request.args.get('l', default='')
     classifier = request.args.get('c', default='')
     agent = request.args.get('a', default='')
     date = request.args.get('d', default='')
+    limit = request.args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = -1
+        if limit < 0:
+            abort(400, description="Error: limit must be a non-negative integer")
 
-    # Perform the search with the provided parameters
-    objects = search(label, classifier, agent, date)
+    def generate():
+        start = time.perf_counter()
+        summary = {'count': 0}
+        try:
+            for obj_id, obj_label, agent_info, obj_date, classes in iter_search(
+                    label, classifier, agent, date, limit):
+                record = {'id': obj_id, 'label': obj_label, 'date': obj_date,
+                          'agents': split_aggregate(agent_info),
+                          'classifiers': split_aggregate(classes)}
+                summary['count'] += 1
+                yield json.dumps(record) + '\n'
+        except Error as error:
+            summary['error'] = str(error)
+        summary['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        yield json.dumps({'summary': summary}) + '\n'
 
-    # If no search parameters were provided and no previous search, show a default message or empty results
-    if not (label or classifier or agent or date) and not request.cookies.get('search_parameters'):
-        error_message = "No search terms provided. Please enter some search terms."
-        html = render_template('search_results.html', error_message=error_message)
-    else:
-        # Render the search results with the objects found
-        html = render_template('search_results.html', objects=objects)
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
-    # Create a response object with the rendered HTML
-    response = make_response(html)
+@app.route('/stats', methods=['GET'])
+def stats():
+    """
+    Reports cache and connection pool counters for monitoring.
 
-    # Store search parameters in a cookie as a JSON string
-    search_params = {'label': label, 'classifier': classifier, 'agent': agent, 'date': date}
-    response.set_cookie('search_parameters', json.dumps(search_params))
+    :return: A JSON object of counters.
+    """
+    return jsonify(search_cache=search_cache.stats(), connections=luxdb.get_pool().stats(),
+                   incremental_search=incremental_search.stats(),
+                   search_flights=search_flights.stats(),
+                   prefetch=detail_prefetcher.stats())
 
-    return response
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Exports request counts and the latency histograms of requests and their phases.
 
+    :return: The metrics in the Prometheus text exposition format.
+    """
+    return Response(timing.metrics.render(), content_type='text/plain; version=0.0.4')
+
+@app.route('/stats/queries', methods=['GET'])
+def query_stats():
+    """
+    Reports the statistics of every SQL statement variant and the recent slow statements,
+    once the query log has been enabled, e.g. with runserver.py --slow-query-ms.
+
+    :return: A JSON object with the threshold, the variants and the slow statements.
+    """
+    log = querylog.get_log()
+    if log is None:
+        return jsonify(enabled=False, variants=[], slow=[])
+    return jsonify(enabled=True, threshold_ms=log.threshold_ms, variants=log.summary(),
+                   slow=log.slow())
+
+# object details are the same for everyone until the next snapshot is deployed
 @app.route('/obj/<obj_id>', methods=['GET'])
+@conditional(max_age=OBJECT_MAX_AGE)
 def get_object_deets(obj_id):
     """
     Fetches and renders details for a specific object based on its id.
@@ -83,14 +282,57 @@ def get_object_deets(obj_id):
     :param obj_id: The unique id of the object to fetch details for.
     :return: The rendered details of the object or a 404 error if the object doesn't exist.
     """
-    obj = format_entry_results2(obj_id)
+    # details prefetched after the search that listed the object, else loaded now
+    object_id = luxviews.object_id(obj_id)
+    obj = detail_prefetcher.get(object_id) or format_entry_results2(object_id)
     if obj is None:
-        abort(404, description=f"Error: object with id {obj_id} does not exist")
+        luxviews.missing_object(obj_id)
 
-    html = render_template('object_deets.html', obj=obj, obj_id=obj_id)
-    response = make_response(html)
-    response.set_cookie("activate", "true")
-    return response
+    # public and cacheable, so the page sets no cookie
+    return render('object_deets.html', obj=obj, obj_id=obj_id)
+
+def object_record(obj):
+    """
+    Converts the details of an object to a JSON serializable record.
+
+    :param obj: An Object from format_entry_results2 or format_entry_results_batch.
+    :return: A dict with the fields of the object page.
+    """
+    return {'id': obj.get_id(), 'accession_no': obj.get_acc_no(), 'date': obj.get_date(),
+            'place': obj.get_place(), 'department': obj.get_dept(), 'label': obj.get_label(),
+            'productions': [{'part': part, 'name': name, 'nationalities': nationalities,
+                             'timespan': timespan}
+                            for part, name, nationalities, timespan in obj.get_productions()],
+            'classifiers': obj.get_classifiers(),
+            'references': [{'type': ref_type, 'content': content}
+                           for ref_type, content in obj.get_references()]}
+
+# like object pages, the details only change with the snapshot
+@app.route('/api/objects', methods=['GET'])
+@conditional(max_age=OBJECT_MAX_AGE)
+def api_objects():
+    """
+    Returns the details of several objects, loaded with one SQL statement.
+
+    The ids are given as comma-separated lists in one or more ids parameters, e.g.
+    /api/objects?ids=1,2,3.
+
+    :return: A JSON object with the records of the objects that exist, in the order the
+             ids were given, and the requested ids that have no object. Aborts with 400
+             if an id is not an integer or more than MAX_BATCH_IDS ids are requested.
+    """
+    try:
+        ids = [int(value) for values in request.args.getlist('ids')
+               for value in values.split(',') if value.strip()]
+    except ValueError:
+        abort(400, description="Error: ids must be comma-separated integers")
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_BATCH_IDS:
+        abort(400, description=f"Error: at most {MAX_BATCH_IDS} ids can be requested at once")
+
+    objects = format_entry_results_batch(ids)
+    return jsonify(objects=[object_record(obj) for obj in objects.values()],
+                   missing=[obj_id for obj_id in ids if obj_id not in objects])
 
 @app.route('/obj', methods=['GET'])
 def handle_missing_obj_id():
@@ -109,4 +351,4 @@ def not_found_error(error):
     :param error: The error description.
     :return: The rendered error template with a status code of 404.
     """
-    return render_template('error.html', error_message=error.description), 404
+    return render('error.html', error_message=error.description), 404
@@ -0,0 +1,246 @@
+"""
+Asynchronous variant of the LUX app, served over ASGI.
+
+In luxapp every request holds a worker thread until it is answered, including
+while /obj/<obj_id> waits for the media host to answer a thumbnail check, so a
+slow media host ties up every thread of the server. Here the views are
+coroutines on one event loop. SQLite has no asynchronous API, so its work runs
+on a pool of SQL_THREADS threads; thumbnail checks use an httpx.AsyncClient
+limited to MAX_CONNECTIONS connections, so hundreds of slow checks can be in
+flight without an OS thread each.
+
+The variant serves the pages a browser uses, /, /search and /obj/<obj_id>,
+from the same templates and with the request handling of luxviews. Coalesced
+searches await the one that runs on the event loop, so only it occupies an
+SQL thread. Streamed search pages, /api/search, conditional
+caching and the timing metrics remain with luxapp. Serve it with
+`python runserver.py PORT --asgi`, which needs quart, httpx and uvicorn.
+"""
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import httpx
+from quart import Quart, request, make_response, render_template, abort, jsonify
+
+from incremental import IncrementalSearch
+from luxdetails import format_entry_results2
+from luxviews import SEARCH_PAGE_SIZE
+from ps1lux import search, search_cache, load_replicas
+from singleflight import SingleFlight, Superseded
+from thumbindex import THUMBNAIL_INDEX
+import luxdb
+import luxviews
+import thumbnails
+
+#-----------------------------------------------------------------------
+
+app = Quart(__name__)
+
+# narrow as-you-type searches that refine the client's previous search
+app.config.setdefault('INCREMENTAL_SEARCH', True)
+
+# threads running SQLite work, which also bounds the pooled connections in use
+SQL_THREADS = int(os.environ.get('LUX_SQL_THREADS', 8))
+
+# connections to the media host open at the same time
+MAX_CONNECTIONS = 100
+
+sql_pool = ThreadPoolExecutor(SQL_THREADS, thread_name_prefix='lux-sql')
+incremental_search = IncrementalSearch()
+search_flights = SingleFlight()
+
+# runserver.py --asgi --in-memory asks every worker process to load its own copy
+if os.environ.get('LUX_IN_MEMORY'):
+    load_replicas()
+
+# answer thumbnail checks from the crawler's index when one has been built
+thumbnails.load_index(THUMBNAIL_INDEX)
+
+#-----------------------------------------------------------------------
+
+async def run_sql(function, *args):
+    """
+    Runs a blocking database function on the SQL thread pool.
+
+    :param function: The function to call, e.g. search_page.
+    :param args: Its arguments.
+    :return: The value it returned.
+    """
+    return await asyncio.get_running_loop().run_in_executor(sql_pool, partial(function, *args))
+
+
+class AsyncThumbnailProbe:
+    """Checks thumbnail availability on the event loop, like thumbnails.ThumbnailProbe.
+
+    Results are memoized for ttl seconds in a thumbnails.ThumbnailCache, and concurrent
+    checks of the same id share one request to the media host.
+    """
+
+    def __init__(self, url_template=thumbnails.THUMBNAIL_URL, ttl=thumbnails.THUMBNAIL_TTL,
+                 timeout=thumbnails.THUMBNAIL_TIMEOUT, max_connections=MAX_CONNECTIONS,
+                 max_entries=thumbnails.MAX_CACHE_ENTRIES):
+        self._url_template = url_template
+        self._cache = thumbnails.ThumbnailCache(ttl, max_entries)
+        self._pending = {}
+        # a check waits at most timeout for a free connection, and as long for each
+        # network step, so a check fails instead of queueing without bound
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections))
+
+    async def _fetch(self, obj_id):
+        """Asks the media host whether obj_id has a thumbnail.
+
+        Uses HEAD and falls back to a streamed GET (body not downloaded) when
+        the server does not support HEAD. Returns None if the media host
+        could not be reached.
+        """
+        url = self._url_template.format(obj_id)
+        try:
+            response = await self._client.head(url, follow_redirects=True)
+            if response.status_code in thumbnails.HEAD_UNSUPPORTED:
+                async with self._client.stream('GET', url, follow_redirects=True) as response:
+                    return thumbnails.is_thumbnail(response.status_code)
+            return thumbnails.is_thumbnail(response.status_code)
+        except httpx.HTTPError as error:
+            print(f"Thumbnail probe failed for {obj_id}: {error!r}", file=sys.stderr)
+            return None
+
+    async def exists(self, obj_id):
+        """Returns True if obj_id has a thumbnail, checking the offline index and cache first.
+
+        Returns None if the media host could not be reached.
+        """
+        exists = thumbnails.indexed(obj_id)
+        if exists is not None:
+            return exists
+        exists = self._cache.get(obj_id)
+        if exists is not None:
+            return exists
+
+        task = self._pending.get(obj_id)
+        if task is None:
+            task = self._pending[obj_id] = asyncio.ensure_future(self._fetch(obj_id))
+            task.add_done_callback(lambda _: self._pending.pop(obj_id, None))
+        # a request that is cancelled must not cancel the check other requests wait for
+        exists = await asyncio.shield(task)
+        if exists is not None:
+            self._cache.put(obj_id, exists)
+        return exists
+
+    def stats(self):
+        """Returns the number of cached results and of checks in flight."""
+        return {'cached': len(self._cache), 'in_flight': len(self._pending)}
+
+    async def close(self):
+        """Closes the connections to the media host."""
+        await self._client.aclose()
+
+
+thumbnail_probe = None
+
+@app.before_serving
+async def open_thumbnail_probe():
+    """Creates the thumbnail probe on the event loop the app is served from."""
+    global thumbnail_probe
+    thumbnail_probe = AsyncThumbnailProbe()
+
+@app.after_serving
+async def close_resources():
+    """Closes the media host connections, the SQL threads and the database connections."""
+    await thumbnail_probe.close()
+    sql_pool.shutdown(wait=True)
+    luxdb.get_pool().close_all()
+
+#-----------------------------------------------------------------------
+
+@app.route('/', methods=['GET'])
+@app.route('/index', methods=['GET'])
+async def index():
+    # Repeat the search saved in the cookies, if any, to populate the results
+    terms = luxviews.saved_search(request.cookies)
+    objects = None
+    if terms:
+        objects = await run_sql(partial(search, page_size=SEARCH_PAGE_SIZE), *terms)
+
+    html = await render_template('index.html', **luxviews.index_context(terms, objects))
+    return await make_response(html)
+
+@app.route('/search', methods=['GET'])
+async def search_results():
+    terms = luxviews.search_terms(request.args)
+    after = luxviews.parse_cursor(request.args.get('after'))
+    client_id = luxviews.client_id(request.cookies)
+    page_id = request.args.get('page_id')
+    seq = request.args.get('seq', type=int)
+
+    def run_search():
+        return luxviews.run_search(
+            incremental_search if app.config['INCREMENTAL_SEARCH'] else None,
+            client_id, terms, after)
+
+    # identical in-flight searches share one execution on the SQL threads
+    key = luxviews.flight_key(terms, after)
+    try:
+        objects, next_after = await search_flights.do_async(key, run_search, page_id, seq,
+                                                            executor=sql_pool)
+    except Superseded:
+        return '', 204
+
+    template, context = luxviews.search_template(request, terms, after, objects)
+    response = await make_response(await render_template(template, **context))
+    luxviews.finish_search(request, response, client_id, next_after)
+    return response
+
+@app.route('/stats', methods=['GET'])
+async def stats():
+    """
+    Reports cache, connection pool and thumbnail check counters for monitoring.
+
+    :return: A JSON object of counters.
+    """
+    return jsonify(search_cache=search_cache.stats(), connections=luxdb.get_pool().stats(),
+                   incremental_search=incremental_search.stats(),
+                   search_flights=search_flights.stats(),
+                   thumbnails=thumbnail_probe.stats())
+
+@app.route('/obj/<obj_id>', methods=['GET'])
+async def get_object_deets(obj_id):
+    """
+    Fetches and renders details for a specific object based on its id.
+
+    The details are read on an SQL thread while the thumbnail check waits on the event
+    loop, so the two run at the same time and no thread waits for the media host.
+
+    :param obj_id: The unique id of the object to fetch details for.
+    :return: The rendered details of the object or a 404 error if the object doesn't exist.
+    """
+    object_id = luxviews.object_id(obj_id)
+    obj, has_image = await asyncio.gather(run_sql(format_entry_results2, object_id),
+                                          thumbnail_probe.exists(object_id))
+    if obj is None:
+        luxviews.missing_object(obj_id)
+    obj.set_has_image(has_image)
+
+    return await render_template('object_deets.html', obj=obj, obj_id=obj_id)
+
+@app.route('/obj', methods=['GET'])
+async def handle_missing_obj_id():
+    """
+    Handles requests with missing object ids by aborting with a 404 error.
+    """
+    abort(404, description="Error: missing object ID")
+
+@app.errorhandler(404)
+async def not_found_error(error):
+    """
+    Handles 404 errors by rendering an error template with the appropriate error message.
+
+    :param error: The error description.
+    :return: The rendered error template with a status code of 404.
+    """
+    return await render_template('error.html', error_message=error.description), 404
@@ -0,0 +1,655 @@
+"""Benchmarks for the YUAG search application.
+Usage: python luxbench.py <benchmark> [options]
+
+Benchmarks run against lux.sqlite in the current directory.
+
+Benchmarks:
+    name-filters   agent/classifier filters: LIKE versus the trigram index
+    query-plan     check that every search variant scans the filtered join once
+    connections    per-request latency with fresh versus pooled connections
+    details        object detail loading: one object per request versus batches
+    search-table   searches: joins over lux.sqlite versus the luxsearch table
+    first-row      /search time to first row, rendered versus streamed
+    hits           memory and construction time of search results: Object versus SearchHit
+    suite          p50/p95/p99 of representative workloads, optionally against a baseline
+    slow-queries   per-variant SQL statistics and plans of the slow statements of every search
+    load           HTTP throughput of runserver.py --production by number of workers
+    slow-media     object page throughput, threaded versus ASGI, with a slow media host
+
+Synthetic databases to run them against can be written with
+python lux.py generate-database."""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sqlite3 import connect
+from urllib.parse import urlencode
+
+import requests
+
+import luxdb
+import luxfts
+import luxsearch
+import ps1lux
+import querylog
+from luxdetails import format_entry_results2, load_details
+from object import Object
+from trigram import TrigramIndex
+
+
+def timed(function, repeat):
+    """Calls function repeat times and returns the duration of each call in seconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def milliseconds(durations):
+    """Formats the median of a list of durations in milliseconds."""
+    return f"{statistics.median(durations) * 1000:9.2f}"
+
+
+def name_filters(args):
+    """Compares the LIKE and trigram index paths of the agent and classifier filters."""
+    with closing(connect(luxdb.DATABASE_URL, uri=True)) as conn:
+        start = time.perf_counter()
+        indexes = {table: TrigramIndex(conn.execute(f"SELECT id, name FROM {table}"))
+                   for table in ('agents', 'classifiers')}
+        print(f"Built indexes over {len(indexes['agents'])} agent and "
+              f"{len(indexes['classifiers'])} classifier names in "
+              f"{(time.perf_counter() - start) * 1000:.1f} ms")
+        indexed = luxdb.indexed_columns(conn)
+        print(f"{'field':<11}{'term':<14}{'rows':>6}{'LIKE ms':>10}{'index ms':>10}")
+
+        for field in ('agent', 'classifier'):
+            for term in args.terms:
+                terms = {'label': None, 'classification': None, 'agent': None, 'date': None}
+                terms['agent' if field == 'agent' else 'classification'] = term
+
+                def run(name_indexes):
+                    filters, params = ps1lux.get_filters(name_indexes=name_indexes,
+                                                         indexed_columns=indexed, **terms)
+                    return conn.execute(ps1lux.create_query(filters), params).fetchall()
+
+                rows = len(run(None))
+                like = timed(lambda: run(None), args.repeat)
+                index = timed(lambda: run(indexes), args.repeat)
+                print(f"{field:<11}{term:<14}{rows:>6}{milliseconds(like)} {milliseconds(index)}")
+
+
+def query_plan(args):
+    """Checks with EXPLAIN QUERY PLAN that each search evaluates the filtered join once."""
+    objects = re.compile(r'^(SCAN|SEARCH) objects\b')
+    failures = 0
+    with closing(connect(luxdb.DATABASE_URL, uri=True)) as conn:
+        label_index = luxfts.attach(conn)
+        name_indexes = ps1lux.load_name_indexes(conn)
+        indexed = luxdb.indexed_columns(conn)
+        for terms in ps1lux.search_variants():
+            filters, params = ps1lux.get_filters(label_index=label_index,
+                                                 name_indexes=name_indexes,
+                                                 indexed_columns=indexed, **terms)
+            plan = [row[3] for row in conn.execute(
+                'EXPLAIN QUERY PLAN ' + ps1lux.create_query(filters), params)]
+            scans = sum(1 for step in plan if objects.match(step))
+            variant = ','.join(field for field, term in terms.items() if term) or '(none)'
+            status = 'ok' if scans == 1 else 'FAIL'
+            failures += scans != 1
+            print(f"{status:<5}{variant:<35}objects visited {scans} time(s)")
+            if args.verbose or scans != 1:
+                print('\n'.join('     ' + step for step in plan))
+    if failures:
+        sys.exit(1)
+
+
+def connections(args):
+    """Compares request latency when every request opens a connection and when it leases one."""
+    with closing(connect(luxdb.DATABASE_URL, uri=True)) as conn:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM objects ORDER BY random() LIMIT ?", (args.requests,))]
+
+    workloads = {
+        'search': lambda: ps1lux.search_page(args.term, page_size=50),
+        'details': lambda: [format_entry_results2(obj_id) for obj_id in ids],
+    }
+    print(f"{'workload':<10}{'fresh ms':>10}{'pooled ms':>11}")
+    for name, workload in workloads.items():
+        results = []
+        for settings in ({'max_idle': 0}, {}):
+            luxdb.configure(**settings)
+            workload()
+            durations = timed(workload, args.repeat)
+            # details time a batch of requests, report the latency of one
+            per_request = len(ids) if name == 'details' else 1
+            results.append([duration / per_request for duration in durations])
+        print(f"{name:<10}{milliseconds(results[0])} {milliseconds(results[1])}")
+    luxdb.configure()
+
+
+def details(args):
+    """Measures the detail loading behind /obj/<id>, one object at a time and in batches."""
+    with closing(connect(luxdb.DATABASE_URL, uri=True)) as conn:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM objects ORDER BY random() LIMIT ?", (args.requests,))]
+
+    def batch():
+        with luxdb.connection() as conn:
+            with closing(conn.cursor()) as cur:
+                return load_details(ids, cur)
+
+    format_entry_results2(ids[0])
+    single = [timed(lambda obj_id=obj_id: format_entry_results2(obj_id), 1)[0] for obj_id in ids]
+    batched = [duration / len(ids) for duration in timed(batch, args.repeat)]
+    single.sort()
+    print(f"{'workload':<28}{'ms':>9}")
+    print(f"{'/obj/<id> median':<28}{milliseconds(single)}")
+    print(f"{'/obj/<id> p95':<28}{single[int(len(single) * 0.95)] * 1000:9.2f}")
+    print(f"{f'batch of {len(ids)}, per object':<28}{milliseconds(batched)}")
+
+
+def search_table(args):
+    """Compares searches joining lux.sqlite with searches of the denormalized table."""
+    with closing(connect(luxdb.DATABASE_URL, uri=True)) as conn:
+        if not luxsearch.attach(conn):
+            raise RuntimeError(f"{luxsearch.SEARCH_TABLE} is missing or out of date, "
+                               "run python lux.py build-search-table")
+        label_index = luxfts.attach(conn)
+        name_indexes = ps1lux.load_name_indexes(conn)
+        indexed = luxdb.indexed_columns(conn)
+        print(f"{'field':<16}{'term':<14}{'rows':>6}{'joins ms':>10}{'table ms':>10}")
+
+        for field in ('label', 'classification', 'agent', 'date'):
+            for term in args.terms:
+                terms = {'label': '', 'classification': '', 'agent': '', 'date': ''}
+                terms[field] = term
+                filters, params = ps1lux.get_filters(label_index=label_index,
+                                                     name_indexes=name_indexes,
+                                                     indexed_columns=indexed, **terms)
+                joins = ps1lux.create_query(filters, args.page_size)
+                table_filters, table_params = luxsearch.get_filters(**terms)
+                table = luxsearch.create_query(table_filters, args.page_size)
+
+                rows = len(conn.execute(table, table_params).fetchall())
+                join_times = timed(lambda: conn.execute(joins, params).fetchall(), args.repeat)
+                table_times = timed(lambda: conn.execute(table, table_params).fetchall(),
+                                    args.repeat)
+                print(f"{field:<16}{term:<14}{rows:>6}{milliseconds(join_times)} "
+                      f"{milliseconds(table_times)}")
+
+
+def first_row(args):
+    """Measures how long /search takes to send its first result row, rendered and streamed."""
+    from luxapp import app
+
+    def measure(query):
+        client = app.test_client()
+        ps1lux.search_cache.clear()
+        start = time.perf_counter()
+        response = client.get('/search', query_string=query, buffered=False)
+        first, body = None, b''
+        for chunk in response.response:
+            body += chunk if isinstance(chunk, bytes) else chunk.encode()
+            if first is None and b'label-cell' in body:
+                first = time.perf_counter() - start
+        total = time.perf_counter() - start
+        response.close()
+        return (first if first is not None else total), total
+
+    print(f"{'query':<12}{'mode':<10}{'first row ms':>13}{'total ms':>10}")
+    for field, term in (('l', args.term), ('a', args.term), ('d', '1')):
+        for mode, stream in (('rendered', False), ('streamed', True)):
+            app.config['STREAM_SEARCH'] = stream
+            runs = [measure({field: term}) for _ in range(args.repeat)]
+            print(f"{field + '=' + term:<12}{mode:<10}"
+                  f"{milliseconds([run[0] for run in runs])}    "
+                  f"{milliseconds([run[1] for run in runs])}")
+
+
+def hits(args):
+    """Compares the memory held and the time taken by the two record types of a result set."""
+    with closing(connect(luxdb.DATABASE_URL, uri=True)) as conn:
+        filters, params = ps1lux.get_filters(args.term, None, None, None)
+        rows = conn.execute(ps1lux.create_query(filters, args.rows), params).fetchall()
+
+    def as_object(row):
+        # how search results were built before SearchHit
+        return Object(obj_id=int(row[0]), label=str(row[1]), date=str(row[3]),
+                      agents=(row[2] or "None").rstrip('|').split('|'),
+                      classifiers=(row[4] or "None").rstrip('|').split('|'))
+
+    print(f"{len(rows)} rows of a search for {args.term!r}")
+    print(f"{'record':<11}{'bytes/hit':>10}{'build ms':>10}")
+    for name, build in (('Object', as_object), ('SearchHit', ps1lux.process_row)):
+        tracemalloc.start()
+        records = [build(row) for row in rows]
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del records
+        durations = timed(lambda: [build(row) for row in rows], args.repeat)
+        print(f"{name:<11}{held // max(len(rows), 1):>10}{milliseconds(durations)}")
+    estimate = ps1lux.result_size([ps1lux.process_row(row) for row in rows])
+    print(f"{'estimate':<11}{estimate // max(len(rows), 1):>10}"
+          "  (ps1lux.result_size, also counting the label and date strings)")
+
+
+# (name, (label, classification, agent, date)) of the searches the suite runs
+SUITE_SEARCHES = [
+    ('label', ('bowl', '', '', '')),
+    ('classifier', ('', 'prints', '', '')),
+    ('agent', ('', '', 'smith', '')),
+    ('date', ('', '', '', '1880')),
+    ('label+classifier', ('portrait', 'paintings', '', '')),
+    ('agent+date', ('', '', 'john', '18')),
+    ('all fields', ('a', 'p', 'e', '1')),
+    ('broad 1 char', ('a', '', '', '')),
+    ('broad 2 chars', ('an', '', '', '')),
+    ('broad agent', ('', '', 'e', '')),
+    ('empty', ('qqqzx', '', '', '')),
+    ('empty agent', ('', '', 'qqqzx', '')),
+]
+
+
+def percentiles(durations):
+    """Returns the p50, p95 and p99 of a list of durations in milliseconds (nearest rank)."""
+    ordered = sorted(durations)
+    return {f"p{q}": round(ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))] * 1000, 3)
+            for q in (50, 95, 99)}
+
+
+def suite(args):
+    """Runs every workload of the suite, prints its percentiles and compares them to a baseline."""
+    with closing(connect(luxdb.DATABASE_URL, uri=True)) as conn:
+        objects = conn.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+        # the same objects every run, without loading every id of a large database
+        ids = [conn.execute("SELECT id FROM objects LIMIT 1 OFFSET ?", (offset,)).fetchone()[0]
+               for offset in random.Random(0).sample(range(objects), min(objects, args.repeat))]
+
+    def search(terms):
+        ps1lux.search_cache.clear()
+        ps1lux.search_page(*terms, page_size=args.page_size)
+
+    def query(terms):
+        with luxdb.connection() as conn:
+            filters, params = ps1lux.connection_filters(conn, *terms)
+            conn.execute(ps1lux.create_query(filters, args.page_size), params).fetchall()
+
+    workloads = [(f"search {name}", lambda terms=terms: search(terms))
+                 for name, terms in SUITE_SEARCHES]
+    workloads += [(f"create_query {name}", lambda terms=terms: query(terms))
+                  for name, terms in SUITE_SEARCHES[:4]]
+    details = itertools.cycle(ids)
+    workloads.append(('details', lambda: format_entry_results2(next(details))))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        if baseline['objects'] != objects:
+            print(f"Warning: the baseline was measured on {baseline['objects']} objects, "
+                  f"this database has {objects}", file=sys.stderr)
+
+    print(f"{objects} objects, {args.repeat} runs per workload")
+    header = f"{'workload':<32}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    print(header + (f"{'p50 vs base':>13}" if baseline else ''))
+    results = {}
+    for name, workload in workloads:
+        workload()
+        results[name] = percentiles(timed(workload, args.repeat))
+        line = f"{name:<32}" + ''.join(f"{value:>9.2f}" for value in results[name].values())
+        base = baseline['workloads'].get(name) if baseline else None
+        if base:
+            line += f"{(results[name]['p50'] / base['p50'] - 1) * 100:>+12.1f}%"
+        print(line)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as file:
+            json.dump({'objects': objects, 'repeat': args.repeat, 'workloads': results},
+                      file, indent=2)
+        print(f"Saved results to {args.save}")
+
+
+def slow_queries(args):
+    """Runs every search variant with the query log enabled and prints its per-variant summary."""
+    log = querylog.enable(args.threshold_ms)
+    for terms in ps1lux.search_variants():
+        for _ in range(args.repeat):
+            ps1lux.search_cache.clear()
+            page, after = ps1lux.search_page(page_size=args.page_size, **terms)
+            if after is not None:
+                ps1lux.search_page(after=after, page_size=args.page_size, **terms)
+
+    print(f"{'variant':<12}{'runs':>6}{'mean ms':>10}{'max ms':>10}{'rows':>8}"
+          f"{'vm steps':>12}{'slow':>6}  {'parameters':<36}statement")
+    for variant in log.summary():
+        print(f"{variant['variant']:<12}{variant['count']:>6}{variant['mean_ms']:>10.2f}"
+              f"{variant['max_ms']:>10.2f}{variant['rows'] // variant['count']:>8}"
+              f"{variant['vm_steps'] // variant['count']:>12}{variant['slow']:>6}"
+              f"  {variant['parameters']:<36}{variant['sql'][:args.width]}")
+        if args.verbose and variant['plan']:
+            print('\n'.join('            ' + step for step in variant['plan']))
+
+
+RUNSERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'runserver.py')
+
+
+def load_client(url, paths, duration, threads):
+    """Requests paths from url in a loop from several threads for duration seconds.
+
+    Runs in a process of its own, so that the client is not limited to one core.
+
+    Returns:
+        tuple: (latencies in seconds of the successful requests, number of failed requests)
+    """
+    deadline = time.monotonic() + duration
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def run(offset):
+        # threads start evenly spread over the paths, not one after another on the same ones
+        offset = offset * len(paths) // threads
+        with requests.Session() as session:
+            for path in itertools.islice(itertools.cycle(paths), offset, None):
+                if time.monotonic() >= deadline:
+                    return
+                start = time.perf_counter()
+                try:
+                    ok = session.get(url + path, timeout=60).status_code == 200
+                except requests.RequestException:
+                    ok = False
+                with lock:
+                    (latencies if ok else failures).append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=run, args=(offset,)) for offset in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, len(failures)
+
+
+def start_server(port, options, env=None, timeout=60):
+    """Starts runserver.py with the given options and waits until it answers requests."""
+    server = subprocess.Popen([sys.executable, RUNSERVER, str(port), *options], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"The server exited during startup, run "
+                               f"runserver.py {' '.join(options)} to see why")
+        try:
+            requests.get(f'http://127.0.0.1:{port}/stats', timeout=1)
+            return server
+        except requests.RequestException:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"The server did not answer within {timeout} s")
+
+
+def load(args):
+    """Measures requests per second and latency of the production server by worker count."""
+    with closing(connect(luxdb.DATABASE_URL, uri=True)) as conn:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM objects ORDER BY id LIMIT 200 OFFSET ?",
+            (conn.execute("SELECT COUNT(*) FROM objects").fetchone()[0] // 2,))]
+    # object pages between searches of every kind, as browsing users request them
+    searches = [f"/search?{urlencode(dict(zip(('l', 'c', 'a', 'd'), terms)))}"
+                for _, terms in SUITE_SEARCHES]
+    paths = [path for pair in itertools.zip_longest(searches, (f"/obj/{obj_id}" for obj_id in ids))
+             for path in pair if path is not None]
+
+    print(f"{os.cpu_count()} cores, {args.clients} client processes x "
+          f"{args.concurrency} threads, {args.duration} s per run")
+    if os.cpu_count() < max(args.workers):
+        # the clients share the cores too, so more workers than cores only overlap I/O
+        print(f"Warning: fewer cores than workers, speedups beyond {os.cpu_count()} "
+              "worker(s) do not show how the server scales", file=sys.stderr)
+    print(f"{'workers':>8}{'req/s':>10}{'speedup':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'failed':>8}")
+    first = None
+    for workers in args.workers:
+        server = start_server(args.port, ['--production', '--workers', str(workers),
+                                          '--threads', str(args.threads)])
+        try:
+            url = f'http://127.0.0.1:{args.port}'
+            # one pass over the paths, so that every run starts with warm caches
+            load_client(url, paths, 0.5, args.concurrency)
+            with ProcessPoolExecutor(args.clients) as pool:
+                results = list(pool.map(load_client, *zip(*[
+                    (url, paths[offset::args.clients], args.duration, args.concurrency)
+                    for offset in range(args.clients)])))
+        finally:
+            server.terminate()
+            server.wait()
+        latencies = [latency for result in results for latency in result[0]]
+        failed = sum(result[1] for result in results)
+        throughput = len(latencies) / args.duration
+        first = first or throughput
+        line = f"{workers:>8}{throughput:>10.1f}{throughput / first:>8.2f}x"
+        if latencies:
+            line += ''.join(f"{value:>9.2f}" for value in percentiles(latencies).values())
+        print(f"{line}{failed:>8}")
+
+
+class SlowMedia(BaseHTTPRequestHandler):
+    """A stand-in for the media host that answers every thumbnail check after a delay.
+
+    Even ids have a thumbnail. The class attributes count the checks and the most
+    that were in flight at the same time.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    delay = 1.0
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+    checks = 0
+
+    def answer(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.checks += 1
+            cls.peak = max(cls.peak, cls.in_flight)
+        try:
+            time.sleep(cls.delay)
+            obj_id = self.path.rstrip('/').rsplit('/', 1)[-1]
+            self.send_response(200 if obj_id.isdigit() and int(obj_id) % 2 == 0 else 404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    do_HEAD = do_GET = answer
+
+    def log_message(self, *args):
+        pass
+
+
+class SlowMediaServer(ThreadingHTTPServer):
+    """Serves SlowMedia, queueing as many connections as the servers under test open.
+
+    With socketserver's default backlog of 5 most checks would be refused at once
+    instead of waiting for the delay.
+    """
+
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def slow_media(args):
+    """Measures object page throughput of the threaded and ASGI servers with a slow media host."""
+    media = SlowMediaServer(('127.0.0.1', 0), SlowMedia)
+    SlowMedia.delay = args.delay
+    threading.Thread(target=media.serve_forever, daemon=True).start()
+    env = {**os.environ,
+           'LUX_THUMBNAIL_URL': f'http://127.0.0.1:{media.server_port}/thumbnail/{{}}'}
+
+    with closing(connect(luxdb.DATABASE_URL, uri=True)) as conn:
+        # more ids than a run requests, so that every check misses the probe's cache
+        paths = [f"/obj/{row[0]}" for row in conn.execute(
+            "SELECT id FROM objects ORDER BY id LIMIT ?", (args.objects,))]
+
+    print(f"media host delay {args.delay} s, {args.clients} client processes x "
+          f"{args.concurrency} threads, {args.duration} s per run")
+    print(f"{'server':<12}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'failed':>8}"
+          f"{'checks':>8}{'peak in flight':>16}")
+    modes = {'threaded': '--production', 'asgi': '--asgi'}
+    for offset, mode in enumerate(args.modes):
+        SlowMedia.checks = SlowMedia.peak = 0
+        server = start_server(args.port, [modes[mode], '--workers', str(args.workers),
+                                          '--threads', str(args.threads)], env)
+        try:
+            url = f'http://127.0.0.1:{args.port}'
+            # each run requests other ids than the previous one
+            run_paths = paths[offset::len(args.modes)]
+            with ProcessPoolExecutor(args.clients) as pool:
+                results = list(pool.map(load_client, *zip(*[
+                    (url, run_paths[client::args.clients], args.duration, args.concurrency)
+                    for client in range(args.clients)])))
+        finally:
+            server.terminate()
+            server.wait()
+        latencies = [latency for result in results for latency in result[0]]
+        failed = sum(result[1] for result in results)
+        line = f"{mode:<12}{len(latencies) / args.duration:>9.1f}"
+        if latencies:
+            line += ''.join(f"{value:>9.2f}" for value in percentiles(latencies).values())
+        print(f"{line}{failed:>8}{SlowMedia.checks:>8}{SlowMedia.peak:>16}")
+    media.shutdown()
+
+
+def build_parser():
+    """Creates the argument parser for every benchmark."""
+    parser = argparse.ArgumentParser(description='YUAG search benchmarks', allow_abbrev=False)
+    benchmarks = parser.add_subparsers(dest='benchmark', required=True)
+
+    names = benchmarks.add_parser('name-filters', allow_abbrev=False,
+                                  help='agent/classifier filters: LIKE versus trigram index')
+    names.add_argument('--terms', nargs='+', default=['a', 'an', 'smith', 'john', 'zzzz'],
+                       help='the substrings to search for')
+    names.add_argument('--repeat', type=int, default=5, help='runs per measurement')
+    names.set_defaults(handler=name_filters)
+
+    plan = benchmarks.add_parser('query-plan', allow_abbrev=False,
+                                 help='check that searches scan the filtered join once')
+    plan.add_argument('--verbose', action='store_true', help='print every plan')
+    plan.set_defaults(handler=query_plan)
+
+    pooled = benchmarks.add_parser('connections', allow_abbrev=False,
+                                   help='per-request latency with fresh versus pooled connections')
+    pooled.add_argument('--term', default='bowl', help='the label searched for')
+    pooled.add_argument('--requests', type=int, default=100,
+                        help='number of object detail requests per run')
+    pooled.add_argument('--repeat', type=int, default=20, help='runs per measurement')
+    pooled.set_defaults(handler=connections)
+
+    detail = benchmarks.add_parser('details', allow_abbrev=False,
+                                   help='object detail loading, single versus batched')
+    detail.add_argument('--requests', type=int, default=200,
+                        help='number of objects loaded per run')
+    detail.add_argument('--repeat', type=int, default=10, help='runs of the batch measurement')
+    detail.set_defaults(handler=details)
+
+    table = benchmarks.add_parser('search-table', allow_abbrev=False,
+                                  help='searches: joins versus the luxsearch table')
+    table.add_argument('--terms', nargs='+', default=['a', 'bo', 'smith', '19', 'zzzz'],
+                       help='the substrings to search for in each field')
+    table.add_argument('--page-size', type=int, default=50, help='rows per search')
+    table.add_argument('--repeat', type=int, default=5, help='runs per measurement')
+    table.set_defaults(handler=search_table)
+
+    first = benchmarks.add_parser('first-row', allow_abbrev=False,
+                                  help='/search time to first row, rendered versus streamed')
+    first.add_argument('--term', default='a', help='the broad term searched for')
+    first.add_argument('--repeat', type=int, default=9, help='runs per measurement')
+    first.set_defaults(handler=first_row)
+
+    records = benchmarks.add_parser('hits', allow_abbrev=False,
+                                    help='memory and build time of Object versus SearchHit')
+    records.add_argument('--term', default='a', help='the label searched for')
+    records.add_argument('--rows', type=int, default=1000, help='rows in the result set')
+    records.add_argument('--repeat', type=int, default=20, help='runs per measurement')
+    records.set_defaults(handler=hits)
+
+    runs = benchmarks.add_parser('suite', allow_abbrev=False,
+                                 help='percentiles of representative workloads')
+    runs.add_argument('--repeat', type=int, default=50, help='runs per workload')
+    runs.add_argument('--page-size', type=int, default=50, help='rows per search')
+    runs.add_argument('--save', metavar='PATH', help='write the results to a JSON file')
+    runs.add_argument('--baseline', metavar='PATH',
+                      help='compare with results saved by an earlier --save')
+    runs.set_defaults(handler=suite)
+
+    slow = benchmarks.add_parser('slow-queries', allow_abbrev=False,
+                                 help='per-variant SQL statistics of every search variant')
+    slow.add_argument('--threshold-ms', type=float, default=100,
+                      help='explain and print statements taking at least this long')
+    slow.add_argument('--page-size', type=int, default=50, help='rows per search page')
+    slow.add_argument('--repeat', type=int, default=3, help='runs of each variant')
+    slow.add_argument('--width', type=int, default=40,
+                      help='characters of each statement to print')
+    slow.add_argument('--verbose', action='store_true',
+                      help='print the plan of every variant that had a slow statement')
+    slow.set_defaults(handler=slow_queries)
+
+    serving = benchmarks.add_parser('load', allow_abbrev=False,
+                                    help='throughput of the production server by worker count')
+    serving.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+                         help='the worker counts to measure')
+    serving.add_argument('--threads', type=int, default=4, help='threads per worker')
+    serving.add_argument('--clients', type=int, default=4, help='client processes')
+    serving.add_argument('--concurrency', type=int, default=16,
+                         help='request threads per client process')
+    serving.add_argument('--duration', type=float, default=10, help='seconds per run')
+    serving.add_argument('--port', type=int, default=8765, help='port of the server')
+    serving.set_defaults(handler=load)
+
+    media = benchmarks.add_parser('slow-media', allow_abbrev=False,
+                                  help='object page throughput with a slow media host')
+    media.add_argument('--modes', nargs='+', choices=['threaded', 'asgi'],
+                       default=['threaded', 'asgi'], help='the servers to measure')
+    media.add_argument('--delay', type=float, default=1.0,
+                       help='seconds the media host takes to answer a thumbnail check')
+    media.add_argument('--workers', type=int, default=2, help='worker processes')
+    media.add_argument('--threads', type=int, default=4,
+                       help='request threads per threaded worker, SQLite threads per ASGI worker')
+    media.add_argument('--clients', type=int, default=4, help='client processes')
+    media.add_argument('--concurrency', type=int, default=50,
+                       help='request threads per client process')
+    media.add_argument('--duration', type=float, default=10, help='seconds per run')
+    media.add_argument('--objects', type=int, default=20000,
+                       help='distinct object pages requested')
+    media.add_argument('--port', type=int, default=8765, help='port of the server')
+    media.set_defaults(handler=slow_media)
+
+    return parser
+
+
+def main(argv=None):
+    """Parses the command line and runs the requested benchmark."""
+    args = build_parser().parse_args(argv)
+    try:
+        args.handler(args)
+    except Exception as error:
+        print(f"Error: {error}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
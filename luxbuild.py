@@ -0,0 +1,182 @@
+"""
+Optimized read-only snapshots of lux.sqlite.
+
+The raw database has no indexes on its join tables, so every search and
+detail page joins through productions, objects_classifiers and the other
+link tables by scanning them. `python lux.py build RAW` copies the raw
+database, drops indexes made redundant by its own, adds a covering index on
+each join column the queries of ps1lux and luxdetails look up and on the
+sort key of search results, gathers ANALYZE statistics for the planner and
+writes the snapshot with VACUUM INTO, which stores every table and index
+contiguously in key order with PAGE_SIZE byte pages.
+
+Before the snapshot replaces the output file, the EXPLAIN QUERY PLAN of
+every search variant and of the detail query is checked to not scan any
+join table in full; a build failing the check leaves the output untouched.
+The label index and search table sidecars record the file they were built
+from, so they must be rebuilt after a new snapshot is deployed.
+"""
+import json
+import os
+import re
+from contextlib import closing
+from sqlite3 import connect
+
+from luxdb import DATABASE_PATH, indexed_columns
+from luxdetails import DETAILS_QUERY
+from trigram import TrigramIndex
+import ps1lux
+
+# pages of 8 KiB halve the depth of the larger indexes compared with SQLite's default 4 KiB
+PAGE_SIZE = 8192
+
+# the covering index of each join column the queries look up, by name; references
+# keeps its text out of the index, rowid order within obj_id already gives ORDER BY id
+INDEXES = {
+    'lux_productions_obj': ('productions', ('obj_id', 'agt_id', 'part')),
+    'lux_productions_agt': ('productions', ('agt_id', 'obj_id')),
+    'lux_objects_classifiers_obj': ('objects_classifiers', ('obj_id', 'cls_id')),
+    'lux_objects_classifiers_cls': ('objects_classifiers', ('cls_id', 'obj_id')),
+    'lux_objects_places_obj': ('objects_places', ('obj_id', 'pl_id')),
+    'lux_objects_departments_obj': ('objects_departments', ('obj_id', 'dep_id')),
+    'lux_references_obj': ('references', ('obj_id',)),
+    'lux_agents_nationalities_agt': ('agents_nationalities', ('agt_id', 'nat_id')),
+    # ps1lux.SORT_KEY, plus label and date for the LIKE filters: searches walk objects
+    # in result order and stop at the LIMIT instead of joining every row and sorting
+    'lux_objects_sort': ('objects', ("IFNULL(label, '')", "IFNULL(date, '')", 'label', 'date')),
+}
+
+JOIN_TABLES = ('productions', 'objects_classifiers', 'objects_places', 'objects_departments',
+               'references', 'agents_nationalities')
+
+FULL_SCAN = re.compile(r'^SCAN ({})\b'.format('|'.join(JOIN_TABLES)))
+
+
+def redundant_indexes(connection):
+    """Returns the names of the indexes whose columns lead one of INDEXES on the same table.
+
+    Indexes SQLite creates for UNIQUE and PRIMARY KEY constraints are never redundant.
+    """
+    covering = INDEXES.values()
+    names = []
+    for table in {table for table, _ in covering}:
+        for _, name, _, origin, _ in connection.execute(
+                "SELECT * FROM pragma_index_list(?)", (table,)):
+            if origin != 'c' or name in INDEXES:
+                continue
+            columns = tuple(row[2] for row in connection.execute(
+                "SELECT * FROM pragma_index_info(?) ORDER BY seqno", (name,)))
+            if any(table == other and columns == keys[:len(columns)]
+                   for other, keys in covering):
+                names.append(name)
+    return names
+
+
+def search_variants():
+    """Yields a name and the terms of every ps1lux.search_variants() for both name paths."""
+    for terms in ps1lux.search_variants():
+        fields = ','.join(field for field, term in terms.items() if term) or '(none)'
+        for names in (True, False):
+            yield f"{fields} {'name index' if names else 'LIKE'}", terms, names
+
+
+def query_plans(connection, path):
+    """Yields the name and EXPLAIN QUERY PLAN steps of every query searches and details run.
+
+    Args:
+        connection: An open connection to the database at path.
+        path (str): Path of the database, whose indexes select the search variant.
+    """
+    indexed = indexed_columns(connection, path)
+    name_indexes = {table: TrigramIndex(connection.execute(f"SELECT id, name FROM {table}"))
+                    for table in ('agents', 'classifiers')}
+    after = {'after_label': 'a', 'after_date': '', 'after_id': 0}
+
+    def explain(query, params):
+        return [row[3] for row in connection.execute('EXPLAIN QUERY PLAN ' + query, params)]
+
+    for variant, terms, names in search_variants():
+        filters, params = ps1lux.get_filters(name_indexes=name_indexes if names else None,
+                                             indexed_columns=indexed, **terms)
+        yield f"search {variant}", explain(ps1lux.create_query(filters), params)
+        yield f"next page {variant}", explain(ps1lux.create_query(filters, seek=True),
+                                              {**params, **after})
+        yield f"candidates {variant}", explain(
+            f"SELECT DISTINCT objects.id{ps1lux.OBJECTS_JOIN}{filters}"
+            f" LIMIT {ps1lux.CANDIDATE_LIMIT + 1}", params)
+    yield 'details', explain(DETAILS_QUERY, {'ids': json.dumps([1, 2, 3])})
+
+
+def verify(path):
+    """Checks that no query of the searches or the detail page scans a join table in full.
+
+    Args:
+        path (str): Path of the database to check.
+
+    Returns:
+        tuple: The number of queries checked, and a list of (query name, full scan steps)
+            for every query that failed the check.
+    """
+    checked = 0
+    failures = []
+    with closing(connect(f'file:{path}?mode=ro', uri=True)) as conn:
+        for name, plan in query_plans(conn, path):
+            checked += 1
+            scans = [step for step in plan if FULL_SCAN.match(step)]
+            if scans:
+                failures.append((name, scans))
+    return checked, failures
+
+
+def build(database, output=DATABASE_PATH, page_size=PAGE_SIZE):
+    """Writes an optimized snapshot of a raw lux.sqlite database.
+
+    Args:
+        database (str): Path of the raw database, which is only read.
+        output (str): Path of the snapshot to create or replace; may be database itself.
+        page_size (int): Page size of the snapshot, a power of two from 512 to 65536.
+
+    Returns:
+        dict: The indexes created and dropped, the number of query plans checked
+            and the size of the snapshot.
+    """
+    if page_size < 512 or page_size > 65536 or page_size & (page_size - 1):
+        raise ValueError(f"page size {page_size} is not a power of two from 512 to 65536")
+
+    stage_path = f"{output}.stage"
+    temp_path = f"{output}.tmp"
+    for path in (stage_path, temp_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    try:
+        # index a private copy, the raw database stays untouched
+        with closing(connect(f'file:{database}?mode=ro', uri=True)) as conn:
+            conn.execute("VACUUM INTO ?", (stage_path,))
+
+        with closing(connect(stage_path)) as conn:
+            dropped = redundant_indexes(conn)
+            for name in dropped:
+                conn.execute(f'DROP INDEX "{name}"')
+            for name, (table, columns) in INDEXES.items():
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {name}'
+                             f' ON "{table}" ({", ".join(columns)})')
+            conn.execute("ANALYZE")
+            conn.commit()
+            # the copy written by VACUUM INTO takes the new page size
+            conn.execute(f"PRAGMA page_size = {int(page_size)}")
+            conn.execute("VACUUM INTO ?", (temp_path,))
+
+        checked, failures = verify(temp_path)
+        if failures:
+            details = '\n'.join(f"    {name}: {'; '.join(scans)}" for name, scans in failures)
+            raise RuntimeError(f"{len(failures)} of {checked} query plans scan a join table "
+                               f"in full, {output} was not replaced:\n{details}")
+        os.replace(temp_path, output)
+    finally:
+        for path in (stage_path, temp_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    return {'indexes': list(INDEXES), 'dropped': dropped, 'checked': checked,
+            'size': os.path.getsize(output), 'page_size': page_size}
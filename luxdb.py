@@ -0,0 +1,368 @@
+"""
+Shared read-only connections to the collection database.
+
+Opening lux.sqlite for every request throws away SQLite's page cache and the
+prepared statement cache. Instead, ps1lux, luxdetails and runserver lease
+long-lived connections from a pool:
+
+    with luxdb.connection() as conn:
+        conn.execute(...)
+
+A leased connection is used by exactly one thread until it is returned, so
+connections are opened with check_same_thread=False and can be reused by the
+new thread Flask's threaded server starts for each request. Connections are
+health checked when leased and reopened when lux.sqlite is replaced.
+
+With replicate(), a database file is copied into memory with SQLite's backup
+API, and connections opened through read_url(), including the pool's, read
+the copy instead of the file.
+"""
+import itertools
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing, contextmanager
+
+DATABASE_PATH = 'lux.sqlite'
+DATABASE_URL = f'file:{DATABASE_PATH}?mode=ro'
+
+DEFAULT_SETTINGS = {
+    'cached_statements': 128,       # prepared statements kept per connection
+    'cache_size': -32768,           # page cache per connection, negative means KiB
+    'mmap_size': 256 * 1024 * 1024, # bytes of the database file to memory-map
+    'query_only': True,
+    'max_idle': 16,                 # idle connections kept open, 0 disables pooling
+    'health_check_interval': 30,    # seconds between liveness checks of a connection
+}
+
+_indexed_columns = {}
+_local = threading.local()
+_replicas = {}
+_replica_names = itertools.count(1)
+
+
+def file_signature(path):
+    """Returns a string identifying the current contents of a file."""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class FileWatch:
+    """Tells whether a file changed, for state that is derived from its contents.
+
+    Not thread-safe; callers check it with their own lock held.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.signature = None
+
+    def changed(self):
+        """Returns True if the file changed since the last call, or on the first call.
+
+        A missing file counts as a signature of its own.
+        """
+        try:
+            signature = file_signature(self.path)
+        except OSError:
+            signature = None
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        return True
+
+
+def indexed_columns(connection, path=DATABASE_PATH):
+    """Returns the 'table.column' names that lead an index in the database.
+
+    The answer is memoized until the database file changes.
+    """
+    key = file_signature(path)
+    if key not in _indexed_columns:
+        query = ("SELECT m.name || '.' || info.name FROM sqlite_schema AS m"
+                 " JOIN pragma_index_list(m.name) AS list"
+                 " JOIN pragma_index_info(list.name) AS info"
+                 " WHERE m.type = 'table' AND info.seqno = 0")
+        _indexed_columns.clear()
+        _indexed_columns[key] = frozenset(row[0] for row in connection.execute(query))
+    return _indexed_columns[key]
+
+
+def is_interrupted(error):
+    """Checks whether an exception is SQLite reporting a statement cancelled by interrupt()."""
+    return isinstance(error, sqlite3.OperationalError) and str(error) == 'interrupted'
+
+
+@contextmanager
+def lease_observer(callback):
+    """Reports the connections this thread leases while the with block runs.
+
+    callback(conn, True) is called when a connection is leased and
+    callback(conn, False) just before it goes back to the pool, so the
+    observer can safely interrupt() the connections it currently holds.
+    """
+    previous = getattr(_local, 'observer', None)
+    _local.observer = callback
+    try:
+        yield
+    finally:
+        _local.observer = previous
+
+
+class Replica:
+    """An in-memory copy of a database file, shared by every connection of the process.
+
+    The copy is an SQLite memdb database, which lives as long as a connection
+    to it is open; the replica holds one. It is reloaded when the file changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.url = None
+        self.signature = None
+        self.size = 0
+        self.load_seconds = 0.0
+        self._holder = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Loads the file, unless the copy is current, and returns the URL of the copy."""
+        with self._lock:
+            signature = file_signature(self.path)
+            if signature != self.signature:
+                self._load(signature)
+            return self.url
+
+    def _load(self, signature):
+        # a new name per load, so connections to the previous copy keep reading it
+        url = f'file:/lux-replica-{next(_replica_names)}?vfs=memdb'
+        start = time.perf_counter()
+        holder = sqlite3.connect(url, uri=True, check_same_thread=False)
+        try:
+            with closing(sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)) as source:
+                source.backup(holder)
+            page_count = holder.execute("PRAGMA page_count").fetchone()[0]
+            page_size = holder.execute("PRAGMA page_size").fetchone()[0]
+        except Exception:
+            holder.close()
+            raise
+        old, self._holder = self._holder, holder
+        self.url, self.signature = url, signature
+        self.size = page_count * page_size
+        self.load_seconds = time.perf_counter() - start
+        if old is not None:
+            old.close()
+
+
+def replicate(path=DATABASE_PATH):
+    """Copies a database file into memory for every connection opened through read_url().
+
+    Returns:
+        Replica: The loaded copy.
+    """
+    replica = _replicas.setdefault(path, Replica(path))
+    replica.refresh()
+    return replica
+
+
+def read_url(path):
+    """Returns the URI to open a database file read-only, its in-memory copy if replicated."""
+    replica = _replicas.get(path)
+    if replica is None:
+        return f'file:{path}?mode=ro'
+    return replica.refresh()
+
+
+class LuxConnection(sqlite3.Connection):
+    """A pooled connection that remembers which database file it was opened on."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.signature = None
+        self.checked_at = 0.0
+        # per-connection data for modules using the pool, e.g. attached sidecars
+        self.state = {}
+        # the class of the cursors cursor() creates, e.g. querylog.LoggedCursor
+        self.cursor_factory = sqlite3.Cursor
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or self.cursor_factory)
+
+
+class ConnectionPool:
+    """A pool of read-only connections to one database."""
+
+    def __init__(self, url=DATABASE_URL, path=DATABASE_PATH, **settings):
+        unknown = set(settings) - set(DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown connection settings: {', '.join(sorted(unknown))}")
+        self.url = url
+        self.path = path
+        self.settings = {**DEFAULT_SETTINGS, **settings}
+        self._idle = []
+        self._lock = threading.Lock()
+        self._setup = []
+        self.opened = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def add_setup(self, function):
+        """Registers a function to call with every newly opened connection."""
+        self._setup.append(function)
+
+    def _open(self):
+        settings = self.settings
+        replica = _replicas.get(self.path)
+        url = replica.refresh() if replica is not None else self.url
+        conn = sqlite3.connect(url, uri=True, isolation_level=None,
+                               check_same_thread=False, factory=LuxConnection,
+                               cached_statements=settings['cached_statements'])
+        try:
+            conn.execute(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+            conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+            conn.execute(f"PRAGMA query_only = {'ON' if settings['query_only'] else 'OFF'}")
+            # of the file the replica was loaded from, so that the connection is
+            # replaced, and the replica reloaded, when the file changes
+            conn.signature = replica.signature if replica is not None else file_signature(self.path)
+            conn.checked_at = time.monotonic()
+            for function in self._setup:
+                function(conn)
+        except Exception:
+            conn.close()
+            raise
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def _healthy(self, conn):
+        """Checks that a connection still works and is open on the current file."""
+        try:
+            if conn.signature != file_signature(self.path):
+                return False
+            now = time.monotonic()
+            if now - conn.checked_at > self.settings['health_check_interval']:
+                conn.execute("SELECT 1").fetchone()
+                conn.checked_at = now
+            return True
+        except (OSError, sqlite3.Error):
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self.discarded += 1
+        try:
+            conn.close()
+        except sqlite3.Error as error:
+            print(f"Error closing database connection: {error}", file=sys.stderr)
+
+    def acquire(self):
+        """Leases a healthy connection, opening one if none is idle."""
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._open()
+            if self._healthy(conn):
+                with self._lock:
+                    self.reused += 1
+                return conn
+            self._discard(conn)
+
+    def release(self, conn):
+        """Returns a leased connection to the pool."""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.settings['max_idle']:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Leases a connection for the duration of a with block."""
+        conn = self.acquire()
+        observer = getattr(_local, 'observer', None)
+        if observer is not None:
+            observer(conn, True)
+        broken = False
+        try:
+            yield conn
+        except sqlite3.DatabaseError as error:
+            # the connection may be unusable, do not hand it out again
+            broken = not is_interrupted(error)
+            raise
+        finally:
+            if observer is not None:
+                observer(conn, False)
+            if broken:
+                self._discard(conn)
+            else:
+                self.release(conn)
+
+    def warm_up(self, count=1):
+        """Opens connections ahead of the first requests."""
+        conns = [self.acquire() for _ in range(count)]
+        for conn in conns:
+            self.release(conn)
+
+    def close_all(self):
+        """Closes every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        """Returns counters describing the pool's activity."""
+        with self._lock:
+            return {'idle': len(self._idle), 'opened': self.opened,
+                    'reused': self.reused, 'discarded': self.discarded}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_setup = []
+
+
+def get_pool():
+    """Returns the process-wide pool, creating it with the default settings on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+            for function in _setup:
+                _pool.add_setup(function)
+        return _pool
+
+
+def configure(**settings):
+    """Replaces the process-wide pool with one using the given settings.
+
+    Args:
+        settings: Overrides of DEFAULT_SETTINGS, plus optionally url and path.
+    """
+    global _pool
+    pool = ConnectionPool(**settings)
+    for function in _setup:
+        pool.add_setup(function)
+    with _pool_lock:
+        old, _pool = _pool, pool
+    if old is not None:
+        old.close_all()
+    return pool
+
+
+def add_setup(function):
+    """Registers a function to call with every connection the process-wide pool opens."""
+    _setup.append(function)
+    with _pool_lock:
+        if _pool is not None:
+            _pool.add_setup(function)
+
+
+def connection():
+    """Leases a connection from the process-wide pool, for use in a with statement."""
+    return get_pool().connection()
@@ -2,12 +2,13 @@
 Module for displaying details from the Lux Database.
 """
 import argparse
+import json
 import sys
 from contextlib import closing
-from sqlite3 import connect, DatabaseError, Error
+from sqlite3 import DatabaseError, Error
 from object import Object
-
-DATABASE_URL = 'file:lux.sqlite?mode=ro'
+import luxdb
+import timing
 
 def main():
     """Main function to display object details."""
@@ -18,14 +19,9 @@ def main():
     object_id = args.id[0]
 
     try:
-        with connect(DATABASE_URL, isolation_level=None, uri=True) as conn:
+        with luxdb.connection() as conn:
             with closing(conn.cursor()) as cur:
-                # validate_id(object_id, cur)
-                display_summary(object_id, cur)
-                display_label(object_id, cur)
-                display_production_details(object_id, cur)
-                display_classifications(object_id, cur)
-                display_references(object_id, cur)
+                obj = load_details([object_id], cur).get(object_id)
 
     except DatabaseError as db_err:
         print(f"Database Error: {db_err}", file=sys.stderr)
@@ -35,210 +31,197 @@ def main():
         print(f"Error: {e_err}", file=sys.stderr)
         sys.exit(1)
 
-def display_summary(object_id, cur):
-    """Display summary of the object identified by the given ID."""
-    query = '''
-        SELECT 
-            objects.accession_no,
-            objects.date,
-            GROUP_CONCAT(places.label, ', ') AS places,
-            departments.name AS department_name
-        FROM 
-            objects
-        LEFT JOIN 
-            objects_places ON objects.id = objects_places.obj_id
-        LEFT JOIN 
-            places ON objects_places.pl_id = places.id
-        LEFT JOIN 
-            objects_departments ON objects.id = objects_departments.obj_id
-        LEFT JOIN 
-            departments ON objects_departments.dep_id = departments.id
-        WHERE 
-            objects.id = ?
-        GROUP BY 
-            objects.id
-    '''
-
-    cur.execute(query, (object_id,))
-    result = cur.fetchall()
-    # headers = ["Accession Number", "Date", "Places", "Department"]
-
-    # return Table(headers, result)
-    return result
-
-# def print_title_table(title):
-#     """Print a title table with the given title."""
-#     # print(Table([title], [[' ']]))
-
-# def return_title_table(title):
-#     """Print a title table with the given title."""
-#     # return Table([title], [[' ']])
-
-def display_label(object_id, cur):
-    """Display label of the object identified by the given ID."""
-    query = 'SELECT label FROM objects WHERE objects.id = ?'
-    cur.execute(query, (object_id,))
-    result = cur.fetchone()
-    # if result:
-    #     table = Table(['Label'], [[result[0]]])
-    #     return table
-    #     return "No label found for the provided Object ID."
-    return result
-
-def display_production_details(object_id, cur):
-    """Display production details of the object identified by the given ID."""
-    query = '''
-        SELECT
-            productions.part,
-            agents.name,
-            agents.begin_date,
-            agents.end_date,
-            GROUP_CONCAT(nationalities.descriptor, '\n') AS nationalities
-        FROM
-            productions
-        INNER JOIN
-            agents ON productions.agt_id = agents.id
-        LEFT JOIN
-            agents_nationalities ON agents.id = agents_nationalities.agt_id
-        LEFT JOIN
-            nationalities ON agents_nationalities.nat_id = nationalities.id
-        WHERE 
-            productions.obj_id = ?
-        GROUP BY 
-            productions.part, agents.name, agents.begin_date, agents.end_date
-        ORDER BY 
-            agents.name ASC, productions.part ASC, nationalities.descriptor ASC
-    '''
-
-    cur.execute(query, (object_id,))
-    results = get_production_results(cur)
-    # headers = ["Part", "Name", "Nationalities", "Timespan"]
-    # return Table(headers, results)
-    return results
+    if obj is None:
+        print(f"Error: object with id {object_id} does not exist", file=sys.stderr)
+        sys.exit(1)
 
-def get_production_results(cur):
-    """Get production results from the cursor."""
-    initial_results = cur.fetchall()
+    print(f"Accession no.: {obj.get_acc_no()}")
+    print(f"Date: {obj.get_date()}")
+    print(f"Place: {obj.get_place()}")
+    print(f"Department: {obj.get_dept()}")
+    print(f"Label: {obj.get_label()}")
+    for part, name, nationalities, timespan in obj.get_productions():
+        print(f"Produced by: {part} {name} {nationalities} {timespan}")
+    print(f"Classified as: {', '.join(obj.get_classifiers())}")
+    for ref_type, content in obj.get_references():
+        print(f"{ref_type}: {content}")
+
+# Every section of the detail page for a set of object ids, one row per object.
+# Each join table is filtered to the requested ids and aggregated per object,
+# so the statement costs the same number of table visits for 1 or N ids.
+DETAILS_QUERY = '''
+    WITH ids(id) AS (
+        SELECT DISTINCT value FROM json_each(:ids)
+    ),
+    places_of AS (
+        SELECT objects_places.obj_id, GROUP_CONCAT(places.label, ', ') AS places
+        FROM objects_places
+        JOIN places ON objects_places.pl_id = places.id
+        WHERE objects_places.obj_id IN (SELECT id FROM ids)
+        GROUP BY objects_places.obj_id
+    ),
+    departments_of AS (
+        SELECT objects_departments.obj_id, departments.name
+        FROM objects_departments
+        JOIN departments ON objects_departments.dep_id = departments.id
+        WHERE objects_departments.obj_id IN (SELECT id FROM ids)
+        GROUP BY objects_departments.obj_id
+    ),
+    productions_of AS (
+        SELECT obj_id, JSON_GROUP_ARRAY(JSON_ARRAY(part, name, begin_date, end_date,
+                                                   nationalities)) AS productions
+        FROM (
+            SELECT productions.obj_id, productions.part, agents.name,
+                   agents.begin_date, agents.end_date,
+                   GROUP_CONCAT(nationalities.descriptor, char(10)) AS nationalities
+            FROM productions
+            JOIN agents ON productions.agt_id = agents.id
+            LEFT JOIN agents_nationalities ON agents.id = agents_nationalities.agt_id
+            LEFT JOIN nationalities ON agents_nationalities.nat_id = nationalities.id
+            WHERE productions.obj_id IN (SELECT id FROM ids)
+            GROUP BY productions.obj_id, productions.part, agents.name,
+                     agents.begin_date, agents.end_date
+            ORDER BY productions.obj_id, agents.name, productions.part
+        )
+        GROUP BY obj_id
+    ),
+    classifiers_of AS (
+        SELECT objects_classifiers.obj_id,
+               GROUP_CONCAT(classifiers.name, ', ') AS classifiers
+        FROM objects_classifiers
+        LEFT JOIN classifiers ON objects_classifiers.cls_id = classifiers.id
+        WHERE objects_classifiers.obj_id IN (SELECT id FROM ids)
+        GROUP BY objects_classifiers.obj_id
+    ),
+    references_of AS (
+        SELECT obj_id, JSON_GROUP_ARRAY(JSON_ARRAY("type", "content")) AS refs
+        FROM (
+            SELECT obj_id, "type", "content"
+            FROM "references"
+            WHERE obj_id IN (SELECT id FROM ids)
+            ORDER BY obj_id, id
+        )
+        GROUP BY obj_id
+    )
+    SELECT objects.id, objects.accession_no, objects.date, places_of.places,
+           departments_of.name, objects.label, productions_of.productions,
+           classifiers_of.classifiers, references_of.refs
+    FROM ids
+    JOIN objects ON objects.id = ids.id
+    LEFT JOIN places_of ON places_of.obj_id = objects.id
+    LEFT JOIN departments_of ON departments_of.obj_id = objects.id
+    LEFT JOIN productions_of ON productions_of.obj_id = objects.id
+    LEFT JOIN classifiers_of ON classifiers_of.obj_id = objects.id
+    LEFT JOIN references_of ON references_of.obj_id = objects.id
+'''
+
+def production_details(productions):
+    """Converts the JSON production rows of an object to (part, name, nationalities, timespan)."""
     results = []
-    for row in initial_results:
-        beginning_year = str(row[2].split('-')[0]) if row[2] else ''
-        ending_year = str(row[3].split('-')[0]) if row[3] else ''
+    for part, name, begin_date, end_date, nationalities in json.loads(productions or '[]'):
+        beginning_year = str(begin_date.split('-')[0]) if begin_date else ''
+        ending_year = str(end_date.split('-')[0]) if end_date else ''
         timespan = beginning_year + '' + ending_year if ending_year else beginning_year + ''
-        results.append((row[0], row[1], row[4], timespan))
-
-    # if not results:
-    #     results = [["-", "No Production Details found", "-", "-"]]
+        results.append((part, name, nationalities, timespan))
     return results
 
-def display_classifications(object_id, cur):
-    """Retrieve and display classifications of the object identified by the given ID."""
-    query = ('SELECT GROUP_CONCAT(classifiers.name, ", ") '
-             'FROM objects_classifiers '
-              'LEFT JOIN classifiers ON objects_classifiers.cls_id = classifiers.id '
-              'WHERE objects_classifiers.obj_id = ? '
-              'GROUP BY objects_classifiers.obj_id '
-              'ORDER BY classifiers.name ASC')
-
-    cur.execute(query, (object_id,))
-    result = cur.fetchall()
-    class_data = []
-
-    if result and result[0][0]:
-        classifications = result[0][0].split(", ")
-        class_data = list(classifications)
-    # else:
-    #     class_data = [["No Classification found"]]
+def classification_names(classifiers):
+    """Converts the concatenated classifier names of an object to a sorted, capitalized list."""
+    class_data = classifiers.split(", ") if classifiers else []
     capitalized_data = [element.capitalize() for element in class_data]
     capitalized_data.sort()
-    print(capitalized_data)
-
-    # table = Table(['Classified As'], class_data)
     return capitalized_data
 
+def detail_object(obj_id, acc_no, date, place, dep, label, productions, classifiers, references):
+    """Creates the Object of a row returned by DETAILS_QUERY."""
+    return Object(obj_id=obj_id, acc_no=acc_no, date=date, place=place, dept=dep, label=label,
+                  productions=production_details(productions),
+                  classifiers=classification_names(classifiers),
+                  references=[tuple(ref) for ref in json.loads(references or '[]')])
 
-def display_references(object_id, cur):
-    """Display reference information of the object identified by the given ID."""
-    query = '''
-            SELECT "type", "content" 
-            FROM "references" 
-            WHERE obj_id = ?
-            ORDER BY id
-            '''
-
-    cur.execute(query, (object_id,))
-    result = cur.fetchall()
-    # headers = ["Type", "Content"]
-
-    if not result:
-        return "No data found"
-    return result
+def load_details(object_ids, cur):
+    """
+    Fetches every detail section of a set of objects with a single statement.
 
+    Args:
+        object_ids (iterable of int): The ids of the objects to load.
+        cur: A cursor on the database.
 
-def fetch_data(query, object_id, cur):
-    """Execute a given query and return the result."""
-    cur.execute(query, (object_id,))
-    return cur.fetchall()
+    Returns:
+        dict: Maps the id of every object that exists to its Object instance.
+    """
+    with timing.phase('sql'):
+        cur.execute(DETAILS_QUERY, {'ids': json.dumps([int(obj_id) for obj_id in object_ids])})
+        rows = cur.fetchall()
+    with timing.phase('rows'):
+        return {row[0]: detail_object(*row) for row in rows}
 
 def format_entry_results2(object_id):
     """
     Retrieve detailed information about an object from the database based on the given object_id.
 
-    This function establishes a connection to the database and fetches various details about
-    the object corresponding to the provided object_id. The details include summary, label,
-    production details, classifications, and references.
+    This function leases a connection to the database and fetches the details of the
+    object corresponding to the provided object_id with load_details. The details include
+    summary, label, production details, classifications, and references.
 
     Args:
         object_id (int): The unique identifier of the object for which the details are to get.
 
     Returns:
-        Object: An instance of the Object class populated with the retrieved details.
+        Object: An instance of the Object class populated with the retrieved details, or
+        None if no object has the given id.
 
     Raises:
         Any exceptions raised during database connection, query execution, data retrieval, or
         object instantiation will be propagated.
 
     Note:
-        The database connection and cursor are closed automatically after execution due
-        to the use of context managers.
+        The database connection is leased from the luxdb pool and returned to it, and
+        the cursor is closed, automatically after execution due to the use of context
+        managers.
 
     Example:
         result_obj = format_entry_results2(1234)
     """
-    # create a connection to the database
-    with connect(DATABASE_URL, isolation_level=None, uri=True) as connection:
+    try:
+        object_id = int(object_id)
+    except ValueError:
+        return None
+
+    # lease a connection to the database
+    with luxdb.connection() as connection:
         # create a cursor for the database
         with closing(connection.cursor()) as cur:
+            return load_details([object_id], cur).get(object_id)
 
-            # Validate object ID
-            # validate_id(object_id, cur)
-
-            # Dictionary to store data retrieval functions and their respective labels
-            data_retrieval_functions = {
-                'summary': display_summary,
-                'label': display_label,
-                'prod': display_production_details,
-                'classifications': display_classifications,
-                'ref': display_references
-            }
-
-            # Dictionary to store results
-            results = {}
-
-            for key, function in data_retrieval_functions.items():
-                results[key] = function(object_id, cur)
+def format_entry_results_batch(object_ids):
+    """
+    Retrieve the details of several objects from the database at once.
 
-            #error handling if object id does not exist
-            if not results.get('summary'):
-                return None
+    Like format_entry_results2, but every object is loaded by the same single statement of
+    load_details, so the number of SQL statements does not grow with the number of ids.
 
-            # Extract values from the results dictionary
-            acc_no, date, place, dep = results['summary'][0]
-            label = results['label'][0]
-            prod = results['prod']
-            classifications = results['classifications']
-            ref = results['ref']
+    Args:
+        object_ids (iterable): The ids of the objects, as ints or strings of digits.
 
-            obj = Object(obj_id=object_id, acc_no=acc_no, date=date, place=place, dept=dep,
-                        label=label, productions=prod, classifiers=classifications, references=ref)
+    Returns:
+        dict: Maps the id of every object that exists to its Object instance, in the order
+        the ids were given. Duplicate ids, ids that are not integers and ids of objects that
+        do not exist are left out.
 
-            return obj
+    Example:
+        result_objs = format_entry_results_batch([1234, 1235])
+    """
+    ids = []
+    for object_id in object_ids:
+        try:
+            ids.append(int(object_id))
+        except ValueError:
+            continue
+    if not ids:
+        return {}
+
+    with luxdb.connection() as connection:
+        with closing(connection.cursor()) as cur:
+            objects = load_details(ids, cur)
+    return {obj_id: objects[obj_id] for obj_id in dict.fromkeys(ids) if obj_id in objects}
@@ -0,0 +1,129 @@
+"""
+Optional full-text index over objects.label.
+
+`python lux.py build-label-index` writes a sidecar database next to
+lux.sqlite with an FTS5 trigram index of every label, plus a table of the
+one- and two-character substrings of each label for terms too short for
+trigrams. Labels are stored case-folded like SQLite's LOWER(), which only
+folds ASCII letters, and matched case-sensitively, so the index matches the
+same labels as LIKE. When the sidecar is present and was built from the current
+database, ps1lux.search attaches it and resolves the label filter to object
+ids through the index instead of scanning objects with LIKE.
+"""
+from contextlib import closing
+from sqlite3 import connect
+
+from luxdb import DATABASE_PATH, indexed_columns
+from sidecar import Sidecar, staged
+from trigram import fold_case
+
+LABEL_INDEX = 'lux_fts.sqlite'
+SCHEMA_NAME = 'fts'
+
+# layout of the sidecar, sidecars of another layout are rebuilt
+FORMAT = '2'
+
+# how the index is used: SEEK drives the search from the matching ids, SCAN
+# walks objects and only tests membership, for databases whose join tables
+# have no obj_id index to seek into
+SEEK = 'seek'
+SCAN = 'scan'
+
+LABEL_SIDECAR = Sidecar(LABEL_INDEX, SCHEMA_NAME, 'label index', {'format': FORMAT})
+JOIN_COLUMNS = frozenset(('productions.obj_id', 'objects_classifiers.obj_id'))
+
+
+def short_grams(label):
+    """Returns every distinct one- and two-character substring of a label, case-folded."""
+    text = fold_case(label)
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def build(database=DATABASE_PATH, output=LABEL_INDEX):
+    """Builds the label index sidecar from a lux.sqlite database.
+
+    Args:
+        database (str): Path of the source database.
+        output (str): Path of the sidecar database to create.
+    """
+    with staged(output) as temp_path, closing(connect(temp_path)) as conn:
+        conn.execute("ATTACH DATABASE ? AS src", (f'file:{database}?mode=ro',))
+        conn.executescript('''
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE VIRTUAL TABLE labels USING fts5(label, content='',
+                                                tokenize='trigram case_sensitive 1');
+            CREATE TABLE label_grams (gram TEXT, obj_id INTEGER,
+                                      PRIMARY KEY (gram, obj_id)) WITHOUT ROWID;
+        ''')
+        conn.execute("INSERT INTO labels (rowid, label) "
+                     "SELECT id, LOWER(label) FROM src.objects WHERE label IS NOT NULL")
+
+        with closing(conn.cursor()) as cur:
+            cur.execute("SELECT id, label FROM src.objects WHERE label IS NOT NULL")
+            while True:
+                rows = cur.fetchmany(10000)
+                if not rows:
+                    break
+                conn.executemany("INSERT INTO label_grams VALUES (?, ?)",
+                                 [(gram, obj_id) for obj_id, label in rows
+                                  for gram in short_grams(label)])
+
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", LABEL_SIDECAR.meta_rows(database))
+        conn.execute("INSERT INTO labels (labels) VALUES ('optimize')")
+        conn.commit()
+        conn.execute("DETACH DATABASE src")
+        conn.execute("VACUUM")
+
+
+def is_current(database=DATABASE_PATH, index=LABEL_INDEX):
+    """Checks that the sidecar exists and was built from the current database.
+
+    The answer is memoized until either file changes.
+    """
+    return LABEL_SIDECAR.is_current(database, index)
+
+
+def attach(connection, database=DATABASE_PATH, index=LABEL_INDEX):
+    """Attaches the label index to a connection when it is usable.
+
+    Args:
+        connection: An open sqlite3 connection to the database opened with uri=True.
+
+    Returns:
+        SEEK or SCAN if the index was attached as schema SCHEMA_NAME, otherwise None.
+    """
+    if not LABEL_SIDECAR.attach(connection, database, index):
+        return None
+    return SEEK if JOIN_COLUMNS <= indexed_columns(connection, database) else SCAN
+
+
+def label_filter(term, mode=SEEK):
+    """Translates a label search term into an index lookup.
+
+    Terms of three or more characters become an FTS5 trigram phrase query,
+    which matches the same case-insensitive substrings as LIKE. Shorter terms
+    are looked up in the gram table. Terms containing the LIKE wildcards % or
+    _ cannot be expressed against the index.
+
+    Args:
+        term (str): The label search term.
+        mode (str): SEEK or SCAN, as returned by attach().
+
+    Returns:
+        tuple: (SQL condition on objects.id using the :l parameter, parameter value),
+               or None if the term has to be matched with LIKE.
+    """
+    if '%' in term or '_' in term:
+        return None
+    term = fold_case(term)
+    # unary + stops SQLite from driving the joins from the id list
+    column = 'objects.id' if mode == SEEK else '+objects.id'
+    if len(term) >= 3:
+        condition = (f"{column} IN (SELECT rowid FROM {SCHEMA_NAME}.labels"
+                     " WHERE labels MATCH :l)")
+        return condition, '"' + term.replace('"', '""') + '"'
+    condition = (f"{column} IN (SELECT obj_id FROM {SCHEMA_NAME}.label_grams"
+                 " WHERE gram = :l)")
+    return condition, term
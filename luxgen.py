@@ -0,0 +1,200 @@
+"""
+Synthetic collection databases for benchmarking.
+
+The real lux.sqlite is not distributed, so `python lux.py generate-database`
+writes a database with the same schema, filled with generated objects, for
+reproducible measurements of searches and detail lookups at any scale. Words
+in labels and names are drawn from Zipf-like distributions, so a few terms
+match a large share of the collection and most match only a few objects, as
+in real catalogue data. The same seed and size always give the same database.
+"""
+import itertools
+import os
+import random
+from contextlib import closing
+from sqlite3 import connect
+
+SCHEMA = '''
+    CREATE TABLE objects (id INTEGER PRIMARY KEY, accession_no TEXT, date TEXT, label TEXT);
+    CREATE TABLE agents (id INTEGER PRIMARY KEY, name TEXT, begin_date TEXT, end_date TEXT);
+    CREATE TABLE productions (obj_id INTEGER, agt_id INTEGER, part TEXT);
+    CREATE TABLE nationalities (id INTEGER PRIMARY KEY, descriptor TEXT);
+    CREATE TABLE agents_nationalities (agt_id INTEGER, nat_id INTEGER);
+    CREATE TABLE classifiers (id INTEGER PRIMARY KEY, name TEXT);
+    CREATE TABLE objects_classifiers (obj_id INTEGER, cls_id INTEGER);
+    CREATE TABLE departments (id INTEGER PRIMARY KEY, name TEXT);
+    CREATE TABLE objects_departments (obj_id INTEGER, dep_id INTEGER);
+    CREATE TABLE places (id INTEGER PRIMARY KEY, label TEXT);
+    CREATE TABLE objects_places (obj_id INTEGER, pl_id INTEGER);
+    CREATE TABLE "references" (id INTEGER PRIMARY KEY, obj_id INTEGER, type TEXT, content TEXT);
+'''
+
+LABEL_WORDS = '''
+    untitled portrait vase bowl landscape study cup figure head coin print
+    chair spoon mask sketch plate dish jar bottle textile fragment ring seal
+    woman man child horse saint madonna river mountain harbor city street
+    still life flowers interior garden tree boat bridge church temple house
+    view of with and the in at from after near on two three
+'''.split()
+
+LABEL_STYLES = ['{}', '{} {}', '{} of {}', '{} with {}', '{} {} {}', 'The {} {}', '{} in {}']
+
+CLASSIFIERS = '''
+    paintings prints drawings photographs coins sculpture ceramics furniture
+    textiles metalwork glass jewelry manuscripts books medals seals tools
+    vessels costume arms armor musical instruments toys frames ornaments
+'''.split()
+
+FIRST_NAMES = '''
+    john mary william elizabeth james anne thomas margaret george sarah charles
+    henry jane robert catherine edward frances richard alice joseph emma samuel
+    hans pierre jean marie giovanni maria carlo anna jan pieter akira hiroshi
+'''.split()
+
+LAST_NAMES = '''
+    smith johnson brown taylor miller wilson moore white harris martin thompson
+    clark lewis walker hall allen young king wright hill scott green adams baker
+    nelson carter mitchell roberts turner phillips campbell parker evans edwards
+    collins stewart morris rogers reed cook morgan bell murphy bailey rivera
+    dupont martin bernard rossi bianchi mueller schmidt de vries jansen tanaka
+'''.split()
+
+PARTS = ['artist', 'maker', 'designer', 'engraver', 'printer', 'publisher', 'workshop']
+NATIONALITIES = ['American', 'British', 'French', 'Italian', 'Dutch', 'German', 'Japanese',
+                 'Chinese', 'Spanish', 'Flemish', 'Greek', 'Roman', 'Egyptian', 'Mexican']
+DEPARTMENTS = ['American Decorative Arts', 'American Paintings and Sculpture',
+               'Ancient Art', 'Art of Africa', 'Art of the Ancient Americas', 'Asian Art',
+               'Coins and Medals', 'European Art', 'Modern and Contemporary Art',
+               'Photography', 'Prints and Drawings']
+REFERENCE_TYPES = ['Bibliography', 'Exhibition', 'Provenance', 'Credit Line']
+
+# rows written per executemany call
+BATCH = 10000
+
+
+class Zipf:
+    """Draws items so that the item of rank r is about 1/r as likely as the first."""
+
+    def __init__(self, items, rng):
+        self.items = items
+        self.rng = rng
+        self.weights = list(itertools.accumulate(1 / rank for rank in range(1, len(items) + 1)))
+
+    def draw(self, count=1):
+        """Returns count items drawn with replacement."""
+        return self.rng.choices(self.items, cum_weights=self.weights, k=count)
+
+
+def _dates(rng):
+    """Returns a date string in one of the forms found in catalogue records, or None."""
+    year = int(rng.triangular(-500, 2020, 1880))
+    form = rng.random()
+    if form < 0.05:
+        return None
+    if year <= 0:
+        return f"{1 - year} B.C.E."
+    if form < 0.6:
+        return str(year)
+    if form < 0.75:
+        return f"ca. {year}"
+    if form < 0.9:
+        return f"{year}–{year + rng.randint(1, 30)}"
+    return f"{year // 100 * 100}s"
+
+
+def _batches(rows):
+    """Splits an iterator of rows into lists of up to BATCH rows."""
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, BATCH))
+        if not batch:
+            return
+        yield batch
+
+
+def generate(path, objects=10000, seed=0):
+    """Writes a synthetic database with the schema of lux.sqlite.
+
+    Args:
+        path (str): The database file to create; it must not exist.
+        objects (int): The number of objects; agents are a fifth of that.
+        seed (int): Seed of the random generator.
+    """
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+    rng = random.Random(seed)
+    label_words = Zipf(LABEL_WORDS, rng)
+    classifier_ids = Zipf(list(range(1, len(CLASSIFIERS) + 1)), rng)
+    first_names = Zipf(FIRST_NAMES, rng)
+    last_names = Zipf(LAST_NAMES, rng)
+    agent_count = max(10, objects // 5)
+    # a few prolific agents produce most objects
+    agent_ids = Zipf(list(range(1, agent_count + 1)), rng)
+
+    def agent_rows():
+        for agt_id in range(1, agent_count + 1):
+            begin = rng.randint(1400, 1990)
+            end = begin + rng.randint(20, 90) if rng.random() < 0.8 else None
+            name = f"{first_names.draw()[0].title()} {last_names.draw()[0].title()}"
+            if rng.random() < 0.1:
+                name = f"{name} Workshop"
+            yield (agt_id, name, f"{begin}-01-01",
+                   f"{end}-12-31" if end is not None and end < 2024 else None)
+
+    def object_rows():
+        for obj_id in range(1, objects + 1):
+            if rng.random() < 0.02:
+                label = None
+            else:
+                style = rng.choice(LABEL_STYLES)
+                label = style.format(*label_words.draw(style.count('{}'))).capitalize()
+            yield (obj_id, f"{rng.randint(1832, 2024)}.{rng.randint(1, 999)}.{obj_id}",
+                   _dates(rng), label)
+
+    def join_rows(per_object, draw):
+        for obj_id in range(1, objects + 1):
+            # distinct values in drawing order, so that the output is reproducible
+            for value in dict.fromkeys(draw() for _ in range(per_object())):
+                yield (obj_id, *value) if isinstance(value, tuple) else (obj_id, value)
+
+    with closing(connect(path)) as conn:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executescript(SCHEMA)
+
+        conn.executemany("INSERT INTO nationalities VALUES (?, ?)",
+                         enumerate(NATIONALITIES, 1))
+        conn.executemany("INSERT INTO classifiers VALUES (?, ?)", enumerate(CLASSIFIERS, 1))
+        conn.executemany("INSERT INTO departments VALUES (?, ?)", enumerate(DEPARTMENTS, 1))
+        conn.executemany("INSERT INTO places VALUES (?, ?)",
+                         [(place_id, f"{last_names.draw()[0].title()}ville")
+                          for place_id in range(1, 501)])
+
+        inserts = [
+            ("INSERT INTO agents VALUES (?, ?, ?, ?)", agent_rows()),
+            ("INSERT INTO agents_nationalities VALUES (?, ?)",
+             ((agt_id, rng.randint(1, len(NATIONALITIES))) for agt_id in range(1, agent_count + 1)
+              if rng.random() < 0.9)),
+            ("INSERT INTO objects VALUES (?, ?, ?, ?)", object_rows()),
+            # most objects have one maker, some several and a few none
+            ("INSERT INTO productions VALUES (?, ?, ?)",
+             join_rows(lambda: rng.choices((0, 1, 2, 3), (2, 80, 14, 4))[0],
+                       lambda: (agent_ids.draw()[0], rng.choice(PARTS)))),
+            ("INSERT INTO objects_classifiers VALUES (?, ?)",
+             join_rows(lambda: rng.choices((1, 2, 3), (70, 25, 5))[0],
+                       lambda: classifier_ids.draw()[0])),
+            ("INSERT INTO objects_departments VALUES (?, ?)",
+             join_rows(lambda: 1, lambda: rng.randint(1, len(DEPARTMENTS)))),
+            ("INSERT INTO objects_places VALUES (?, ?)",
+             join_rows(lambda: rng.choices((0, 1, 2), (30, 60, 10))[0],
+                       lambda: rng.randint(1, 500))),
+            ('INSERT INTO "references" (obj_id, type, content) VALUES (?, ?, ?)',
+             join_rows(lambda: rng.choices((0, 1, 2, 4), (40, 35, 15, 10))[0],
+                       lambda: (rng.choice(REFERENCE_TYPES),
+                                f"{last_names.draw()[0].title()}, {rng.randint(1900, 2023)}, "
+                                f"p. {rng.randint(1, 400)}"))),
+        ]
+        for statement, rows in inserts:
+            for batch in _batches(rows):
+                conn.executemany(statement, batch)
+            conn.commit()
@@ -0,0 +1,190 @@
+"""
+Optional denormalized search table.
+
+`python lux.py build-search-table` writes a sidecar database next to
+lux.sqlite with one row per searchable object: its label and date, the
+agent and classifier strings search results display, already aggregated
+and sorted, lower-cased copies of every searched column and the sort key.
+When the sidecar is present and was built from the current database,
+ps1lux.search attaches it and answers a search with one scan of this table,
+which is stored in sort key order, instead of joining objects, productions,
+agents and classifiers and aggregating the matches.
+"""
+import json
+from contextlib import closing
+from sqlite3 import connect
+
+from luxdb import DATABASE_PATH
+from sidecar import Sidecar, staged
+
+SEARCH_TABLE = 'lux_search.sqlite'
+SCHEMA_NAME = 'search'
+
+# joins the names of an object's agents and classifiers in the search columns,
+# so that a term without it can only match within one name
+SEPARATOR = '\x1f'
+
+# ids per run of the search query while building
+BUILD_BATCH = 1000
+
+SEARCH_SIDECAR = Sidecar(SEARCH_TABLE, SCHEMA_NAME, 'search table')
+
+
+def build(database=DATABASE_PATH, output=SEARCH_TABLE):
+    """Builds the search table sidecar from a lux.sqlite database.
+
+    Args:
+        database (str): Path of the source database.
+        output (str): Path of the sidecar database to create.
+    """
+    # the displayed columns come from the query searches run without the
+    # sidecar, so both paths return identical rows
+    import ps1lux
+
+    with staged(output) as temp_path, \
+            closing(connect(f'file:{database}?mode=ro', uri=True)) as conn:
+        conn.execute("ATTACH DATABASE ? AS out", (temp_path,))
+        conn.executescript('''
+            CREATE TABLE out.meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE out.hits (
+                id INTEGER NOT NULL,
+                label TEXT,
+                date TEXT,
+                agent_info TEXT,
+                class TEXT,
+                label_key TEXT NOT NULL,
+                date_key TEXT NOT NULL,
+                label_lc TEXT,
+                date_lc TEXT,
+                agents_lc TEXT,
+                classifiers_lc TEXT,
+                PRIMARY KEY (label_key, date_key, id)
+            ) WITHOUT ROWID;
+            CREATE TEMP TABLE agent_names (obj_id INTEGER PRIMARY KEY, names TEXT);
+            CREATE TEMP TABLE classifier_names (obj_id INTEGER PRIMARY KEY, names TEXT);
+        ''')
+
+        # every agent and classifier name a search can match, per object
+        conn.execute(f'''
+            INSERT INTO agent_names
+            SELECT productions.obj_id,
+                   '{SEPARATOR}' || GROUP_CONCAT(LOWER(agents.name), '{SEPARATOR}')
+            FROM productions JOIN agents ON productions.agt_id = agents.id
+            GROUP BY productions.obj_id
+        ''')
+        conn.execute(f'''
+            INSERT INTO classifier_names
+            SELECT objects_classifiers.obj_id,
+                   '{SEPARATOR}' || GROUP_CONCAT(LOWER(classifiers.name), '{SEPARATOR}')
+            FROM objects_classifiers
+            JOIN classifiers ON objects_classifiers.cls_id = classifiers.id
+            GROUP BY objects_classifiers.obj_id
+        ''')
+
+        # the search query aggregates a page of matches at a time, so run it
+        # without a limit over ranges of ids of about that size
+        query = ps1lux.create_query(" WHERE objects.id BETWEEN :low AND :high", limit=-1)
+        first, last = conn.execute("SELECT MIN(id), MAX(id) FROM objects").fetchone()
+        for low in range(first or 0, (last or -1) + 1, BUILD_BATCH):
+            conn.execute(f'''
+                INSERT INTO out.hits
+                SELECT results.object_id, results.label, results.date, results.agent_info,
+                       results.class, IFNULL(results.label, ''), IFNULL(results.date, ''),
+                       LOWER(results.label), LOWER(results.date), agent_names.names,
+                       classifier_names.names
+                FROM ({query}) AS results
+                JOIN agent_names ON agent_names.obj_id = results.object_id
+                JOIN classifier_names ON classifier_names.obj_id = results.object_id
+            ''', {'low': low, 'high': low + BUILD_BATCH - 1})
+        conn.execute("CREATE UNIQUE INDEX out.hits_id ON hits (id)")
+        conn.executemany("INSERT INTO out.meta VALUES (?, ?)",
+                         SEARCH_SIDECAR.meta_rows(database))
+        conn.commit()
+        conn.execute("ANALYZE out")
+        conn.commit()
+        conn.execute("VACUUM out")
+
+
+def is_current(database=DATABASE_PATH, table=SEARCH_TABLE):
+    """Checks that the sidecar exists and was built from the current database.
+
+    The answer is memoized until either file changes.
+    """
+    return SEARCH_SIDECAR.is_current(database, table)
+
+
+def attach(connection, database=DATABASE_PATH, table=SEARCH_TABLE):
+    """Attaches the search table to a connection when it is usable.
+
+    Args:
+        connection: An open sqlite3 connection to the database opened with uri=True.
+
+    Returns:
+        bool: True if the sidecar was attached as schema SCHEMA_NAME.
+    """
+    return SEARCH_SIDECAR.attach(connection, database, table)
+
+
+def get_filters(label, classification, agent, date, within=None):
+    """Creates the filters of a search against the search table.
+
+    Terms are matched as case-insensitive substrings like the LIKE filters
+    of ps1lux.get_filters, and must already be lower-cased. Agent and
+    classifier terms containing the LIKE wildcards % or _ could match across
+    two names of the concatenated columns, so they cannot use the table.
+
+    Args:
+        label, classification, agent, date: The lower-cased search terms.
+        within (set): Object ids the results are restricted to, or None.
+
+    Returns:
+        tuple: (filter string, parameters) for create_query, or None if the
+               search has to run against lux.sqlite.
+    """
+    for term in (agent, classification):
+        if term and ('%' in term or '_' in term or SEPARATOR in term):
+            return None
+
+    filters = " WHERE 1=1"
+    params = {}
+    if within is not None:
+        filters += " AND id IN (SELECT value FROM json_each(:within))"
+        params['within'] = json.dumps(sorted(within))
+    for column, key, term in (('agents_lc', 'a', agent),
+                              ('classifiers_lc', 'c', classification)):
+        if term:
+            filters += f" AND instr({column}, :{key}) > 0"
+            params[key] = term
+    for column, key, term in (('date_lc', 'd', date), ('label_lc', 'l', label)):
+        if term and ('%' in term or '_' in term):
+            filters += f" AND {column} LIKE :{key}"
+            params[key] = f"%{term}%"
+        elif term:
+            filters += f" AND instr({column}, :{key}) > 0"
+            params[key] = term
+    return filters, params
+
+
+def create_query(filters, limit, seek=False):
+    """Creates a search query against the search table.
+
+    Returns the same columns in the same order as ps1lux.create_query, with
+    the same optional seek past the :after_label, :after_date and :after_id
+    sort key.
+
+    Args:
+        filters (string): The filter string from get_filters.
+        limit (int): The maximum number of rows to return.
+        seek (bool): Whether to return only rows after the :after_* sort key.
+
+    Returns:
+        query (string): The query to be executed.
+    """
+    query = "SELECT id, label, agent_info, date, class"
+    query += f" FROM {SCHEMA_NAME}.hits"
+    query += filters
+    if seek:
+        query += " AND (label_key, date_key, id) > (:after_label, :after_date, :after_id)"
+    query += " ORDER BY label_key, date_key, id"
+    query += f" LIMIT {int(limit)}"
+    return query
@@ -0,0 +1,174 @@
+"""
+Request handling shared by the Flask app in luxapp and the ASGI app in luxasync.
+
+Both apps serve /, /search and /obj/<obj_id> from the same templates. The
+functions here read the request's arguments and cookies, pick the template
+and its variables, and set the cookies of the response; each app only adds
+how it runs the database work and renders. Flask and Quart requests and
+responses share werkzeug's interface, and both frameworks answer the
+HTTPException raised by abort().
+"""
+import json
+import uuid
+
+from werkzeug.exceptions import abort
+
+from ps1lux import normalize_terms, search_page
+
+# rows per /search page; further pages are requested as the user scrolls
+SEARCH_PAGE_SIZE = 50
+
+# the ids SQLite can bind, signed 64-bit integers
+MIN_ROWID, MAX_ROWID = -2 ** 63, 2 ** 63 - 1
+
+
+def search_terms(args):
+    """
+    Reads the search terms of a /search request.
+
+    :param args: The query arguments of the request.
+    :return: The (label, classifier, agent, date) terms, '' for a missing one.
+    """
+    return tuple(args.get(name, default='') for name in ('l', 'c', 'a', 'd'))
+
+def saved_search(cookies):
+    """
+    Reads the terms of the client's previous search from its search_parameters cookie.
+
+    :param cookies: The cookies of the request.
+    :return: The (label, classifier, agent, date) terms, or None without a readable cookie.
+    """
+    try:
+        saved = json.loads(cookies.get('search_parameters') or 'null')
+    except ValueError:
+        return None
+    if not isinstance(saved, dict):
+        return None
+    return tuple(str(saved.get(name) or '') for name in ('label', 'classifier', 'agent', 'date'))
+
+def index_context(terms, objects):
+    """
+    Creates the variables of index.html.
+
+    :param terms: The terms of the previous search, or None if there was none.
+    :param objects: The first page of results of the previous search, or None.
+    :return: A dict of template variables.
+    """
+    label, classifier, agent, date = terms or ('', '', '', '')
+    error_message = "No results found for the last search." if terms and not objects else ''
+    return {'label': label, 'classifier': classifier, 'agent': agent, 'date': date,
+            'objects': objects, 'error_message': error_message}
+
+def client_id(cookies):
+    """
+    Identifies the client, so that refining searches can reuse its previous candidates.
+
+    :param cookies: The cookies of the request.
+    :return: The client_id cookie, or a new random id for a new client.
+    """
+    return cookies.get('client_id') or uuid.uuid4().hex
+
+def parse_cursor(value):
+    """
+    Parses the keyset pagination cursor of a /search request.
+
+    :param value: The JSON encoded [label, date, id] cursor, or None for the first page.
+    :return: The cursor as a tuple, or None. Aborts with 400 unless label and date are
+             strings or null and id is a 64-bit integer.
+    """
+    if value is None:
+        return None
+    try:
+        cursor = json.loads(value)
+    except ValueError:
+        cursor = None
+    if (isinstance(cursor, list) and len(cursor) == 3
+            and all(key is None or isinstance(key, str) for key in cursor[:2])
+            and type(cursor[2]) is int and MIN_ROWID <= cursor[2] <= MAX_ROWID):
+        return tuple(cursor)
+    abort(400, description="Error: malformed search cursor")
+
+def flight_key(terms, after):
+    """
+    Identifies identical searches, which share one execution.
+
+    :param terms: The (label, classifier, agent, date) terms.
+    :param after: The cursor of the page.
+    :return: A hashable key.
+    """
+    return normalize_terms(*terms) + (after,)
+
+def run_search(incremental_search, client, terms, after):
+    """
+    Fetches one page of a search.
+
+    :param incremental_search: The app's IncrementalSearch, or None to search in full.
+    :param client: The id of the client making the search.
+    :param terms: The (label, classifier, agent, date) terms.
+    :param after: The cursor of the page, None for the first page.
+    :return: The (objects, next cursor) of ps1lux.search_page.
+    """
+    if incremental_search is not None:
+        return incremental_search.search_page(client, *terms, after, SEARCH_PAGE_SIZE)
+    return search_page(*terms, after, SEARCH_PAGE_SIZE)
+
+def search_template(request, terms, after, objects):
+    """
+    Picks the template of a /search response and its variables.
+
+    :param request: The request.
+    :param terms: The (label, classifier, agent, date) terms.
+    :param after: The cursor of the page, None for the first page.
+    :param objects: The objects of the page.
+    :return: The (template name, template variables) to render.
+    """
+    if after is not None:
+        # a later page only contributes rows to the table already on the page
+        return 'search_rows.html', {'objects': objects}
+    if not any(terms) and not request.cookies.get('search_parameters'):
+        error_message = "No search terms provided. Please enter some search terms."
+        return 'search_results.html', {'error_message': error_message}
+    return 'search_results.html', {'objects': objects}
+
+def finish_search(request, response, client, next_after=None):
+    """
+    Sends the cursor of the next page, stores the search parameters in a cookie, and gives
+    new clients an id.
+
+    :param request: The request.
+    :param response: The response to set the header and cookies on.
+    :param client: The id to give a new client, a random one if None.
+    :param next_after: The cursor of the next page, None if this is the last page.
+    """
+    if next_after is not None:
+        response.headers['X-Next-After'] = json.dumps(next_after)
+    search_params = {'label': request.args.get('l', default=''),
+                     'classifier': request.args.get('c', default=''),
+                     'agent': request.args.get('a', default=''),
+                     'date': request.args.get('d', default='')}
+    response.set_cookie('search_parameters', json.dumps(search_params))
+    if 'client_id' not in request.cookies:
+        response.set_cookie('client_id', client or uuid.uuid4().hex, httponly=True)
+
+def object_id(value):
+    """
+    Parses the object id of an /obj/<obj_id> request.
+
+    :param value: The id from the path.
+    :return: The id as an int. Aborts with 404 if it is not a non-negative integer.
+    """
+    try:
+        obj_id = int(value)
+    except ValueError:
+        obj_id = -1
+    if obj_id < 0:
+        missing_object(value)
+    return obj_id
+
+def missing_object(value):
+    """
+    Aborts with 404 for an object id that has no object.
+
+    :param value: The requested id.
+    """
+    abort(404, description=f"Error: object with id {value} does not exist")
@@ -2,7 +2,7 @@
 Object class for Yale University Art Gallery Item.
 """
 
-import requests
+import thumbnails
 
 class Object:
     def __init__(self, obj_id=None, acc_no=None, date=None, place=None, dept=None, label=None,
@@ -13,17 +13,7 @@ class Object:
         self._place = place
         self._dept = dept
         self._label = label
-        self._image_exists = False  # Initialize the flag as False
-
-        # Construct URL only if obj_id is not None
-        if obj_id:
-            url = f"https://media.collections.yale.edu/thumbnail/yuag/obj/{obj_id}"
-            response = requests.get(url, allow_redirects=True)
-            if response.status_code == 200:
-                self._url = url
-                self._image_exists = True  # Set the flag to True if the image exists
-            else:
-                self._url = None
+        self._image_exists = None  # Resolved lazily by has_image()
 
         self._agents = agents or []
         self._classifiers = classifiers or []
@@ -34,11 +24,29 @@ class Object:
         """
         Determines if the object has an associated image URL that exists.
 
+        The thumbnail host is only consulted the first time this is called, so
+        objects that are never rendered with an image cost no network I/O. An
+        answer is not remembered while the thumbnail host cannot be reached.
+
         Returns:
             bool: True if the object has a valid obj_id and the image exists, otherwise False.
         """
+        if self._image_exists is None:
+            exists = bool(self._id) and thumbnails.has_thumbnail(self._id)
+            if exists is None:
+                return False
+            self._image_exists = exists
         return self._image_exists
 
+    def set_has_image(self, exists):
+        """
+        Records whether the object has an image, so that has_image() does not probe for it.
+
+        Args:
+            exists (bool): The result of a thumbnail check made elsewhere, e.g. asynchronously.
+        """
+        self._image_exists = bool(exists)
+
 
     def get_id(self):
         """Returns the unique identifier of the object."""
@@ -79,3 +87,41 @@ class Object:
     def get_references(self):
         """Returns the list of references associated with the object."""
         return self._references
+
+
+class SearchHit:
+    """
+    A compact search result, with the fields the results table shows.
+
+    Searches build one of these per row instead of a full Object, whose remaining
+    fields only the detail page uses. The names are kept in tuples and the instance
+    has no __dict__, which keeps result pages small in the search cache.
+    """
+    __slots__ = ('_id', '_label', '_date', '_agents', '_classifiers')
+
+    def __init__(self, obj_id, label, date, agents=(), classifiers=()):
+        self._id = obj_id
+        self._label = label
+        self._date = date
+        self._agents = agents
+        self._classifiers = classifiers
+
+    def get_id(self):
+        """Returns the unique identifier of the object."""
+        return self._id
+
+    def get_label(self):
+        """Returns the label of the object."""
+        return self._label
+
+    def get_date(self):
+        """Returns the date associated with the object."""
+        return self._date
+
+    def get_agents(self):
+        """Returns the agents associated with the object, as a tuple."""
+        return self._agents
+
+    def get_classifiers(self):
+        """Returns the classifiers associated with the object, as a tuple."""
+        return self._classifiers
@@ -0,0 +1,141 @@
+"""
+Background prefetch of the object details users open after a search.
+
+Users almost always open one of the first rows of their results. Once a
+search has been answered, the details and thumbnail availability of its top
+rows are loaded on a small background pool into a short-lived cache, so that
+/obj/<obj_id> is served from memory when the row is clicked.
+
+Prefetching yields to the requests users wait for: a client's pending or
+running prefetch is cancelled as soon as it searches again, at most
+max_pending prefetches wait for the pool and more are dropped, and a
+prefetch only runs while the connection pool has an idle connection, so it
+never opens a connection a foreground request would otherwise get.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from luxdetails import format_entry_results_batch
+from resultcache import ResultCache
+import luxdb
+import thumbnails
+
+
+class DetailPrefetcher:
+    """Loads the details of a search's top results ahead of the clicks on them."""
+
+    def __init__(self, top_k=5, workers=1, max_pending=8, ttl=60, max_entries=2000,
+                 max_clients=4096):
+        self.top_k = top_k
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.max_clients = max_clients
+        # Objects keyed by id, with the time they expire; emptied when lux.sqlite changes
+        self.cache = ResultCache(max_entries=max_entries, max_bytes=16 * 1024 * 1024)
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='lux-prefetch')
+        self._jobs = OrderedDict()     # client -> cancellation Event of its latest prefetch
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.scheduled = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.dropped = 0
+
+    def schedule(self, client, object_ids):
+        """Prefetches the first top_k of object_ids for client, replacing its previous prefetch.
+
+        Args:
+            client (str): The client whose search returned the ids.
+            object_ids (iterable of int): The ids of the search results, in order.
+        """
+        ids = list(object_ids)[:self.top_k]
+        cancel = threading.Event()
+        with self._lock:
+            self._cancel(client)
+            if not ids:
+                return
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return
+            self._jobs[client] = cancel
+            self._jobs.move_to_end(client)
+            while len(self._jobs) > self.max_clients:
+                self._jobs.popitem(last=False)
+            self._pending += 1
+            self.scheduled += 1
+        self._executor.submit(self._run, client, ids, cancel)
+
+    def cancel(self, client):
+        """Cancels the pending or running prefetch of client, if any."""
+        with self._lock:
+            self._cancel(client)
+
+    def _cancel(self, client):
+        """Cancels the prefetch of client; call with the lock held."""
+        cancel = self._jobs.pop(client, None)
+        if cancel is not None and not cancel.is_set():
+            cancel.set()
+            self.cancelled += 1
+
+    def _run(self, client, ids, cancel):
+        try:
+            # only use a connection no foreground request is waiting for
+            if cancel.is_set() or not luxdb.get_pool().stats()['idle']:
+                if not cancel.is_set():
+                    with self._lock:
+                        self.dropped += 1
+                return
+            objects = format_entry_results_batch(ids)
+            if cancel.is_set():
+                return
+            # check the thumbnails of every object at once, has_image() then hits the memo
+            thumbnails.get_probe().exists_many(
+                [obj_id for obj_id in objects if thumbnails.indexed(obj_id) is None])
+            if cancel.is_set():
+                return
+            expires = time.monotonic() + self.ttl
+            for obj_id, obj in objects.items():
+                obj.has_image()
+                self.cache.put(obj_id, (obj, expires), detail_size(obj))
+            with self._lock:
+                self.completed += 1
+        except Exception as error:
+            # a failed prefetch only means the click loads the details itself
+            print(f"Prefetch failed for {ids}: {error}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                if self._jobs.get(client) is cancel:
+                    del self._jobs[client]
+
+    def get(self, obj_id):
+        """Returns the prefetched Object with obj_id, or None if it is not cached or expired."""
+        try:
+            obj_id = int(obj_id)
+        except ValueError:
+            return None
+        entry = self.cache.get(obj_id)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def stats(self):
+        """Returns counters of prefetches and of the detail cache."""
+        with self._lock:
+            counters = {'pending': self._pending, 'scheduled': self.scheduled,
+                        'completed': self.completed, 'cancelled': self.cancelled,
+                        'dropped': self.dropped}
+        counters['cache'] = self.cache.stats()
+        return counters
+
+
+def detail_size(obj):
+    """Approximates the number of bytes the details of an object hold."""
+    texts = [obj.get_acc_no(), obj.get_date(), obj.get_place(), obj.get_dept(), obj.get_label(),
+             *obj.get_classifiers()]
+    texts += [text for production in obj.get_productions() for text in production]
+    texts += [text for reference in obj.get_references() for text in reference]
+    return 500 + sum(60 + len(text or '') for text in texts)
@@ -1,45 +1,116 @@
-"""This module provides a command line interface for querying the YUAG database.
-It takes in arguments from the command line and returns a table of results.
-Usage: python lux.py [-d date] [-a agent] [-c classifier] [-l label]"""
-from sys import stderr, exit as sys_exit
+"""This module searches the YUAG database for the Flask and ASGI apps.
+It builds the search queries, pages through their results and caches them.
+It has no command line interface of its own: `python lux.py <command>` runs
+the maintenance commands, `python luxdetails.py ID` prints an object's details,
+`python runserver.py PORT` serves the app and `python luxbench.py <benchmark>`
+measures it."""
+import json
+import os
+from itertools import product
 from contextlib import closing
-from sqlite3 import connect
-from object import Object
+from sqlite3 import sqlite_version_info
+from object import SearchHit
+from resultcache import ResultCache
+from trigram import TrigramIndex, fold_case
+import luxdb
+import luxfts
+import luxsearch
+import timing
+
+# SQLite only accepts the MATERIALIZED hint from 3.35, and materializes a CTE
+# that is used more than once anyway
+MATERIALIZED = 'MATERIALIZED ' if sqlite_version_info >= (3, 35, 0) else ''
+
+# the order of search results, also used as the keyset pagination cursor
+SORT_KEY = "IFNULL(objects.label, ''), IFNULL(objects.date, ''), objects.id"
+SEARCH_LIMIT = 1000
+CANDIDATE_LIMIT = 5000
+# rows fetched from the cursor at a time when streaming results
+STREAM_BATCH = 200
+
+# the tables every search filters on
+OBJECTS_JOIN = " FROM objects"
+OBJECTS_JOIN += " join productions ON objects.id = productions.obj_id"
+OBJECTS_JOIN += " join agents ON productions.agt_id = agents.id"
+OBJECTS_JOIN += " join objects_classifiers ON objects.id = objects_classifiers.obj_id"
+OBJECTS_JOIN += " join classifiers ON objects_classifiers.cls_id = classifiers.id"
+
+# (database signature, {'agents': TrigramIndex, 'classifiers': TrigramIndex})
+_name_indexes = (None, None)
+
+# pages of search results keyed by normalized terms, cursor and page size
+search_cache = ResultCache()
+
+def attach_label_index(connection):
+    """Attaches the luxfts label index to a newly opened pooled connection."""
+    connection.state['label_index'] = luxfts.attach(connection)
+
+luxdb.add_setup(attach_label_index)
+
+def attach_search_table(connection):
+    """Attaches the luxsearch table to a newly opened pooled connection."""
+    connection.state['search_table'] = luxsearch.attach(connection)
+
+luxdb.add_setup(attach_search_table)
+
+def load_replicas():
+    """Copies lux.sqlite and the sidecars searches attach into memory, see luxdb.replicate.
 
-DATABASE_URL = 'file:lux.sqlite?mode=ro'
-
-def get_filter_terms(args):
-    """Creates a filter string and a dictionary of parameters based on the arguments passed in.
-    Args:
-        args: The arguments passed in from the command line.
     Returns:
-        filters (string): The filter string to be used in the query.
-        params (dict): The parameters for the query.
+        list: The luxdb.Replica of every file that exists.
     """
+    return [luxdb.replicate(path)
+            for path in (luxdb.DATABASE_PATH, luxfts.LABEL_INDEX, luxsearch.SEARCH_TABLE)
+            if os.path.exists(path)]
 
-    filters = " WHERE 1=1"
-    params = {}
-    if args.a:
-        filters += ' AND agents.name LIKE :a'
-        params['a'] = f"%{args.a.lower()}%"
-
-    if args.c:
-        filters += ' AND classifiers.name LIKE :c'
-        params['c'] = f"%{args.c.lower()}%"
-
-    if args.d:
-        filters += ' AND date LIKE :d'
-        params['d'] = f"%{args.d}%"
-
-    if args.l:
-        filters += ' AND label LIKE :l'
-        params['l'] = f"%{args.l}%"
-    return filters, params
+def load_name_indexes(connection=None):
+    """Returns trigram indexes over agent and classifier names.
 
-def get_filters(label, classification, agent, date):
+    The indexes are built on first use and rebuilt when the database file changes.
+    Args:
+        connection: An open connection to the database, or None to open one.
+    Returns:
+        dict: TrigramIndex instances keyed by 'agents' and 'classifiers'.
+    """
+    global _name_indexes
+    signature = luxdb.file_signature(luxdb.DATABASE_PATH)
+    if _name_indexes[0] != signature:
+        if connection is None:
+            with luxdb.connection() as conn:
+                return load_name_indexes(conn)
+        indexes = {table: TrigramIndex(connection.execute(f"SELECT id, name FROM {table}"))
+                   for table in ('agents', 'classifiers')}
+        _name_indexes = (signature, indexes)
+    return _name_indexes[1]
+
+def name_filter(index, term, column, key, indexed_columns):
+    """Creates a filter on an id column from a substring of the matching names.
+    Args:
+        index (TrigramIndex): The index over the names.
+        term (string): The substring to look for.
+        column (string): The id column to filter.
+        key (string): The name of the query parameter.
+        indexed_columns (frozenset): Columns leading an index, from luxdb.indexed_columns.
+    Returns:
+        filter (string): The condition to add to the query.
+        value (string): A JSON array of the matching ids.
+    """
+    ids = sorted(index.lookup(term))
+    # without indexes to seek through, SQLite would rescan the join tables once
+    # per matching id, so only test membership (unary + disables seeking)
+    if not {column} | luxfts.JOIN_COLUMNS <= indexed_columns:
+        column = '+' + column
+    return f' AND {column} IN (SELECT value FROM json_each(:{key}))', json.dumps(ids)
+
+def get_filters(label, classification, agent, date, label_index=None, name_indexes=None,
+                indexed_columns=frozenset(), within=None):
     """Creates a filter string and a dictionary of parameters based on the arguments passed in.
     Args:
-        args: The arguments passed in from the command line.
+        label, classification, agent, date: The search terms.
+        label_index (str): How the attached luxfts label index is used, or None.
+        name_indexes (dict): Indexes from load_name_indexes, or None to filter with LIKE.
+        indexed_columns (frozenset): Columns leading an index, from luxdb.indexed_columns.
+        within (set): Object ids the results are restricted to, or None.
     Returns:
         filters (string): The filter string to be used in the query.
         params (dict): The parameters for the query.
@@ -47,64 +118,98 @@ def get_filters(label, classification, agent, date):
 
     filters = " WHERE 1=1"
     params = {}
-    if agent:
+    if within is not None:
+        # same seek-or-test choice as name_filter
+        column = 'objects.id' if luxfts.JOIN_COLUMNS <= indexed_columns else '+objects.id'
+        filters += f' AND {column} IN (SELECT value FROM json_each(:within))'
+        params['within'] = json.dumps(sorted(within))
+    # terms containing LIKE wildcards keep the LIKE path
+    if agent and name_indexes and not ('%' in agent or '_' in agent):
+        condition, params['a'] = name_filter(name_indexes['agents'], agent,
+                                             'productions.agt_id', 'a', indexed_columns)
+        filters += condition
+    elif agent:
         filters += ' AND agents.name LIKE :a'
-        params['a'] = f"%{agent.lower()}%"
-
-    if classification:
+        params['a'] = f"%{fold_case(agent)}%"
+
+    if classification and name_indexes and not ('%' in classification or '_' in classification):
+        condition, params['c'] = name_filter(name_indexes['classifiers'], classification,
+                                             'objects_classifiers.cls_id', 'c',
+                                             indexed_columns)
+        filters += condition
+    elif classification:
         filters += ' AND classifiers.name LIKE :c'
-        params['c'] = f"%{classification.lower()}%"
+        params['c'] = f"%{fold_case(classification)}%"
 
     if date:
         filters += ' AND date LIKE :d'
         params['d'] = f"%{date}%"
 
     if label:
-        filters += ' AND label LIKE :l'
-        params['l'] = f"%{label.lower()}%"
+        indexed = luxfts.label_filter(label, label_index) if label_index else None
+        if indexed:
+            condition, params['l'] = indexed
+            filters += ' AND ' + condition
+        else:
+            filters += ' AND label LIKE :l'
+            params['l'] = f"%{fold_case(label)}%"
     return filters, params
 
-def create_query(filters):
+def create_query(filters, limit=SEARCH_LIMIT, seek=False):
     """Creates a query based on the filters passed in.
+
+    The filtered join is evaluated once into the materialized matches CTE,
+    which is sorted and truncated before agents and classifiers are
+    aggregated for the surviving rows only.
+
+    Results are ordered by the sort key (label, date, id), with NULL label
+    and date sorted as empty strings. With seek, only rows after the key bound
+    to :after_label, :after_date and :after_id are returned, so each page
+    of a keyset-paginated search costs O(limit) given an index on the key.
     Args:
         filters (string): The filter string to be used in the query.
+        limit (int): The maximum number of rows to return.
+        seek (bool): Whether to return only rows after the :after_* sort key.
     Returns:
         query (string): The query to be executed.
     """
 
-    # retrieve the objects that match the filters
+    # retrieve the first objects that match the filters, once
     objects = "SELECT DISTINCT"
-    objects += " objects.id as object_id, objects.label as label, objects.date as date FROM objects"
-    objects += " join productions ON objects.id = productions.obj_id"
-    objects += " join agents ON productions.agt_id = agents.id"
-    objects += " join objects_classifiers ON objects.id = objects_classifiers.obj_id"
-    objects += " join classifiers ON objects_classifiers.cls_id = classifiers.id"
+    objects += " objects.id as object_id, objects.label as label, objects.date as date"
+    objects += OBJECTS_JOIN
     objects += filters
+    if seek:
+        objects += f" AND ({SORT_KEY}) > (:after_label, :after_date, :after_id)"
+    objects += f" ORDER BY {SORT_KEY}"
+    objects += f" LIMIT {int(limit)}"
 
     # create agent info column as a concatenation of agent names and parts
     agents = "SELECT"
-    agents += " object_id as agent_id, label,"
-    agents += " GROUP_CONCAT(DISTINCT names || ' (' || parts || ')|') as agent_info, date FROM"
-    agents += " (SELECT object_id, label, agents.name as names, productions.part as parts, date"
-    agents += " FROM ({}) LEFT join productions ON object_id = productions.obj_id".format(objects)
+    agents += " object_id, GROUP_CONCAT(DISTINCT names || ' (' || parts || ')|') as agent_info FROM"
+    agents += " (SELECT object_id, agents.name as names, productions.part as parts"
+    agents += " FROM matches LEFT join productions ON object_id = productions.obj_id"
     agents += " LEFT join agents ON productions.agt_id = agents.id"
     agents += " ORDER BY LOWER(names), LOWER(parts))"
     agents += " GROUP BY object_id"
 
     # create classifiers column as a concatenation of classifier names
-    classifiers = "SELECT object_id as classifier_id, GROUP_CONCAT(DISTINCT class || '|') as class"
+    classifiers = "SELECT object_id, GROUP_CONCAT(DISTINCT class || '|') as class"
     classifiers += " FROM (SELECT object_id, LOWER(classifiers.name) as class"
-    classifiers += " FROM ({}) join".format(objects)
+    classifiers += " FROM matches join"
     classifiers += " objects_classifiers ON object_id = objects_classifiers.obj_id"
     classifiers += " join classifiers ON objects_classifiers.cls_id = classifiers.id"
-    classifiers += " ORDER BY LOWER(class))"
+    classifiers += " ORDER BY class)"
     classifiers += " GROUP BY object_id"
 
-    # join the tables and order the results
-    query = "SELECT agent_id, label, agent_info, date, class FROM ({})".format(agents)
-    query += " JOIN ({}) ON agent_id=classifier_id".format(classifiers)
-    query += " ORDER BY label, date"
-    query += " LIMIT 1000"
+    # join the aggregates to the matches and order the results
+    query = "WITH matches AS {}({}),".format(MATERIALIZED, objects)
+    query += " agent_info AS ({}),".format(agents)
+    query += " classes AS ({})".format(classifiers)
+    query += " SELECT matches.object_id, label, agent_info, date, class FROM matches"
+    query += " JOIN agent_info ON matches.object_id = agent_info.object_id"
+    query += " JOIN classes ON matches.object_id = classes.object_id"
+    query += " ORDER BY IFNULL(label, ''), IFNULL(date, ''), matches.object_id"
     return query
 
 def execute(query, params):
@@ -116,16 +221,11 @@ def execute(query, params):
         rows (list): The results of the query.
     """
 
-    try:
-        with closing(connect(DATABASE_URL, uri=True)) as conn:
-            with closing(conn.cursor()) as cur:
-                cur.execute(query, params)
-                rows = cur.fetchall()
-                return rows
-
-    except Exception as error:
-        print(error, file=stderr)
-        sys_exit(1)
+    with luxdb.connection() as conn:
+        with closing(conn.cursor()) as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            return rows
 
 def format_query_results(rows):
     """Formats the results of the query.
@@ -150,22 +250,312 @@ def format_query_results(rows):
 
 
 
-def search(label=None, classification=None, agent=None, date=None):
+def normalize_terms(label, classification, agent, date):
+    """Normalizes search terms so that equivalent searches share a cache entry.
+    Args:
+        label, classification, agent, date: The search terms, possibly None.
+    Returns:
+        terms (tuple): The terms trimmed and case-folded with fold_case, with '' for a
+            missing term.
+    """
+    return tuple(fold_case((term or '').strip())
+                 for term in (label, classification, agent, date))
+
+def search_variants():
+    """Yields the filter terms of all 16 combinations of search fields, for plan checks."""
+    sample = {'label': 'a', 'classification': 'a', 'agent': 'a', 'date': '1'}
+    for mask in product((False, True), repeat=len(sample)):
+        yield {field: term if used else None
+               for (field, term), used in zip(sample.items(), mask)}
+
+def result_size(objects):
+    """Approximates the number of bytes a list of search results holds.
+    Args:
+        objects (list): The SearchHit instances of a page.
+    Returns:
+        size (int): The estimate.
+    """
+    size = 100
+    for obj in objects:
+        texts = (obj.get_label(), obj.get_date(), *obj.get_agents(), *obj.get_classifiers())
+        size += 200 + sum(60 + len(text) for text in texts)
+    return size
+
+def connection_filters(connection, label, classification, agent, date, within=None):
+    """Creates the filters for a search using the indexes available to a pooled connection.
+    Args:
+        connection: A connection leased from luxdb.
+        label, classification, agent, date: The search terms.
+        within (set): Object ids the results are restricted to, or None.
+    Returns:
+        filters (string): The filter string to be used in the query.
+        params (dict): The parameters for the query.
+    """
+    return get_filters(label, classification, agent, date,
+                       connection.state['label_index'], load_name_indexes(connection),
+                       luxdb.indexed_columns(connection), within)
+
+def table_filters(connection, label, classification, agent, date, within=None):
+    """Creates the filters for a search against the luxsearch table, if it can be used.
+    Args:
+        connection: A connection leased from luxdb.
+        label, classification, agent, date: The normalized search terms.
+        within (set): Object ids the results are restricted to, or None.
+    Returns:
+        tuple: (filters, params) for luxsearch.create_query, or None to search lux.sqlite.
+    """
+    if not connection.state['search_table']:
+        return None
+    return luxsearch.get_filters(label, classification, agent, date, within)
+
+def candidate_ids(label=None, classification=None, agent=None, date=None,
+                  within=None, limit=CANDIDATE_LIMIT):
     """
-    Search the database for objects based on given criteria to return a list of Object instances.
+    Finds the ids of every object matching the given criteria, if there are few enough.
+
+    Args:
+        label, classification, agent, date (str, optional): The search terms.
+        within (set, optional): Object ids known to contain every match. Defaults to None.
+        limit (int, optional): The most ids to collect. Defaults to 5000.
+
+    Returns:
+        set: The matching ids, or None if there are more than limit of them.
+    """
+    label, classification, agent, date = normalize_terms(label, classification, agent, date)
+    with luxdb.connection() as connection:
+        table = table_filters(connection, label, classification, agent, date, within)
+        if table is not None:
+            filters, params = table
+            query = (f"SELECT id FROM {luxsearch.SCHEMA_NAME}.hits{filters}"
+                     f" LIMIT {int(limit) + 1}")
+        else:
+            filters, params = connection_filters(connection, label, classification,
+                                                 agent, date, within)
+            query = (f"SELECT DISTINCT objects.id{OBJECTS_JOIN}{filters}"
+                     f" LIMIT {int(limit) + 1}")
+        with closing(connection.cursor()) as cursor, timing.phase('sql'):
+            cursor.execute(query, params)
+            ids = {row[0] for row in cursor.fetchall()}
+
+    return ids if len(ids) <= limit else None
+
+def process_row(row):
+    """Creates the SearchHit of a row returned by create_query."""
+    agents = tuple((row[2] or "None").rstrip('|').split('|'))
+    classifiers = tuple((row[4] or "None").rstrip('|').split('|'))
+
+    return SearchHit(
+        obj_id=int(row[0]),
+        label=str(row[1]),
+        date=str(row[3]),
+        agents=agents,
+        classifiers=classifiers
+    )
+
+class SearchPage:
+    """
+    One page of objects matching the given criteria, fetched as it is iterated.
+
+    Nothing is queried until the page is iterated or tested for truth, so a
+    template can stream its first bytes before the search runs and each row as
+    it is read from the cursor. A page can be iterated once; next_after is set
+    once it has been exhausted, and the page is then added to search_cache.
+
+    Args:
+        label, classification, agent, date (str, optional): The search terms.
+        after (tuple, optional): The cursor of the page to fetch, see search_page.
+        page_size (int, optional): Maximum number of objects to return. Defaults to 1000.
+        within (set, optional): Object ids known to contain every match. Defaults to None.
+
+    Raises:
+        ValueError: If page_size is less than 1.
+    """
+
+    def __init__(self, label=None, classification=None, agent=None, date=None,
+                 after=None, page_size=SEARCH_LIMIT, within=None):
+        if page_size < 1:
+            raise ValueError(f"page_size must be at least 1, not {page_size}")
+        self.terms = normalize_terms(label, classification, agent, date)
+        self.after = after
+        self.page_size = page_size
+        self.within = within
+        self.next_after = None
+        self._objects = None
+        self._first = None
+
+    def _start(self):
+        if self._objects is None:
+            self._objects = self._fetch()
+            self._first = next(self._objects, None)
+
+    def __bool__(self):
+        self._start()
+        return self._first is not None
+
+    def __iter__(self):
+        self._start()
+        if self._first is not None:
+            yield self._first
+            yield from self._objects
+
+    def _key(self):
+        # within narrows the query without changing its results, so it is not part of the key
+        return self.terms + (self.after, self.page_size)
+
+    def is_cached(self):
+        """Checks whether the page is in search_cache, so iterating it runs no query."""
+        return self._key() in search_cache
+
+    def _fetch(self):
+        key = self._key()
+        cached = search_cache.get(key)
+        if cached is not None:
+            self.next_after = cached[1]
+            yield from cached[0]
+            return
+        label, classification, agent, date = self.terms
+        after, page_size = self.after, self.page_size
+
+        object_list = []
+        with luxdb.connection() as connection:
+            # one extra row tells whether there is a next page
+            table = table_filters(connection, label, classification, agent, date,
+                                  self.within)
+            if table is not None:
+                filters, params = table
+                query = luxsearch.create_query(filters, page_size + 1,
+                                               seek=after is not None)
+            else:
+                filters, params = connection_filters(connection, label, classification,
+                                                     agent, date, self.within)
+                query = create_query(filters, page_size + 1, seek=after is not None)
+            if after is not None:
+                params['after_label'], params['after_date'], params['after_id'] = after
+            with closing(connection.cursor()) as cursor:
+                with timing.phase('sql'):
+                    cursor.execute(query, params)
+                last = None
+                while True:
+                    with timing.phase('sql'):
+                        rows = cursor.fetchmany(STREAM_BATCH)
+                    if not rows:
+                        break
+                    with timing.phase('rows'):
+                        hits = [process_row(row)
+                                for row in rows[:page_size - len(object_list)]]
+                    if hits:
+                        last = rows[len(hits) - 1]
+                    object_list.extend(hits)
+                    if len(rows) > len(hits):
+                        # the page is full and another row follows
+                        self.next_after = (last[1] if last[1] is not None else '',
+                                           last[3] if last[3] is not None else '',
+                                           last[0])
+                    yield from hits
+                    if self.next_after is not None:
+                        break
+
+        search_cache.put(key, (object_list, self.next_after), result_size(object_list))
+
+def search_page(label=None, classification=None, agent=None, date=None,
+                after=None, page_size=SEARCH_LIMIT, within=None):
+    """
+    Search the database for one page of objects matching the given criteria.
+
+    Pages are fetched with keyset pagination: pass the cursor returned with
+    one page as after to get the next one. Terms are trimmed and lower-cased,
+    and pages are served from search_cache when the same search was run before.
+
+    Args:
+        label (str, optional): Label to search by. Defaults to None.
+        classification (str, optional): Classification to search by. Defaults to None.
+        agent (str, optional): Agent to search by. Defaults to None.
+        date (str, optional): Date to search by. Defaults to None.
+        after (tuple, optional): (label, date, id) sort key of the last row of the
+            previous page. Defaults to None, meaning the first page.
+        page_size (int, optional): Maximum number of objects to return. Defaults to 1000.
+        within (set, optional): Object ids known to contain every match, used to narrow
+            the query without changing its results. Defaults to None.
+
+    Returns:
+        tuple: (list[SearchHit] of the page, cursor of the next page or None if this is the last)
+
+    Raises:
+        ValueError: If page_size is less than 1.
+        Any exception raised during database connection or query execution.
+    """
+    page = SearchPage(label, classification, agent, date, after, page_size, within)
+    return list(page), page.next_after
+
+def split_aggregate(value):
+    """Splits an agent_info or class column of a search query into a list.
+    Args:
+        value (string): The column, possibly None. GROUP_CONCAT joins the names, each
+            ending in '|', with its default ',' separator.
+    Returns:
+        list: The names, empty if there are none.
+    """
+    return value.rstrip('|').split('|,') if value else []
+
+def iter_search(label=None, classification=None, agent=None, date=None, limit=None,
+                batch_size=STREAM_BATCH):
+    """
+    Iterates over the rows of every object matching the given criteria, in search order.
+
+    Rows are fetched from the cursor batch_size at a time, so the memory used does not
+    grow with the number of results. The pooled connection is held until the iterator is
+    exhausted or closed. Results are not cached.
+
+    Args:
+        label, classification, agent, date (str, optional): The search terms.
+        limit (int, optional): The most rows to return. Defaults to None, meaning all.
+        batch_size (int, optional): Rows fetched per round trip. Defaults to 200.
+
+    Yields:
+        tuple: (id, label, agent_info, date, class) rows as returned by create_query,
+        see split_aggregate for the agent_info and class columns.
+
+    Raises:
+        Any exception raised during database connection or query execution.
+    """
+    label, classification, agent, date = normalize_terms(label, classification, agent, date)
+    limit = -1 if limit is None else limit
+    with luxdb.connection() as connection:
+        table = table_filters(connection, label, classification, agent, date)
+        if table is not None:
+            filters, params = table
+            query = luxsearch.create_query(filters, limit)
+        else:
+            filters, params = connection_filters(connection, label, classification, agent, date)
+            query = create_query(filters, limit)
+        with closing(connection.cursor()) as cursor:
+            with timing.phase('sql'):
+                cursor.execute(query, params)
+            while True:
+                with timing.phase('sql'):
+                    rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+
+def search(label=None, classification=None, agent=None, date=None, after=None, page_size=None):
+    """
+    Search the database for objects based on given criteria to return a list of SearchHit instances.
 
     Make a query based on the provided filtering criteria (label, classification, agent, and date).
-    It then executes the query and processes each row of the result to create an instance of Object.
-    The resulting list of Object instances is then returned.
+    It then executes the query and processes each row of the result to create a SearchHit.
+    The resulting list of SearchHit instances is then returned.
 
     Args:
         label (str, optional): Label to search by. Defaults to None.
         classification (str, optional): Classification to search by. Defaults to None.
         agent (str, optional): Agent to search by. Defaults to None.
         date (str, optional): Date to search by. Defaults to None.
+        after (tuple, optional): (label, date, id) cursor to continue after, see search_page.
+        page_size (int, optional): Maximum number of objects to return. Defaults to 1000.
 
     Returns:
-        list[Object]: A list of Object instances containing the search results.
+        list[SearchHit]: A list of SearchHit instances containing the search results.
 
     Raises:
         Any exception raised during database connection or query execution.
@@ -173,29 +563,5 @@ def search(label=None, classification=None, agent=None, date=None):
     Example:
         result = search(label="ExampleLabel", agent="JohnDoe")
     """
-    def process_row(row):
-        agents = (row[2] or "None").rstrip('|').split('|')
-        classifiers = (row[4] or "None").rstrip('|').split('|')
-
-        return Object(
-            obj_id=int(row[0]),
-            label=str(row[1]),
-            date=str(row[3]),
-            agents=agents,
-            classifiers=classifiers
-        )
-
-    object_list = []
-    filters, params = get_filters(label, classification, agent, date)
-    query = create_query(filters)
-    try:
-        with connect(DATABASE_URL, uri=True) as connection:
-            with closing(connection.cursor()) as cursor:
-                cursor.execute(query, params)
-                rows = cursor.fetchall()
-                object_list.extend(map(process_row, rows))
-    except Exception as error:
-        print(error, file=stderr)
-        sys_exit(1)
-
-    return object_list
+    return search_page(label, classification, agent, date, after,
+                       page_size or SEARCH_LIMIT)[0]
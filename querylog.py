@@ -0,0 +1,264 @@
+"""
+Opt-in log of slow SQL statements and per-variant statement statistics.
+
+ps1lux.create_query produces a different statement for every combination of
+search fields, index paths and pagination. Once enable() has been called,
+every connection the luxdb pool opens creates LoggedCursor cursors, which
+time each statement from execute() through its last fetch and count the rows
+it returned; statements run with connection.execute() are not logged. A
+progress handler counts the SQLite virtual machine steps the
+statement took, which unlike its time does not depend on the load of the
+machine. Python's sqlite3 module offers no profiling trace, so the time is
+measured around the cursor calls rather than reported by SQLite.
+
+Statements are grouped into variants by their text, with whitespace and
+numbers such as LIMIT normalized. A statement slower than the threshold is
+printed to stderr with the shape of its parameters (names and types, never
+the search terms themselves) and its EXPLAIN QUERY PLAN, and is kept among
+the recent slow statements. summary() returns the statistics of every variant,
+for `python luxbench.py slow-queries` and the /stats/queries endpoint.
+"""
+import hashlib
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import closing
+
+import luxdb
+
+# virtual machine instructions between two calls of the progress handler
+PROGRESS_STEPS = 1000
+
+# slow statements kept for slow()
+RECENT_SLOW = 100
+
+_log = None
+_registered = False
+
+
+def fingerprint(sql):
+    """Returns the text of a statement with whitespace and numbers normalized."""
+    return re.sub(r'\b\d+\b', '?', ' '.join(sql.split()))
+
+
+def parameter_shape(parameters):
+    """Describes the parameters of a statement without their values.
+
+    JSON arrays, such as the ids of a json_each filter, are described by their length.
+    """
+    if isinstance(parameters, dict):
+        items = sorted(parameters.items())
+    else:
+        items = enumerate(parameters, 1)
+    shape = []
+    for name, value in items:
+        if isinstance(value, str) and value.startswith('['):
+            kind = f"json[{0 if value == '[]' else value.count(',') + 1}]"
+        else:
+            kind = type(value).__name__
+        shape.append(f"{name}:{kind}")
+    return ' '.join(shape)
+
+
+def parameter_names(parameters):
+    """Returns the names of named parameters, or the number of positional ones."""
+    if isinstance(parameters, dict):
+        return ','.join(sorted(parameters))
+    return f"{len(parameters)} positional"
+
+
+class QueryLog:
+    """Statistics of every statement variant, and the recent slow statements."""
+
+    def __init__(self, threshold_ms=100):
+        self.threshold_ms = threshold_ms
+        self._variants = {}
+        self._slow = deque(maxlen=RECENT_SLOW)
+        self._lock = threading.Lock()
+
+    def record(self, connection, sql, parameters, seconds, rows, steps, error=None):
+        """Adds one executed statement, explaining it if it was slow.
+
+        Args:
+            connection: The connection the statement ran on, still leased.
+            sql (str): The statement.
+            parameters: The parameters it was executed with.
+            seconds (float): Time spent executing it and fetching its rows.
+            rows (int): The number of rows fetched.
+            steps (int): Approximate number of virtual machine steps.
+            error (Exception, optional): The error the statement failed with.
+        """
+        text = fingerprint(sql)
+        key = hashlib.sha1(text.encode()).hexdigest()[:10]
+        milliseconds = seconds * 1000
+        slow = milliseconds >= self.threshold_ms
+        plan = None
+        if slow and error is None:
+            try:
+                # a plain cursor, so that explaining is not logged itself
+                with closing(connection.cursor(sqlite3.Cursor)) as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + sql, parameters)
+                    plan = [row[3] for row in cursor.fetchall()]
+            except sqlite3.Error as explain_error:
+                plan = [f"EXPLAIN failed: {explain_error}"]
+
+        with self._lock:
+            variant = self._variants.get(key)
+            if variant is None:
+                variant = self._variants[key] = {
+                    'variant': key, 'sql': text, 'parameters': parameter_names(parameters),
+                    'count': 0, 'slow': 0, 'errors': 0,
+                    'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'vm_steps': 0, 'plan': None}
+            variant['count'] += 1
+            variant['slow'] += slow
+            variant['errors'] += error is not None
+            variant['total_ms'] += milliseconds
+            variant['max_ms'] = max(variant['max_ms'], milliseconds)
+            variant['rows'] += rows
+            variant['vm_steps'] += steps
+            if plan is not None:
+                variant['plan'] = plan
+                self._slow.append({'variant': key, 'ms': round(milliseconds, 3), 'rows': rows,
+                                   'vm_steps': steps, 'parameters': parameter_shape(parameters),
+                                   'plan': plan, 'at': time.time()})
+
+        if plan is not None:
+            print(f"Slow query {milliseconds:.1f} ms, {rows} rows, ~{steps} steps, "
+                  f"variant {key} ({parameter_shape(parameters)}): {text[:200]}",
+                  file=sys.stderr)
+            for step in plan:
+                print(f"    {step}", file=sys.stderr)
+
+    def summary(self):
+        """Returns the statistics of every variant, the slowest in total first."""
+        with self._lock:
+            variants = [dict(variant) for variant in self._variants.values()]
+        for variant in variants:
+            variant['mean_ms'] = round(variant['total_ms'] / variant['count'], 3)
+            variant['total_ms'] = round(variant['total_ms'], 3)
+            variant['max_ms'] = round(variant['max_ms'], 3)
+        return sorted(variants, key=lambda variant: variant['total_ms'], reverse=True)
+
+    def slow(self):
+        """Returns the most recent slow statements, oldest first."""
+        with self._lock:
+            return list(self._slow)
+
+    def clear(self):
+        """Forgets every statistic and slow statement."""
+        with self._lock:
+            self._variants.clear()
+            self._slow.clear()
+
+
+class LoggedCursor(sqlite3.Cursor):
+    """A cursor reporting each statement it runs to the query log when it is done.
+
+    A statement is done when the cursor executes the next one or is closed.
+    """
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._statement = None
+
+    def _steps(self):
+        return self.connection.state['progress'][0] * PROGRESS_STEPS
+
+    def _timed(self, function, *args):
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        except sqlite3.Error as error:
+            self._statement['error'] = error
+            raise
+        finally:
+            self._statement['seconds'] += time.perf_counter() - start
+
+    def _finish(self):
+        statement, self._statement = self._statement, None
+        if statement is not None and _log is not None:
+            _log.record(self.connection, statement['sql'], statement['parameters'],
+                        statement['seconds'], statement['rows'],
+                        self._steps() - statement['steps'], statement['error'])
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._statement = {'sql': sql, 'parameters': parameters, 'seconds': 0.0,
+                           'rows': 0, 'steps': self._steps(), 'error': None}
+        return self._timed(super().execute, sql, parameters)
+
+    def fetchone(self):
+        if self._statement is None:
+            return super().fetchone()
+        row = self._timed(super().fetchone)
+        self._statement['rows'] += row is not None
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        if self._statement is None:
+            return super().fetchmany(size)
+        rows = self._timed(super().fetchmany, size)
+        self._statement['rows'] += len(rows)
+        return rows
+
+    def fetchall(self):
+        if self._statement is None:
+            return super().fetchall()
+        rows = self._timed(super().fetchall)
+        self._statement['rows'] += len(rows)
+        return rows
+
+    def __next__(self):
+        if self._statement is None:
+            return super().__next__()
+        row = self._timed(super().__next__)
+        self._statement['rows'] += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+def instrument(connection):
+    """Makes a newly opened pooled connection report its statements, once logging is enabled."""
+    if _log is None:
+        return
+    counter = connection.state['progress'] = [0]
+
+    def progress():
+        counter[0] += 1
+        return 0
+
+    connection.set_progress_handler(progress, PROGRESS_STEPS)
+    connection.cursor_factory = LoggedCursor
+
+
+def enable(threshold_ms=100):
+    """Starts logging the statements of the luxdb pool's connections.
+
+    Idle connections are closed, so that every connection used from now on is
+    opened instrumented.
+
+    Args:
+        threshold_ms (float): Statements taking at least this long are explained and printed.
+
+    Returns:
+        QueryLog: The log the statements are recorded in.
+    """
+    global _log, _registered
+    _log = QueryLog(threshold_ms)
+    if not _registered:
+        luxdb.add_setup(instrument)
+        _registered = True
+    luxdb.get_pool().close_all()
+    return _log
+
+
+def get_log():
+    """Returns the QueryLog statements are recorded in, or None if logging is not enabled."""
+    return _log
@@ -0,0 +1,91 @@
+"""
+Bounded LRU cache for search results.
+
+Entries are evicted least recently used first once either the entry count or
+the approximate memory held by the cached values exceeds its bound. Because
+lux.sqlite is opened read-only, entries only go stale when the database file
+is replaced, so the cache is keyed to the file's identity and is emptied
+whenever that changes.
+"""
+import threading
+from collections import OrderedDict
+
+import luxdb
+
+
+class ResultCache:
+    """LRU cache bounded by entry count and approximate size in bytes."""
+
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024, path=luxdb.DATABASE_PATH):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._watch = luxdb.FileWatch(path)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_identity(self):
+        """Empties the cache if the database file changed; call with the lock held."""
+        if self._watch.changed():
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def get(self, key):
+        """Returns the cached value for key, or None on a miss."""
+        with self._lock:
+            self._check_identity()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, key):
+        """Checks whether key is cached, without counting a hit or miss or refreshing it."""
+        with self._lock:
+            self._check_identity()
+            return key in self._entries
+
+    def put(self, key, value, size):
+        """Caches value under key.
+
+        Args:
+            key: A hashable key.
+            value: The value to cache.
+            size (int): Approximate number of bytes the value holds.
+        """
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_identity()
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """Removes every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Returns the cache's counters and current size for monitoring."""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes,
+                    'max_entries': self.max_entries, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'invalidations': self.invalidations}
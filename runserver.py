@@ -1,10 +1,13 @@
 """This module is the entry point for the application."""
+import os
 import sys
 import argparse
-from sqlite3 import connect, Error, DatabaseError
+import resource
+from sqlite3 import Error, DatabaseError
 from luxapp import app
-
-DATABASE_URL = 'file:lux.sqlite?mode=ro'
+from ps1lux import load_name_indexes, load_replicas
+import luxdb
+import querylog
 
 def validate_port(input_port):
     """Validates the provided port number and returns its integer representation.
@@ -30,14 +33,22 @@ def validate_port(input_port):
 
 
 def test_database_connection():
-    """Tests the database connection using the DATABASE_URL.
+    """Tests the database connection by opening the first pooled connection.
 
     Raises:
         DatabaseError: If there's a database-specific error.
         Error: For general SQLite errors.
     """
-    with connect(DATABASE_URL, isolation_level=None, uri=True) as conn:
-        pass  # Connection will be closed automatically after the 'with' block.
+    luxdb.get_pool().warm_up()
+
+def load_in_memory():
+    """Copies the database and its sidecars into memory and reports the load time and size."""
+    for replica in load_replicas():
+        print(f"Loaded {replica.path} into memory in {replica.load_seconds:.2f} s, "
+              f"{replica.size / 2**20:.1f} MiB", file=sys.stderr)
+    # ru_maxrss is in KiB on Linux
+    resident = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Resident size {resident:.1f} MiB", file=sys.stderr)
 
 def run_app_on_port(port):
     """Starts the Flask app on the given port.
@@ -47,11 +58,116 @@ def run_app_on_port(port):
     """
     app.run(host='0.0.0.0', port=port, debug=True)
 
-def main(port):
+def warm_up_worker(server, worker):
+    """Opens a gunicorn worker's own database connections right after it is forked.
+
+    SQLite connections must not be shared across fork(), so the master process
+    closes its connections before forking and each worker opens one per thread.
+    """
+    luxdb.get_pool().warm_up(worker.cfg.threads)
+
+def close_worker_connections(server, worker):
+    """Closes a gunicorn worker's idle database connections when it exits."""
+    luxdb.get_pool().close_all()
+
+def run_production(port, workers, threads, backlog, max_requests, graceful_timeout):
+    """Serves the Flask app with gunicorn, with the debugger off.
+
+    Args:
+        port (int): Port number to listen on.
+        workers (int): Number of worker processes.
+        threads (int): Threads per worker process.
+        backlog (int): Maximum number of pending connections.
+        max_requests (int): Requests after which a worker is replaced by a fresh one,
+            0 to never recycle workers.
+        graceful_timeout (int): Seconds workers get to finish their requests on shutdown
+            or recycling before they are killed.
+
+    Raises:
+        RuntimeError: If gunicorn is not installed.
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise RuntimeError("Production mode requires gunicorn: pip install gunicorn")
+
+    class LuxApplication(BaseApplication):
+        """Runs the already imported Flask app, forking workers from this process."""
+
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    # connections opened by the startup checks must not be inherited by the workers
+    luxdb.get_pool().close_all()
+    LuxApplication({
+        'bind': f'0.0.0.0:{port}',
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'backlog': backlog,
+        'max_requests': max_requests,
+        # stagger recycling so that the workers are not all replaced at once
+        'max_requests_jitter': max_requests // 10,
+        'graceful_timeout': graceful_timeout,
+        'preload_app': True,
+        'post_fork': warm_up_worker,
+        'worker_exit': close_worker_connections,
+    }).run()
+
+def run_asgi(port, workers, threads, backlog, max_requests, graceful_timeout, in_memory=False):
+    """Serves the asynchronous variant of the app in luxasync with uvicorn.
+
+    Args:
+        port (int): Port number to listen on.
+        workers (int): Number of worker processes.
+        threads (int): Threads running SQLite work in each worker.
+        backlog (int): Maximum number of pending connections.
+        max_requests (int): Requests after which a worker is replaced by a fresh one,
+            0 to never recycle workers.
+        graceful_timeout (int): Seconds workers get to finish their requests on shutdown.
+        in_memory (bool, optional): Have every worker read from an in-memory copy of the
+            database. Defaults to False.
+
+    Raises:
+        RuntimeError: If uvicorn is not installed.
+    """
+    try:
+        import uvicorn
+    except ImportError:
+        raise RuntimeError("ASGI mode requires uvicorn, quart and httpx: "
+                           "pip install uvicorn quart httpx")
+
+    # the workers import luxasync themselves and read their settings from the environment
+    os.environ['LUX_SQL_THREADS'] = str(threads)
+    if in_memory:
+        # spawned workers do not inherit memory from this process, each loads its own copy
+        os.environ['LUX_IN_MEMORY'] = '1'
+    luxdb.get_pool().close_all()
+    uvicorn.run('luxasync:app', host='0.0.0.0', port=port, workers=workers, backlog=backlog,
+                limit_max_requests=max_requests or None,
+                timeout_graceful_shutdown=graceful_timeout, log_level='warning')
+
+def main(port, slow_query_ms=None, production=None, asgi=False, in_memory=False):
     """Initializes the application and starts the server.
 
     Args:
         port (str): Port number as a string.
+        slow_query_ms (float, optional): Log statements taking at least this many
+            milliseconds with their query plan. Defaults to None, meaning no query log.
+        production (dict, optional): Keyword arguments of run_production to serve with
+            gunicorn. Defaults to None, meaning the Flask development server.
+        asgi (bool, optional): Serve luxasync with uvicorn and the production settings
+            instead. Defaults to False.
+        in_memory (bool, optional): Read from an in-memory copy of the database and its
+            sidecars, loaded at startup. Defaults to False.
     """
     try:
         port_num = validate_port(port)
@@ -59,9 +175,22 @@ def main(port):
         print(f"Error: {ve}", file=sys.stderr)
         sys.exit(1)
 
+    if slow_query_ms is not None:
+        querylog.enable(slow_query_ms)
+
     try:
+        # forked gunicorn workers share the copy made here, uvicorn workers load their own
+        if in_memory and not asgi:
+            load_in_memory()
         test_database_connection()
-        run_app_on_port(port_num)
+        # built before forking, so that every worker shares them
+        load_name_indexes()
+        if asgi:
+            run_asgi(port_num, in_memory=in_memory, **production)
+        elif production is not None:
+            run_production(port_num, **production)
+        else:
+            run_app_on_port(port_num)
     except (DatabaseError, Error) as db_ex:
         print(f"Database connection error: {db_ex}", file=sys.stderr)
         sys.exit(1)
@@ -72,8 +201,35 @@ def main(port):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='The YUAG search application', allow_abbrev=False)
     parser.add_argument('port', help='the port at which the server should listen')
+    parser.add_argument('--slow-query-ms', type=float, default=None,
+                        help='log SQL statements taking at least this many milliseconds')
+    parser.add_argument('--in-memory', action='store_true',
+                        help='copy the database into memory at startup and read from the copy')
+    parser.add_argument('--production', action='store_true',
+                        help='serve with gunicorn worker processes instead of the '
+                             'development server')
+    parser.add_argument('--asgi', action='store_true',
+                        help='serve the asynchronous variant of the app with uvicorn worker '
+                             'processes, using the production mode settings')
+    parser.add_argument('--workers', type=int, default=(os.cpu_count() or 1) * 2 + 1,
+                        help='worker processes in production mode')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='threads per worker process in production mode, '
+                             'SQLite threads per worker in ASGI mode')
+    parser.add_argument('--backlog', type=int, default=2048,
+                        help='maximum number of pending connections in production mode')
+    parser.add_argument('--max-requests', type=int, default=10000,
+                        help='requests after which a worker is recycled, 0 for never')
+    parser.add_argument('--graceful-timeout', type=int, default=30,
+                        help='seconds workers get to finish their requests on shutdown')
     args = parser.parse_args()
-    
+
+    production = None
+    if args.production or args.asgi:
+        production = {'workers': args.workers, 'threads': args.threads,
+                      'backlog': args.backlog, 'max_requests': args.max_requests,
+                      'graceful_timeout': args.graceful_timeout}
+
     # This will now handle non-integer port values gracefully
-    main(args.port)
+    main(args.port, args.slow_query_ms, production, args.asgi, args.in_memory)
 
@@ -0,0 +1,91 @@
+"""
+Sidecar databases derived from lux.sqlite.
+
+The label index of luxfts and the search table of luxsearch are databases
+of their own next to lux.sqlite. Each is written to a temporary file that
+replaces the sidecar once complete, and records in its meta table the
+signature of the database it was built from. Connections only attach a
+sidecar while that signature matches the current database, through
+luxdb.read_url so that a replicated sidecar is read from memory.
+"""
+import os
+import sys
+from contextlib import closing, contextmanager
+from sqlite3 import connect, Error
+
+from luxdb import DATABASE_PATH, file_signature, read_url
+
+
+class Sidecar:
+    """A sidecar database, usable while it was built from the current database."""
+
+    def __init__(self, path, schema_name, description, meta=None):
+        """
+        Args:
+            path (str): Default path of the sidecar.
+            schema_name (str): Name the sidecar is attached as.
+            description (str): Names the sidecar in messages, e.g. 'label index'.
+            meta (dict, optional): Further meta values a usable sidecar must have,
+                e.g. the format of its layout.
+        """
+        self.path = path
+        self.schema_name = schema_name
+        self.description = description
+        self.meta = dict(meta or {})
+        self._current = {}
+
+    def meta_rows(self, database):
+        """Returns the (key, value) rows of the meta table of a sidecar built from database."""
+        return [('source', file_signature(database)), *self.meta.items()]
+
+    def is_current(self, database=DATABASE_PATH, path=None):
+        """Checks that the sidecar exists and was built from the current database.
+
+        The answer is memoized until either file changes.
+        """
+        path = path or self.path
+        try:
+            key = (file_signature(database), file_signature(path))
+        except OSError:
+            return False
+        if key not in self._current:
+            try:
+                with closing(connect(f'file:{path}?mode=ro', uri=True)) as conn:
+                    meta = dict(conn.execute("SELECT key, value FROM meta"))
+                self._current.clear()
+                self._current[key] = meta.get('source') == key[0] and all(
+                    meta.get(name) == value for name, value in self.meta.items())
+            except Error as error:
+                print(f"Ignoring {self.description} {path}: {error}", file=sys.stderr)
+                self._current[key] = False
+        return self._current[key]
+
+    def attach(self, connection, database=DATABASE_PATH, path=None):
+        """Attaches the sidecar to a connection as schema_name when it is current.
+
+        Returns:
+            bool: True if the sidecar was attached.
+        """
+        path = path or self.path
+        if not self.is_current(database, path):
+            return False
+        connection.execute(f"ATTACH DATABASE ? AS {self.schema_name}", (read_url(path),))
+        return True
+
+
+@contextmanager
+def staged(output):
+    """Yields a temporary path to build a sidecar at, which replaces output once built.
+
+    A build that raises leaves output untouched and removes the temporary file.
+    """
+    temp_path = f"{output}.tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        yield temp_path
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, output)
@@ -0,0 +1,191 @@
+"""
+Request coalescing and supersession for searches.
+
+Identical searches that are in flight at the same time share one execution:
+the first request runs it and the others wait for its result. Each loaded
+search page also sends a random page id and an increasing sequence number
+with its searches; once a newer search from the same page arrives, the
+page's older requests are superseded. Sequence numbers restart when a page
+is reloaded, which gives it a new id, and pages in other tabs of the same
+browser have ids of their own, so they never supersede each other. A
+superseded request that has not started is answered straight away, and an
+execution whose every waiter has been superseded is cancelled by
+interrupting the SQLite connections it holds.
+
+Threaded servers call do(); an asyncio server calls do_async(), whose
+coalesced requests await the execution on the event loop instead of each
+blocking a thread.
+"""
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import luxdb
+
+
+class Superseded(Exception):
+    """Raised when a newer request from the same page made a request obsolete."""
+
+
+class _Call:
+    """One in-flight execution and the requests waiting for it."""
+
+    def __init__(self):
+        # completes once the execution ends; running, so no waiter can cancel it
+        self.done = Future()
+        self.done.set_running_or_notify_cancel()
+        self.result = None
+        self.error = None
+        self.waiters = []       # (page id, seq) of every request sharing this call
+        self.connections = set()
+        self.cancelled = False
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls and cancels superseded ones."""
+
+    def __init__(self, max_pages=4096):
+        self.max_pages = max_pages
+        self._calls = {}
+        self._latest = OrderedDict()    # page id -> newest sequence number seen
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+        self.superseded = 0
+        self.cancelled = 0
+
+    def _is_superseded(self, page, seq):
+        """Checks whether a newer request from page has been seen; call with the lock held."""
+        return page is not None and seq is not None and self._latest.get(page, seq) > seq
+
+    def _observe(self, page, seq):
+        """Records the newest sequence number of a page and cancels what it supersedes.
+
+        Must be called with the lock held.
+        """
+        if page is None or seq is None:
+            return
+        if self._latest.get(page, seq) <= seq:
+            self._latest[page] = seq
+            self._latest.move_to_end(page)
+            while len(self._latest) > self.max_pages:
+                self._latest.popitem(last=False)
+
+        obsolete = [key for key, call in self._calls.items()
+                    if all(self._is_superseded(*waiter) for waiter in call.waiters)]
+        for key in obsolete:
+            # later identical requests must not join a call that is being cancelled
+            call = self._calls.pop(key)
+            call.cancelled = True
+            self.cancelled += 1
+            for conn in call.connections:
+                conn.interrupt()
+
+    def do(self, key, function, page=None, seq=None):
+        """Runs function(), or waits for an identical in-flight run of it.
+
+        Args:
+            key: Identifies identical calls.
+            function: The callable to run, taking no arguments.
+            page (str, optional): The id of the loaded page making the request.
+            seq (int, optional): The page's sequence number for the request.
+
+        Returns:
+            The value returned by function().
+
+        Raises:
+            Superseded: If a newer request from the page made this one obsolete.
+            Any exception raised by function().
+        """
+        call, leader = self._join(key, page, seq)
+        if leader:
+            self._run(key, call, function)
+        else:
+            call.done.result()
+        return self._result(call)
+
+    async def do_async(self, key, function, page=None, seq=None, executor=None):
+        """Runs function() on an executor, or awaits an identical in-flight run of it.
+
+        Only the request that starts a run occupies a thread of the executor; the
+        requests coalesced with it wait on the event loop.
+
+        Args:
+            key: Identifies identical calls.
+            function: The blocking callable to run, taking no arguments.
+            page (str, optional): The id of the loaded page making the request.
+            seq (int, optional): The page's sequence number for the request.
+            executor (Executor, optional): Runs function, the loop's default if None.
+
+        Returns:
+            The value returned by function().
+
+        Raises:
+            Superseded: If a newer request from the page made this one obsolete.
+            Any exception raised by function().
+        """
+        call, leader = self._join(key, page, seq)
+        if leader:
+            await asyncio.get_running_loop().run_in_executor(
+                executor, self._run, key, call, function)
+        else:
+            await asyncio.wrap_future(call.done)
+        return self._result(call)
+
+    def _join(self, key, page, seq):
+        """Returns the in-flight call of key, and whether this request must run it.
+
+        Raises:
+            Superseded: If a newer request from the page made this one obsolete.
+        """
+        with self._lock:
+            if self._is_superseded(page, seq):
+                self.superseded += 1
+                raise Superseded()
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+            call.waiters.append((page, seq))
+            self._observe(page, seq)
+        return call, leader
+
+    def _result(self, call):
+        """Returns the result of a finished call, or raises its error."""
+        if call.error is not None:
+            if call.cancelled and luxdb.is_interrupted(call.error):
+                with self._lock:
+                    self.superseded += 1
+                raise Superseded() from call.error
+            raise call.error
+        return call.result
+
+    def _run(self, key, call, function):
+        def track(conn, leased):
+            with self._lock:
+                if leased:
+                    call.connections.add(conn)
+                else:
+                    call.connections.discard(conn)
+
+        try:
+            with luxdb.lease_observer(track):
+                call.result = function()
+        except Exception as error:
+            call.error = error
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                self.executed += 1
+            call.done.set_result(None)
+
+    def stats(self):
+        """Returns counters of executed, coalesced, superseded and cancelled requests."""
+        with self._lock:
+            return {'in_flight': len(self._calls), 'executed': self.executed,
+                    'coalesced': self.coalesced, 'superseded': self.superseded,
+                    'cancelled': self.cancelled}
@@ -0,0 +1,35 @@
+"""Shared fixtures for the tests; the modules under test live in the repository root."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import luxdb
+import luxgen
+import ps1lux
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Generates a small synthetic lux.sqlite and makes it the database searches read."""
+    monkeypatch.chdir(tmp_path)
+    luxgen.generate(luxdb.DATABASE_PATH, objects=500)
+    luxdb.get_pool().close_all()
+    ps1lux.search_cache.clear()
+    yield tmp_path / luxdb.DATABASE_PATH
+    luxdb.get_pool().close_all()
+    ps1lux.search_cache.clear()
+
+
+@pytest.fixture
+def client(database):
+    """A Flask test client of luxapp serving the generated database."""
+    import luxapp
+    import thumbnails
+    luxapp.app.config.update(TESTING=True, PREFETCH_DETAILS=False)
+    # nothing listens on the discard port, so thumbnail checks fail fast and stay unknown
+    thumbnails.set_probe(thumbnails.ThumbnailProbe('http://127.0.0.1:9/{}', timeout=1))
+    yield luxapp.app.test_client()
+    thumbnails.set_probe(None)
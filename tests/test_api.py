@@ -0,0 +1,46 @@
+"""Tests of the JSON API routes."""
+import json
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+
+def lines(response):
+    return [json.loads(line) for line in response.data.decode().splitlines()]
+
+
+def test_search_stream_honours_limit(client):
+    records = lines(client.get('/api/search?l=a&limit=2'))
+    assert len(records) == 3
+    assert records[-1]['summary']['count'] == 2
+
+
+@pytest.mark.parametrize('limit', ['²', '-1', 'ten', ''])
+def test_search_stream_rejects_bad_limits(client, limit):
+    assert client.get('/api/search', query_string={'l': 'a', 'limit': limit}).status_code == 400
+
+
+def test_objects_batch(client):
+    response = client.get('/api/objects?ids=2,1,2,999999')
+    assert response.status_code == 200
+    assert [record['id'] for record in response.json['objects']] == [2, 1]
+    assert response.json['missing'] == [999999]
+
+
+@pytest.mark.parametrize('ids', ['²', '1,x', '1.5'])
+def test_objects_batch_rejects_bad_ids(client, ids):
+    assert client.get('/api/objects', query_string={'ids': ids}).status_code == 400
+
+
+def test_search_stream_lists_names(client, database):
+    records = lines(client.get('/api/search?l=a&limit=50'))[:-1]
+    with closing(sqlite3.connect(database)) as conn:
+        for record in records:
+            classifiers = [row[0] for row in conn.execute(
+                "SELECT DISTINCT classifiers.name FROM objects_classifiers JOIN classifiers"
+                " ON objects_classifiers.cls_id = classifiers.id WHERE obj_id = ?",
+                (record['id'],))]
+            assert sorted(record['classifiers']) == sorted(classifiers)
+            assert not any(agent.startswith(',') for agent in record['agents'])
+    assert any(len(record['classifiers']) > 1 for record in records)
@@ -0,0 +1,45 @@
+"""Tests that a search matches the same rows whichever index or sidecar answers it."""
+import sqlite3
+from contextlib import closing
+
+import luxdb
+import luxfts
+import luxsearch
+import ps1lux
+from trigram import TrigramIndex, fold_case
+
+
+def test_fold_case_only_folds_ascii():
+    assert fold_case('ÉMILE Zola') == 'Émile zola'
+    index = TrigramIndex([(1, 'Émile Zola'), (2, 'EMILE')])
+    assert index.lookup('émile') == set()
+    assert index.lookup('Émile') == {1}
+    assert index.lookup('MILE') == {1, 2}
+
+
+def search_ids(**terms):
+    ps1lux.search_cache.clear()
+    return sorted(obj.get_id() for obj in ps1lux.search(**terms))
+
+
+def test_sidecars_do_not_change_results(database):
+    with closing(sqlite3.connect(database)) as conn:
+        conn.execute("UPDATE agents SET name = 'Émile Zola' WHERE id = 1")
+        conn.execute("UPDATE objects SET label = 'Étude in Blue' WHERE id = 1")
+        conn.commit()
+    searches = [{'agent': 'émile'}, {'agent': 'Émile'}, {'agent': 'ZOLA'},
+                {'label': 'étude'}, {'label': 'Étude'}, {'label': 'ÉT'}, {'label': 'BLUE'}]
+    without = [search_ids(**terms) for terms in searches]
+    assert without[0] == [] and without[1] and without[1] == without[2]
+    assert without[3] == [] and 1 in without[4] and 1 in without[5]
+
+    luxfts.build()
+    luxsearch.build()
+    assert luxsearch.is_current() and luxfts.is_current()
+    luxdb.get_pool().close_all()
+    assert [search_ids(**terms) for terms in searches] == without
+
+    # searches use the search table ahead of the label index, so remove it
+    (database.parent / luxsearch.SEARCH_TABLE).unlink()
+    luxdb.get_pool().close_all()
+    assert [search_ids(**terms) for terms in searches] == without
@@ -0,0 +1,71 @@
+"""Tests that conditional requests are answered with 304 before any query runs."""
+import pytest
+
+import luxapp
+import luxviews
+
+
+def fail(*args, **kwargs):
+    pytest.fail('the query path ran for a request answered from the validator')
+
+
+@pytest.fixture
+def no_queries(monkeypatch):
+    """Makes every way of loading search results or object details fail the test."""
+    def install():
+        monkeypatch.setattr(luxviews, 'search_page', fail)
+        monkeypatch.setattr(luxapp.incremental_search, 'search_page', fail)
+        monkeypatch.setattr(luxapp, 'format_entry_results2', fail)
+        monkeypatch.setattr(luxapp.detail_prefetcher, 'get', fail)
+    return install
+
+
+def test_object_page_not_modified(client, no_queries):
+    response = client.get('/obj/1')
+    assert response.status_code == 200
+    etag, modified = response.headers['ETag'], response.headers['Last-Modified']
+    assert 'public' in response.headers['Cache-Control']
+    assert f'max-age={luxapp.OBJECT_MAX_AGE}' in response.headers['Cache-Control']
+    # shared caches must not store a response that sets a cookie
+    assert 'Set-Cookie' not in response.headers
+
+    no_queries()
+    response = client.get('/obj/1', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    response = client.get('/obj/1', headers={'If-Modified-Since': modified})
+    assert response.status_code == 304
+
+
+def test_search_not_modified_with_the_same_cookie(client, no_queries):
+    # the first search sets the cookie of a previous search, which the results depend on
+    client.get('/search?l=a')
+    response = client.get('/search?l=a&seq=1&page_id=etag')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert 'Cookie' in response.headers['Vary']
+    assert 'private' in response.headers['Cache-Control']
+    assert 'no-cache' in response.headers['Cache-Control']
+
+    no_queries()
+    # seq and page_id only order requests, they do not change the results
+    response = client.get('/search?l=a&seq=2&page_id=other',
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    assert 'Cookie' in response.headers['Vary']
+    assert 'search_parameters' in response.headers.get('Set-Cookie', '')
+
+
+def test_search_etag_varies_with_the_cookie(client):
+    response = client.get('/search?l=a')
+    etag = response.headers['ETag']
+    assert client.get('/search?l=b', headers={'If-None-Match': etag}).status_code == 200
+
+    # without the cookie of a previous search, an empty search shows another page
+    client.get('/search')
+    empty = client.get('/search').headers['ETag']
+    client.delete_cookie('search_parameters')
+    assert client.get('/search', headers={'If-None-Match': empty}).status_code == 200
@@ -0,0 +1,69 @@
+"""Tests of refining as-you-type searches."""
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+import luxdb
+import ps1lux
+from incremental import IncrementalSearch
+
+
+def ids(page):
+    return [hit.get_id() for hit in page[0]]
+
+
+def test_cached_page_runs_no_query(database, monkeypatch):
+    search = IncrementalSearch()
+    first = search.search_page('client', 'a', '', '', '', page_size=10)
+    search.search_page('client', 'ab', '', '', '', page_size=10)
+
+    def no_connection():
+        pytest.fail('a cached page opened a database connection')
+
+    monkeypatch.setattr(luxdb, 'connection', no_connection)
+    # backspace to a search whose page is cached
+    assert ids(search.search_page('client', 'a', '', '', '', page_size=10)) == ids(first)
+    assert search.stats()['cached'] == 1
+
+
+def test_sessions_are_forgotten_with_the_database(database):
+    search = IncrementalSearch()
+    assert ids(search.search_page('client', 'zq', '', '', '')) == []
+
+    with closing(sqlite3.connect(database)) as conn:
+        conn.execute("UPDATE objects SET label = 'zqx' WHERE id = 1")
+        conn.commit()
+    # refines the previous search, whose candidates came from the old file
+    assert ids(search.search_page('client', 'zqx', '', '', '')) == [1]
+    assert search.stats()['refined'] == 0
+
+
+def test_new_search_collects_no_candidates(database, monkeypatch):
+    search = IncrementalSearch()
+    calls = []
+    collect = ps1lux.candidate_ids
+    monkeypatch.setattr(ps1lux, 'candidate_ids',
+                        lambda *args, **kwargs: calls.append(args) or collect(*args, **kwargs))
+    full, _ = search.search_page('client', 'a', '', '', '', page_size=10)
+    assert calls == []
+    # the first refinement collects the candidates, the next one is narrowed to them
+    search.search_page('client', 'an', '', '', '', page_size=10)
+    assert len(calls) == 1
+    search.search_page('client', 'ann', '', '', '', page_size=10)
+    assert search.stats()['refined'] == 1
+
+
+def test_complete_page_gives_the_candidates(database, monkeypatch):
+    search = IncrementalSearch()
+    everything, last = search.search_page('client', 'an', '', '', '')
+    assert last is None
+    within = []
+    collect = ps1lux.candidate_ids
+    monkeypatch.setattr(ps1lux, 'candidate_ids',
+                        lambda *args, **kwargs: within.append(kwargs['within'])
+                        or collect(*args, **kwargs))
+    search.search_page('client', 'ann', '', '', '')
+    # narrowed to the ids of the first page without a query of its own
+    assert within == [{hit.get_id() for hit in everything}]
+    assert search.stats()['refined'] == 1
@@ -0,0 +1,71 @@
+"""Tests of the ASGI app, run with Quart's test client."""
+import asyncio
+
+import pytest
+
+pytest.importorskip('quart')
+pytest.importorskip('httpx')
+
+import luxasync
+
+
+@pytest.fixture
+def serve(database):
+    """Runs a scenario against luxasync, given its test client, on a new event loop."""
+    luxasync.app.config.update(TESTING=True)
+
+    def run(scenario):
+        async def main():
+            # nothing listens on the discard port, so thumbnail checks fail fast
+            luxasync.thumbnail_probe = luxasync.AsyncThumbnailProbe('http://127.0.0.1:9/{}',
+                                                                    timeout=1)
+            try:
+                await scenario(luxasync.app.test_client())
+            finally:
+                await luxasync.thumbnail_probe.close()
+        asyncio.run(main())
+    return run
+
+
+def test_search_and_index(serve):
+    async def scenario(client):
+        response = await client.get('/search?l=a')
+        assert response.status_code == 200
+        assert b'<tr' in await response.get_data()
+        assert 'X-Next-After' in response.headers
+        after = response.headers['X-Next-After']
+        response = await client.get('/search', query_string={'l': 'a', 'after': after})
+        assert response.status_code == 200
+        assert b'<table' not in await response.get_data()
+        # the index repeats the search saved in the cookie
+        response = await client.get('/')
+        assert b'<tr' in await response.get_data()
+        assert (await client.get('/search?l=a&after=[1')).status_code == 400
+    serve(scenario)
+
+
+def test_reloaded_page_is_not_superseded(serve):
+    async def scenario(client):
+        assert (await client.get('/search?l=a&seq=7&page_id=first')).status_code == 200
+        assert (await client.get('/search?l=ab&seq=6&page_id=first')).status_code == 204
+        response = await client.get('/search?l=b&seq=1&page_id=second')
+        assert response.status_code == 200
+        assert b'<tr' in await response.get_data()
+    serve(scenario)
+
+
+@pytest.mark.parametrize('obj_id', ['²', 'x', '-1', '999999'])
+def test_missing_objects_are_not_found(serve, obj_id):
+    async def scenario(client):
+        response = await client.get(f'/obj/{obj_id}')
+        assert response.status_code == 404
+        assert b'does not exist' in await response.get_data()
+    serve(scenario)
+
+
+def test_object_page(serve):
+    async def scenario(client):
+        response = await client.get('/obj/1')
+        assert response.status_code == 200
+        assert 'Set-Cookie' not in response.headers
+    serve(scenario)
@@ -0,0 +1,45 @@
+"""Regression test: every search variant evaluates the filtered join over objects once."""
+import re
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+import luxdb
+import luxfts
+import ps1lux
+
+OBJECTS = re.compile(r'^(SCAN|SEARCH) objects\b')
+
+JOIN_INDEXES = '''
+    CREATE INDEX p_obj ON productions (obj_id);
+    CREATE INDEX p_agt ON productions (agt_id);
+    CREATE INDEX oc_obj ON objects_classifiers (obj_id);
+    CREATE INDEX oc_cls ON objects_classifiers (cls_id);
+'''
+
+
+@pytest.mark.parametrize('join_indexes', [False, True], ids=['raw', 'join indexes'])
+@pytest.mark.parametrize('label_index', [False, True], ids=['LIKE labels', 'label index'])
+@pytest.mark.parametrize('name_indexes', [False, True], ids=['LIKE names', 'name indexes'])
+def test_objects_visited_once(database, join_indexes, label_index, name_indexes):
+    if join_indexes:
+        with closing(sqlite3.connect(database)) as conn:
+            conn.executescript(JOIN_INDEXES)
+    if label_index:
+        luxfts.build()
+
+    with closing(sqlite3.connect(luxdb.DATABASE_URL, uri=True)) as conn:
+        mode = luxfts.attach(conn)
+        assert (mode is not None) == label_index
+        names = ps1lux.load_name_indexes(conn) if name_indexes else None
+        indexed = luxdb.indexed_columns(conn)
+        for terms in ps1lux.search_variants():
+            filters, params = ps1lux.get_filters(label_index=mode, name_indexes=names,
+                                                 indexed_columns=indexed, **terms)
+            for seek in (False, True):
+                plan = [row[3] for row in conn.execute(
+                    'EXPLAIN QUERY PLAN ' + ps1lux.create_query(filters, seek=seek),
+                    {**params, 'after_label': '', 'after_date': '', 'after_id': 0})]
+                visits = sum(1 for step in plan if OBJECTS.match(step))
+                assert visits == 1, (terms, seek, plan)
@@ -0,0 +1,35 @@
+"""Tests of keyset-paginated search pages."""
+import pytest
+
+import ps1lux
+
+
+@pytest.mark.parametrize('page_size', [0, -1])
+def test_page_size_must_be_positive(database, page_size):
+    with pytest.raises(ValueError):
+        ps1lux.search_page('a', page_size=page_size)
+
+
+def test_pages_follow_each_other(database):
+    everything, last = ps1lux.search_page('a', page_size=1000)
+    assert last is None and len(everything) > 3
+    pages, after = [], None
+    while True:
+        page, after = ps1lux.search_page('a', after=after, page_size=1)
+        pages.extend(page)
+        if after is None:
+            break
+    assert [hit.get_id() for hit in pages] == [hit.get_id() for hit in everything]
+
+
+@pytest.mark.parametrize('after', ['[1', '["a", "", 1.5]', '[[1], "", 1]', '[{"a": 1}, "", 1]',
+                                   '[null, null, 99999999999999999999999]'])
+def test_malformed_cursors_are_rejected(client, after):
+    response = client.get('/search', query_string={'l': 'a', 'after': after})
+    assert response.status_code == 400
+
+
+def test_query_errors_propagate_to_the_caller(database):
+    # an error must reach the request handler, not end the server process
+    with pytest.raises(OverflowError):
+        ps1lux.search_page('a', after=('a', '', 2 ** 70), page_size=1)
@@ -0,0 +1,48 @@
+"""Tests of the sidecar databases built from lux.sqlite."""
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+import luxdb
+from sidecar import Sidecar, staged
+
+
+def build(sidecar, path, database, meta=None):
+    with staged(path) as temp_path, closing(sqlite3.connect(temp_path)) as conn:
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", meta or sidecar.meta_rows(database))
+        conn.commit()
+
+
+def test_sidecar_is_current_until_the_database_changes(database):
+    sidecar = Sidecar('side.sqlite', 'side', 'test sidecar', {'format': '1'})
+    assert not sidecar.is_current()
+    build(sidecar, 'side.sqlite', database)
+    assert sidecar.is_current()
+    with closing(sqlite3.connect(luxdb.DATABASE_URL, uri=True)) as conn:
+        assert sidecar.attach(conn)
+        assert conn.execute("SELECT COUNT(*) FROM side.meta").fetchone()[0] == 2
+
+    with closing(sqlite3.connect(database)) as conn:
+        conn.execute("UPDATE objects SET label = 'changed' WHERE id = 1")
+        conn.commit()
+    assert not sidecar.is_current()
+
+
+def test_sidecar_of_another_format_is_not_current(database):
+    sidecar = Sidecar('side.sqlite', 'side', 'test sidecar', {'format': '2'})
+    build(sidecar, 'side.sqlite', database,
+          [('source', luxdb.file_signature(database)), ('format', '1')])
+    assert not sidecar.is_current()
+
+
+def test_failed_build_leaves_the_sidecar_untouched(tmp_path):
+    output = tmp_path / 'side.sqlite'
+    output.write_text('old')
+    with pytest.raises(RuntimeError):
+        with staged(str(output)) as temp_path:
+            open(temp_path, 'w').close()
+            raise RuntimeError('build failed')
+    assert output.read_text() == 'old'
+    assert not (tmp_path / 'side.sqlite.tmp').exists()
@@ -0,0 +1,56 @@
+"""Tests of search coalescing and supersession."""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import SingleFlight, Superseded
+
+
+def test_newer_request_of_the_same_page_supersedes():
+    flights = SingleFlight()
+    assert flights.do('a', lambda: 1, 'page', 2) == 1
+    with pytest.raises(Superseded):
+        flights.do('b', lambda: 2, 'page', 1)
+    # another page, e.g. the same one reloaded, keeps its own count
+    assert flights.do('b', lambda: 2, 'other page', 1) == 2
+    assert flights.do('c', lambda: 3) == 3
+    assert flights.stats()['superseded'] == 1
+
+
+def test_coalesced_async_requests_hold_no_thread():
+    flights = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def slow():
+        runs.append(1)
+        release.wait(5)
+        return 'rows'
+
+    async def main(pool):
+        leader = asyncio.ensure_future(flights.do_async('k', slow, executor=pool))
+        await asyncio.sleep(0.05)
+        waiter = asyncio.ensure_future(flights.do_async('k', slow, executor=pool))
+        await asyncio.sleep(0.05)
+        # the leader occupies one of the two threads, the waiter none
+        free = asyncio.get_running_loop().run_in_executor(pool, lambda: 'free')
+        assert await asyncio.wait_for(free, 1) == 'free'
+        release.set()
+        return await asyncio.gather(leader, waiter)
+
+    with ThreadPoolExecutor(2) as pool:
+        assert asyncio.run(main(pool)) == ['rows', 'rows']
+    assert runs == [1]
+    assert flights.stats()['coalesced'] == 1
+
+
+def test_reloaded_page_is_not_superseded(client):
+    assert client.get('/search?l=a&seq=7&page_id=first').status_code == 200
+    assert client.get('/search?l=ab&seq=6&page_id=first').status_code == 204
+    # the reloaded page, or a second tab, shares the client_id cookie but counts from 1
+    response = client.get('/search?l=b&seq=1&page_id=second')
+    assert response.status_code == 200
+    assert b'<tr' in response.data
+    assert client.get('/search?l=c&seq=2&page_id=first').status_code == 204
@@ -0,0 +1,38 @@
+"""Tests of the thumbnail crawler when the media host is unreachable."""
+from thumbindex import ThumbnailIndex, crawl
+import luxgen
+
+
+class Probe:
+    """Stands in for ThumbnailProbe; answers None, unknown, while the host is down."""
+
+    def __init__(self):
+        self.down = True
+        self.probed = []
+
+    def exists_many(self, obj_ids):
+        obj_ids = list(obj_ids)
+        self.probed.extend(obj_ids)
+        return {obj_id: None if self.down else obj_id % 2 == 0 for obj_id in obj_ids}
+
+    def clear(self):
+        pass
+
+
+def test_failed_probes_stay_unknown(tmp_path):
+    database = str(tmp_path / 'lux.sqlite')
+    path = str(tmp_path / 'lux.thumbs')
+    luxgen.generate(database, objects=20)
+    probe = Probe()
+
+    assert crawl(database, path, probe=probe) == (20, 0, 20)
+    index = ThumbnailIndex.load(path)
+    assert all(index.lookup(obj_id) is None for obj_id in range(1, 21))
+    assert index.block_time(1) == 0
+
+    probe.down = False
+    assert crawl(database, path, probe=probe) == (20, 10, 0)
+    index = ThumbnailIndex.load(path)
+    assert [index.lookup(obj_id) for obj_id in (1, 2)] == [False, True]
+    assert index.block_time(1) > 0
+    assert crawl(database, path, probe=probe) == (0, 0, 0)
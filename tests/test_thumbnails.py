@@ -0,0 +1,119 @@
+"""Tests of thumbnails.ThumbnailProbe against a local stand-in for the media host."""
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from thumbnails import ThumbnailProbe
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """Has thumbnails for even ids; ids from 100 on only answer GET, like hosts without HEAD."""
+
+    def _status(self):
+        obj_id = int(self.path.rsplit('/', 1)[1])
+        self.server.requests.append((self.command, obj_id))
+        if obj_id >= 100 and self.command == 'HEAD':
+            return 405
+        return 200 if obj_id % 2 == 0 else 404
+
+    def do_HEAD(self):
+        self.send_response(self._status())
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        status = self._status()
+        body = b'thumbnail' if status == 200 else b''
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def media_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def probe_for(server, **options):
+    return ThumbnailProbe(f'http://127.0.0.1:{server.server_port}/thumbnail/{{}}', **options)
+
+
+def test_head_answers_existence(media_server):
+    probe = probe_for(media_server)
+    assert probe.exists(2) is True
+    assert probe.exists(3) is False
+    assert media_server.requests == [('HEAD', 2), ('HEAD', 3)]
+    probe.close()
+
+
+def test_falls_back_to_get_without_head(media_server):
+    probe = probe_for(media_server)
+    assert probe.exists(100) is True
+    assert probe.exists(101) is False
+    assert media_server.requests == [('HEAD', 100), ('GET', 100), ('HEAD', 101), ('GET', 101)]
+    probe.close()
+
+
+def test_results_are_memoized_for_the_ttl(media_server):
+    probe = probe_for(media_server)
+    assert probe.exists(2) and probe.exists(2)
+    assert probe.cached(2) is True
+    assert len(media_server.requests) == 1
+    probe.close()
+
+    expired = probe_for(media_server, ttl=0)
+    assert expired.exists(4) and expired.exists(4)
+    assert expired.cached(4) is None
+    assert len(media_server.requests) == 3
+    expired.close()
+
+
+def test_network_errors_are_unknown_and_not_memoized(media_server):
+    port = media_server.server_port
+    media_server.shutdown()
+    media_server.server_close()
+    probe = ThumbnailProbe(f'http://127.0.0.1:{port}/thumbnail/{{}}', timeout=1)
+    assert probe.exists(2) is None
+    assert probe.cached(2) is None
+    assert probe.exists_many([2, 3]) == {2: None, 3: None}
+    assert probe.cached(3) is None
+    probe.close()
+
+
+def test_exists_many_probes_only_unknown_ids(media_server):
+    probe = probe_for(media_server, max_workers=4)
+    probe.exists(2)
+    results = probe.exists_many(range(2, 12))
+    assert results == {obj_id: obj_id % 2 == 0 for obj_id in range(2, 12)}
+    assert sorted(media_server.requests) == [('HEAD', obj_id) for obj_id in range(2, 12)]
+    probe.close()
+
+
+def test_async_probe_shares_the_fallback_and_memo(media_server):
+    luxasync = pytest.importorskip('luxasync')
+
+    async def check():
+        probe = luxasync.AsyncThumbnailProbe(
+            f'http://127.0.0.1:{media_server.server_port}/thumbnail/{{}}')
+        try:
+            assert await probe.exists(102) is True
+            assert await probe.exists(103) is False
+            assert await probe.exists(102) is True
+            assert probe.stats()['cached'] == 2
+        finally:
+            await probe.close()
+
+    asyncio.run(check())
+    assert media_server.requests == [('HEAD', 102), ('GET', 102), ('HEAD', 103), ('GET', 103)]
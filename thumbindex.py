@@ -0,0 +1,242 @@
+"""
+Offline index of which objects have a thumbnail on the media host.
+
+The index is a sidecar file next to lux.sqlite holding two bitmaps keyed by
+object id: one marking ids that have been crawled and one marking ids that
+have a thumbnail. Ids are grouped into blocks, and each block records when it
+was last crawled so a re-crawl can revisit only stale or unknown ids.
+
+File layout (little endian):
+    header      magic b'LUXT', version u16, reserved u16, block_size u32,
+                id_limit u32, crawled_at f64
+    block times u32 unix timestamp per block (0 = never crawled)
+    known       bitmap of id_limit bits
+    present     bitmap of id_limit bits
+"""
+import mmap
+import os
+import struct
+import sys
+import time
+from contextlib import closing
+from sqlite3 import connect
+
+from thumbnails import ThumbnailProbe
+
+THUMBNAIL_INDEX = 'lux.thumbs'
+BLOCK_SIZE = 1024
+CHECKPOINT_BATCHES = 10
+
+_MAGIC = b'LUXT'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHHIId')
+
+
+def _bitmap_bytes(id_limit):
+    return (id_limit + 7) // 8
+
+
+def _block_count(id_limit, block_size):
+    return (id_limit + block_size - 1) // block_size
+
+
+class ThumbnailIndex:
+    """Bitmaps recording which object ids were crawled and which have thumbnails."""
+
+    def __init__(self, buffer, block_size, id_limit, crawled_at):
+        self._buffer = buffer
+        self.block_size = block_size
+        self.id_limit = id_limit
+        self.crawled_at = crawled_at
+        blocks = _block_count(id_limit, block_size)
+        bitmap = _bitmap_bytes(id_limit)
+        view = memoryview(buffer)
+        self._times = view[_HEADER.size:_HEADER.size + 4 * blocks].cast('I')
+        self._known = view[_HEADER.size + 4 * blocks:_HEADER.size + 4 * blocks + bitmap]
+        self._present = view[_HEADER.size + 4 * blocks + bitmap:
+                             _HEADER.size + 4 * blocks + 2 * bitmap]
+
+    @classmethod
+    def empty(cls, id_limit, block_size=BLOCK_SIZE):
+        """Creates a writable index covering ids below id_limit with nothing crawled."""
+        size = (_HEADER.size + 4 * _block_count(id_limit, block_size)
+                + 2 * _bitmap_bytes(id_limit))
+        buffer = bytearray(size)
+        _HEADER.pack_into(buffer, 0, _MAGIC, _VERSION, 0, block_size, id_limit, 0.0)
+        return cls(buffer, block_size, id_limit, 0.0)
+
+    @classmethod
+    def _parse(cls, buffer):
+        if len(buffer) < _HEADER.size:
+            raise ValueError("Thumbnail index is truncated")
+        magic, version, _, block_size, id_limit, crawled_at = _HEADER.unpack_from(buffer, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a thumbnail index file")
+        size = (_HEADER.size + 4 * _block_count(id_limit, block_size)
+                + 2 * _bitmap_bytes(id_limit))
+        if len(buffer) < size:
+            raise ValueError("Thumbnail index is truncated")
+        return cls(buffer, block_size, id_limit, crawled_at)
+
+    @classmethod
+    def load(cls, path=THUMBNAIL_INDEX):
+        """Maps an index file read-only into memory.
+
+        Args:
+            path (str): The index file to load.
+
+        Returns:
+            ThumbnailIndex: A read-only index backed by the mapped file.
+        """
+        with open(path, 'rb') as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls._parse(buffer)
+
+    @classmethod
+    def load_writable(cls, path, id_limit, block_size=BLOCK_SIZE):
+        """Reads an index file into a writable copy covering at least id_limit ids.
+
+        A missing file yields an empty index.
+        """
+        try:
+            with open(path, 'rb') as file:
+                old = cls._parse(bytearray(file.read()))
+        except FileNotFoundError:
+            return cls.empty(id_limit, block_size)
+
+        if old.id_limit >= id_limit:
+            return old
+        index = cls.empty(id_limit, old.block_size)
+        index._times[:len(old._times)] = old._times
+        index._known[:len(old._known)] = old._known
+        index._present[:len(old._present)] = old._present
+        index.crawled_at = old.crawled_at
+        return index
+
+    def lookup(self, obj_id):
+        """Returns True/False for a crawled id, or None if the id was never crawled."""
+        if not 0 <= obj_id < self.id_limit:
+            return None
+        byte, mask = obj_id >> 3, 1 << (obj_id & 7)
+        if not self._known[byte] & mask:
+            return None
+        return bool(self._present[byte] & mask)
+
+    def block_time(self, obj_id):
+        """Returns when the block holding obj_id was last crawled (0 if never)."""
+        return self._times[obj_id // self.block_size]
+
+    def record(self, obj_id, exists):
+        """Marks obj_id as crawled with the given thumbnail availability."""
+        byte, mask = obj_id >> 3, 1 << (obj_id & 7)
+        self._known[byte] |= mask
+        if exists:
+            self._present[byte] |= mask
+        else:
+            self._present[byte] &= ~mask & 0xff
+
+    def touch_block(self, block, timestamp):
+        """Records that every id in the given block was crawled at timestamp."""
+        self._times[block] = int(timestamp)
+
+    def save(self, path=THUMBNAIL_INDEX):
+        """Atomically writes the index to path."""
+        _HEADER.pack_into(self._buffer, 0, _MAGIC, _VERSION, 0,
+                          self.block_size, self.id_limit, self.crawled_at)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(self._buffer)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+
+
+def select_ids(index, object_ids, max_age=None, full=False, now=None):
+    """Picks the object ids a crawl should probe.
+
+    Args:
+        index (ThumbnailIndex): The current index.
+        object_ids (list[int]): Every object id in the database, ascending.
+        max_age (float, optional): Seconds after which a crawled block is stale.
+        full (bool): Probe every id regardless of what the index knows.
+        now (float, optional): The current time, defaults to time.time().
+
+    Returns:
+        tuple: (ids to probe, set of blocks that will be crawled completely)
+    """
+    now = time.time() if now is None else now
+    selected = []
+    whole_blocks = set()
+    for obj_id in object_ids:
+        block = obj_id // index.block_size
+        crawled = index.block_time(obj_id)
+        if full or not crawled or (max_age is not None and now - crawled > max_age):
+            whole_blocks.add(block)
+            selected.append(obj_id)
+        elif index.lookup(obj_id) is None:
+            selected.append(obj_id)
+    return selected, whole_blocks
+
+
+def crawl(database, path=THUMBNAIL_INDEX, concurrency=16, batch_size=1000,
+          max_age=None, full=False, probe=None):
+    """Crawls the media host and records which object ids have thumbnails.
+
+    Only ids that are unknown to the existing index, or that live in blocks
+    crawled longer than max_age seconds ago, are probed. Ids whose probe
+    fails stay unknown, and their blocks are not marked as crawled, so the
+    next crawl probes them again.
+
+    Args:
+        database (str): Path of the lux.sqlite database to read ids from.
+        path (str): The index file to update.
+        concurrency (int): Maximum number of probes in flight at once.
+        batch_size (int): Number of ids probed between progress updates.
+        max_age (float, optional): Seconds after which crawled blocks are re-crawled.
+        full (bool): Re-crawl every id.
+        probe (ThumbnailProbe, optional): The probe to use.
+
+    Returns:
+        tuple: (number of ids probed, number of those that have a thumbnail,
+            number of probes that failed)
+    """
+    with closing(connect(f'file:{database}?mode=ro', uri=True)) as conn:
+        object_ids = [row[0] for row in conn.execute('SELECT id FROM objects ORDER BY id')]
+
+    id_limit = object_ids[-1] + 1 if object_ids else 0
+    index = ThumbnailIndex.load_writable(path, id_limit)
+    started = time.time()
+    selected, whole_blocks = select_ids(index, object_ids, max_age, full, started)
+
+    probe = probe or ThumbnailProbe(max_workers=concurrency)
+    found = 0
+    failed_blocks = set()
+    failed = 0
+    for batch_no, start in enumerate(range(0, len(selected), batch_size), 1):
+        batch = selected[start:start + batch_size]
+        results = probe.exists_many(batch)
+        probe.clear()
+        for obj_id in batch:
+            if results[obj_id] is None:
+                failed_blocks.add(obj_id // index.block_size)
+                failed += 1
+                continue
+            index.record(obj_id, results[obj_id])
+            found += results[obj_id]
+
+        # a block is fresh once its last selected id has been probed without errors
+        last = batch[-1] // index.block_size
+        for block in [block for block in whole_blocks if block < last]:
+            if block not in failed_blocks:
+                index.touch_block(block, started)
+            whole_blocks.discard(block)
+
+        if batch_no % CHECKPOINT_BATCHES == 0:
+            index.save(path)
+        print(f"Probed {start + len(batch)}/{len(selected)} ids", file=sys.stderr)
+
+    for block in whole_blocks - failed_blocks:
+        index.touch_block(block, started)
+    index.crawled_at = started
+    index.save(path)
+    return len(selected), found, failed
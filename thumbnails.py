@@ -0,0 +1,252 @@
+"""
+Thumbnail availability probing for Yale University Art Gallery objects.
+
+Checks whether media.collections.yale.edu has a thumbnail for an object id.
+Probes share one pooled keep-alive session, run concurrently when several ids
+are checked at once, and are memoized per object id for THUMBNAIL_TTL seconds.
+A probe that fails because the media host cannot be reached answers None,
+unknown, and is not memoized, so the id is checked again on its next use.
+When an offline index built by `python lux.py crawl-thumbnails` is loaded,
+crawled ids are answered from it without any network I/O.
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import timing
+
+THUMBNAIL_URL = os.environ.get(
+    'LUX_THUMBNAIL_URL', 'https://media.collections.yale.edu/thumbnail/yuag/obj/{}')
+THUMBNAIL_TTL = 3600
+THUMBNAIL_TIMEOUT = 5
+MAX_WORKERS = 16
+MAX_CACHE_ENTRIES = 100000
+
+# statuses of media hosts that do not support HEAD, asked again with a streamed GET
+HEAD_UNSUPPORTED = (405, 501)
+
+
+def is_thumbnail(status_code):
+    """Returns whether the status of a HEAD or GET response means the thumbnail exists."""
+    return status_code == 200
+
+
+class ThumbnailCache:
+    """Thumbnail availability memoized per object id for ttl seconds.
+
+    Once max_entries are held, expired entries are dropped, and everything if
+    that is not enough.
+    """
+
+    def __init__(self, ttl=THUMBNAIL_TTL, max_entries=MAX_CACHE_ENTRIES):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, obj_id):
+        """Returns the memoized availability of obj_id, or None if unknown or expired."""
+        with self._lock:
+            entry = self._entries.get(obj_id)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def put(self, obj_id, exists):
+        """Memoizes whether obj_id has a thumbnail."""
+        with self._lock:
+            if len(self._entries) >= self._max_entries:
+                now = time.monotonic()
+                self._entries = {key: entry for key, entry in self._entries.items()
+                                 if entry[1] >= now}
+                if len(self._entries) >= self._max_entries:
+                    self._entries.clear()
+            self._entries[obj_id] = (exists, time.monotonic() + self._ttl)
+
+    def clear(self):
+        """Forgets every memoized result."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ThumbnailProbe:
+    """Concurrent, cached checker for thumbnail availability."""
+
+    def __init__(self, url_template=THUMBNAIL_URL, ttl=THUMBNAIL_TTL,
+                 timeout=THUMBNAIL_TIMEOUT, max_workers=MAX_WORKERS,
+                 max_entries=MAX_CACHE_ENTRIES):
+        self._url_template = url_template
+        self._timeout = timeout
+        self._max_workers = max_workers
+        self._cache = ThumbnailCache(ttl, max_entries)
+        self._lock = threading.Lock()
+        self._executor = None
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def url_for(self, obj_id):
+        """Returns the thumbnail URL of the given object id."""
+        return self._url_template.format(obj_id)
+
+    def cached(self, obj_id):
+        """Returns the memoized availability of obj_id, or None if unknown or expired."""
+        return self._cache.get(obj_id)
+
+    def _fetch(self, obj_id):
+        """Asks the media host whether obj_id has a thumbnail.
+
+        Uses HEAD and falls back to a streamed GET (body not downloaded) when
+        the server does not support HEAD.
+
+        Returns:
+            bool: Whether the thumbnail exists, or None if the media host could not be reached.
+        """
+        url = self.url_for(obj_id)
+        try:
+            response = self._session.head(url, allow_redirects=True, timeout=self._timeout)
+            if response.status_code in HEAD_UNSUPPORTED:
+                with self._session.get(url, allow_redirects=True, stream=True,
+                                       timeout=self._timeout) as response:
+                    return is_thumbnail(response.status_code)
+            return is_thumbnail(response.status_code)
+        except requests.RequestException as error:
+            print(f"Thumbnail probe failed for {obj_id}: {error}", file=sys.stderr)
+            return None
+
+    def exists(self, obj_id):
+        """Returns True if obj_id has a thumbnail, probing only on a cache miss.
+
+        Returns None if the media host could not be reached.
+        """
+        exists = self.cached(obj_id)
+        if exists is None:
+            exists = self._fetch(obj_id)
+            if exists is not None:
+                self._cache.put(obj_id, exists)
+        return exists
+
+    def exists_many(self, obj_ids):
+        """Checks several object ids concurrently.
+
+        Args:
+            obj_ids (iterable): The object ids to check.
+
+        Returns:
+            dict: Maps each object id to True if it has a thumbnail, False if it has
+                none and None if the media host could not be reached.
+        """
+        results = {}
+        missing = []
+        for obj_id in obj_ids:
+            exists = self.cached(obj_id)
+            if exists is None:
+                missing.append(obj_id)
+            else:
+                results[obj_id] = exists
+
+        if missing:
+            for obj_id, exists in zip(missing, self._pool().map(self._fetch, missing)):
+                if exists is not None:
+                    self._cache.put(obj_id, exists)
+                results[obj_id] = exists
+        return results
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                    thread_name_prefix='thumbnail-probe')
+            return self._executor
+
+    def clear(self):
+        """Forgets every memoized result."""
+        self._cache.clear()
+
+    def close(self):
+        """Shuts down the worker pool and the HTTP session."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self._session.close()
+
+
+_probe = None
+_probe_lock = threading.Lock()
+_index = None
+
+
+def get_probe():
+    """Returns the process-wide ThumbnailProbe, creating it on first use."""
+    global _probe
+    with _probe_lock:
+        if _probe is None:
+            _probe = ThumbnailProbe()
+        return _probe
+
+
+def set_probe(probe):
+    """Replaces the process-wide ThumbnailProbe, e.g. one pointed at a local server."""
+    global _probe
+    with _probe_lock:
+        _probe = probe
+
+
+def load_index(path):
+    """Maps the offline thumbnail index at path, if the file exists.
+
+    Args:
+        path (str): The index file written by the thumbnail crawler.
+
+    Returns:
+        bool: True if the index was loaded.
+    """
+    global _index
+    # imported here because thumbindex builds on ThumbnailProbe
+    from thumbindex import ThumbnailIndex
+    try:
+        _index = ThumbnailIndex.load(path)
+    except FileNotFoundError:
+        return False
+    except ValueError as error:
+        print(f"Ignoring thumbnail index {path}: {error}", file=sys.stderr)
+        return False
+    return True
+
+
+def indexed(obj_id):
+    """Returns whether the offline index records a thumbnail for obj_id, or None if it
+    does not know the id or no index is loaded."""
+    if _index is None:
+        return None
+    return _index.lookup(int(obj_id))
+
+
+def has_thumbnail(obj_id):
+    """Returns True if the object with obj_id has a thumbnail.
+
+    Ids recorded in the offline index are answered with a bit test; anything
+    else falls back to probing the media host. Returns None if the media host
+    could not be reached.
+    """
+    exists = indexed(obj_id)
+    if exists is not None:
+        return exists
+    with timing.phase('thumbnails'):
+        return get_probe().exists(obj_id)
+
+
+def thumbnail_url(obj_id):
+    """Returns the thumbnail URL of the object with obj_id."""
+    return get_probe().url_for(obj_id)
@@ -0,0 +1,191 @@
+"""
+Per-request timing of the phases a page spends its time in.
+
+Code that runs while a request is handled marks its phases:
+
+    with timing.phase('sql'):
+        cursor.execute(...)
+
+Phases are timed exclusively: while a nested phase runs, e.g. a thumbnail
+probe made while a template renders, the time counts towards the inner phase
+only, so the phases of a request add up to at most its total time. The
+recorder is thread-local, like the pooled connection a request leases, and
+only exists between start() and finish(); outside of it, or when timing is
+disabled, phase() returns a shared no-op context manager.
+
+luxapp sends each request's phases in a Server-Timing header and adds them to
+the histograms of the process-wide `metrics`, exported by /metrics in the
+Prometheus text format.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+# upper bounds in seconds of the histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+_idle = nullcontext()
+
+
+class Recorder:
+    """Accumulates the exclusive time of each phase of one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self._stack = []
+        self._since = None
+
+    def _charge(self, now):
+        """Adds the time since the last switch to the phase that was running."""
+        if self._stack:
+            name = self._stack[-1]
+            self.phases[name] = self.phases.get(name, 0.0) + now - self._since
+        self._since = now
+
+    def enter(self, name):
+        """Pauses the running phase and starts the named one."""
+        self._charge(time.perf_counter())
+        self._stack.append(name)
+
+    def exit(self):
+        """Ends the innermost phase and resumes the one it interrupted."""
+        self._charge(time.perf_counter())
+        self._stack.pop()
+
+    def elapsed(self):
+        """Returns the seconds since the request started."""
+        return time.perf_counter() - self.started
+
+
+class _Phase:
+    """Context manager charging the time of its block to a phase."""
+
+    __slots__ = ('recorder', 'name')
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.recorder.enter(self.name)
+
+    def __exit__(self, *exc_info):
+        self.recorder.exit()
+
+
+def start():
+    """Starts recording the phases of the current thread's request."""
+    _local.recorder = Recorder()
+    return _local.recorder
+
+
+def current():
+    """Returns the recorder of the current thread's request, or None."""
+    return getattr(_local, 'recorder', None)
+
+
+def finish():
+    """Stops recording and returns the recorder, or None if none was started."""
+    recorder = current()
+    _local.recorder = None
+    return recorder
+
+
+def phase(name):
+    """Returns a context manager timing its block as the named phase."""
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        return _idle
+    return _Phase(recorder, name)
+
+
+def timed(name, iterable):
+    """Iterates over iterable, timing the production of each item as the named phase.
+
+    Used for streamed responses, whose body is produced after the view returned.
+    """
+    iterator = iter(iterable)
+    while True:
+        with phase(name):
+            item = next(iterator, _idle)
+        if item is _idle:
+            return
+        yield item
+
+
+def server_timing(recorder):
+    """Formats the phases and total time of a request as a Server-Timing header value."""
+    entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in recorder.phases.items()]
+    entries.append(f"total;dur={recorder.elapsed() * 1000:.3f}")
+    return ', '.join(entries)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed durations."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        """Counts one duration in the first bucket whose bound is not below it."""
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+
+class Metrics:
+    """Request counters and latency histograms of the whole process."""
+
+    def __init__(self):
+        self._requests = {}     # (endpoint, status) -> count
+        self._durations = {}    # endpoint -> Histogram
+        self._phases = {}       # (endpoint, phase) -> Histogram
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, status, recorder):
+        """Adds a finished request and the time of each of its phases."""
+        total = recorder.elapsed()
+        with self._lock:
+            key = (endpoint, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._durations.setdefault(endpoint, Histogram()).observe(total)
+            for name, seconds in recorder.phases.items():
+                self._phases.setdefault((endpoint, name), Histogram()).observe(seconds)
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = ['# HELP lux_requests_total Requests handled, by endpoint and status.',
+                 '# TYPE lux_requests_total counter']
+        with self._lock:
+            for (endpoint, status), count in sorted(self._requests.items()):
+                lines.append(f'lux_requests_total{{endpoint="{endpoint}",status="{status}"}}'
+                             f' {count}')
+            lines += ['# HELP lux_request_duration_seconds Time to handle a request.',
+                      '# TYPE lux_request_duration_seconds histogram']
+            for endpoint, histogram in sorted(self._durations.items()):
+                lines += _histogram_lines('lux_request_duration_seconds',
+                                          f'endpoint="{endpoint}"', histogram)
+            lines += ['# HELP lux_phase_duration_seconds Time a request spent in each phase.',
+                      '# TYPE lux_phase_duration_seconds histogram']
+            for (endpoint, name), histogram in sorted(self._phases.items()):
+                lines += _histogram_lines('lux_phase_duration_seconds',
+                                          f'endpoint="{endpoint}",phase="{name}"', histogram)
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(metric, labels, histogram):
+    """Formats one labelled histogram as bucket, sum and count samples."""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(BUCKETS + ('+Inf',), histogram.counts):
+        cumulative += count
+        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{metric}_sum{{{labels}}} {histogram.sum:.6f}')
+    lines.append(f'{metric}_count{{{labels}}} {cumulative}')
+    return lines
+
+
+metrics = Metrics()
@@ -0,0 +1,76 @@
+"""
+In-memory trigram index for case-insensitive substring lookups over names.
+
+Used by ps1lux to resolve the agent and classifier filters to id sets once
+per distinct name, instead of running LIKE once per joined row.
+
+Case is folded with fold_case(), which like SQLite's LIKE and LOWER() only
+folds ASCII letters, so a term matches the same names whichever path answers
+the search.
+"""
+import string
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def fold_case(text):
+    """Lower-cases the ASCII letters of text and leaves every other character as it is."""
+    return text.translate(_ASCII_LOWER)
+
+
+def trigrams(text):
+    """Returns the set of three-character substrings of text."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """Maps substrings of names to the ids of the rows holding those names."""
+
+    def __init__(self, rows):
+        """Builds the index.
+
+        Args:
+            rows (iterable): (id, name) pairs; rows with a NULL name are skipped.
+        """
+        names = {}
+        for row_id, name in rows:
+            if name is not None:
+                names.setdefault(fold_case(name), []).append(row_id)
+        self._names = list(names)
+        self._ids = [tuple(ids) for ids in names.values()]
+
+        postings = {}
+        for position, name in enumerate(self._names):
+            for gram in trigrams(name):
+                postings.setdefault(gram, []).append(position)
+        self._postings = {gram: frozenset(positions) for gram, positions in postings.items()}
+
+    def __len__(self):
+        return len(self._names)
+
+    def _positions(self, term):
+        if len(term) < 3:
+            return range(len(self._names))
+        grams = sorted(trigrams(term), key=lambda gram: len(self._postings.get(gram, ())))
+        positions = self._postings.get(grams[0], frozenset())
+        for gram in grams[1:]:
+            if not positions:
+                break
+            positions = positions & self._postings.get(gram, frozenset())
+        return positions
+
+    def lookup(self, term):
+        """Returns the ids of every row whose name contains term, ignoring ASCII case.
+
+        Args:
+            term (str): The substring to look for.
+
+        Returns:
+            set: The matching ids.
+        """
+        term = fold_case(term)
+        matches = set()
+        for position in self._positions(term):
+            if term in self._names[position]:
+                matches.update(self._ids[position])
+        return matches